@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
+from inventario.busqueda import buscar_materiales
 from inventario.models import Material
 from pedidos.models import Pedido
 from .serializers import MaterialSerializer, PedidoSerializer, UserSerializer
@@ -9,6 +10,13 @@ class MaterialViewSet(viewsets.ModelViewSet):
     serializer_class = MaterialSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # ?search= busca en el índice de texto completo, ordenado por relevancia
+        materiales = super().get_queryset()
+        if texto := self.request.query_params.get('search'):
+            materiales = buscar_materiales(materiales, texto).order_by('relevancia', 'nombre')
+        return materiales
+
 class PedidoViewSet(viewsets.ModelViewSet):
     queryset = Pedido.objects.all()
     serializer_class = PedidoSerializer
@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from autenticacion.views import administrar_usuarios
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from pedidos.models import Pedido, PedidoDetalle
+
+
+class Command(BaseCommand):
+    help = ('Crea gestores y pedidos de prueba y mide la página de administración de usuarios '
+            '(los datos se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=500,
+                            help='Número de gestores a generar')
+        parser.add_argument('--pedidos', type=int, default=100000,
+                            help='Número de pedidos a repartir entre los gestores')
+        parser.add_argument('--repeticiones', type=int, default=3,
+                            help='Veces que se pide la página')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            admin = User.objects.create_superuser(username='__medir_admin__', password=None)
+            gestores = User.objects.bulk_create(
+                User(username=f'__medir_gestor_{i}__') for i in range(options['usuarios'])
+            )
+            clientes = Cliente.objects.bulk_create(
+                Cliente(user=gestor, nombre='Medición', apellidos=str(i),
+                        carnet_identidad=f'M{i:010d}', telefono='0')
+                for i, gestor in enumerate(gestores)
+            )
+            material = Material.objects.create(
+                nombre='Medición', codigo='__medir__', precio=10, comision=1, cantidad=0,
+                categoria=Categoria.objects.create(nombre='__medir__')
+            )
+
+            pedidos = []
+            for _ in range(options['pedidos']):
+                i = random.randrange(len(gestores))
+                pedidos.append(Pedido(user=gestores[i], cliente=clientes[i], total=10,
+                                      estado=random.choice(['efectuado', 'pendiente', 'cancelado'])))
+            pedidos = Pedido.objects.bulk_create(pedidos, batch_size=5000)
+            PedidoDetalle.objects.bulk_create(
+                (PedidoDetalle(user_id=p.user_id, pedido=p, material=material, cantidad=1,
+                               comision_unitaria=1, total=10) for p in pedidos),
+                batch_size=5000
+            )
+            self.stdout.write(f'{len(gestores)} gestores y {len(pedidos)} pedidos creados')
+
+            request = RequestFactory().get('/autenticacion/administrar-usuarios/')
+            request.user = admin
+            request.session = {}
+            tiempos = []
+            for _ in range(options['repeticiones']):
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    administrar_usuarios(request)
+                    tiempos.append(time.perf_counter() - inicio)
+            self.stdout.write(
+                f'administrar_usuarios: {min(tiempos) * 1000:.1f} ms '
+                f'(mínimo de {options["repeticiones"]}), {len(consultas.captured_queries)} consultas'
+            )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,57 @@
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MedicionMiddleware:
+    """
+    Marca de tiempo que settings intercala entre cada middleware cuando
+    MEDIR_MIDDLEWARE está activo. Cada marca mide el tiempo total de lo que
+    envuelve; la más externa calcula el tiempo propio de cada middleware, lo
+    registra en el log y lo añade a la cabecera Server-Timing.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # convert_exception_to_response envuelve cada middleware con functools.wraps
+        # y la marca más interna envuelve el método del handler que llama a la vista
+        envuelto = getattr(get_response, '__wrapped__', get_response)
+        if inspect.ismethod(envuelto):
+            self.nombre = 'vista'
+        else:
+            self.nombre = getattr(envuelto, '__qualname__', type(envuelto).__name__)
+
+    def __call__(self, request):
+        externa = not hasattr(request, '_tiempos_middleware')
+        if externa:
+            request._tiempos_middleware = []
+        medida = [self.nombre, 0.0]
+        request._tiempos_middleware.append(medida)
+
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        medida[1] = time.perf_counter() - inicio
+
+        if externa:
+            self.informar(request, response)
+        return response
+
+    def informar(self, request, response):
+        medidas = request._tiempos_middleware
+        propios = []
+        for i, (nombre, total) in enumerate(medidas):
+            interior = medidas[i + 1][1] if i + 1 < len(medidas) else 0.0
+            propios.append((nombre, total - interior))
+
+        vista = dict(propios).get('vista', 0.0)
+        overhead = medidas[0][1] - vista
+        logger.info(
+            'middleware %s %s: %.2f ms (%s)',
+            request.method, request.path, overhead * 1000,
+            ', '.join(f'{nombre}={segundos * 1000:.2f}' for nombre, segundos in propios if nombre != 'vista')
+        )
+        response['Server-Timing'] = ', '.join(
+            [f'middleware;dur={overhead * 1000:.2f}']
+            + [f'mw{i};desc="{nombre}";dur={segundos * 1000:.2f}' for i, (nombre, segundos) in enumerate(propios)]
+        )
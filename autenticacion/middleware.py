@@ -1,8 +1,8 @@
 from django.contrib.auth import logout
 from django.contrib import messages
 from django.shortcuts import redirect
-from django.urls import resolve
-from .models import SesionUsuario
+from .permisos import construir_registro, tiene_permiso
+from .sesiones import SIN_SESION, sesion_activa
 from django.contrib.auth.models import User
 
 class SingleSessionMiddleware:
@@ -11,43 +11,34 @@ class SingleSessionMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            try:
-                session = SesionUsuario.objects.get(usuario=request.user)
-                if session.session_key != request.session.session_key:
-                    logout(request)
-                    messages.warning(request, 
-                        "Tu sesión se ha iniciado en otro dispositivo")
-                    return redirect('Logear')
-            except SesionUsuario.DoesNotExist:
-                pass
+            # La sesión registrada se lee de caché; solo va a la BD si no está cacheada
+            session_key = sesion_activa(request.user.pk)
+            if session_key != SIN_SESION and session_key != request.session.session_key:
+                logout(request)
+                messages.warning(request, 
+                    "Tu sesión se ha iniciado en otro dispositivo")
+                return redirect('Logear')
 
         response = self.get_response(request)
         return response
 
 class PermissionsMiddleware:
+    """
+    Comprueba los permisos de las vistas marcadas con admin_required o
+    superuser_required. El registro se construye una vez al cargar el
+    middleware y se consulta con el view_name que Django ya resolvió.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
-        # Rutas que requieren permisos de administrador
-        self.admin_routes = [
-            'administrar_usuarios',
-            'crear_usuario',
-            'editar_usuario',
-            'eliminar_usuario',
-            'toggle_estado_usuario',
-            'editar_inventario',
-            'crear_material',
-            'editar_material',
-            'eliminar_material'
-        ]
+        self.permisos = construir_registro()
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            current_url_name = resolve(request.path_info).url_name
-            
-            if current_url_name in self.admin_routes and not request.user.is_staff:
-                messages.error(request, 
-                    "No tienes permisos para acceder a esta sección")
-                return redirect('home')
+        return self.get_response(request)
 
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        nivel = self.permisos.get(request.resolver_match.view_name)
+        if nivel and request.user.is_authenticated and not tiene_permiso(request.user, nivel):
+            messages.error(request, 
+                "No tienes permisos para acceder a esta sección")
+            return redirect('home')
+        return None
@@ -0,0 +1,57 @@
+from django.contrib.auth.decorators import user_passes_test
+from django.urls import URLResolver, get_resolver
+
+# Niveles de permiso de las vistas, de menor a mayor
+NIVELES = {
+    'staff': 1,
+    'superuser': 2,
+}
+
+
+def _marcar(vista, nivel):
+    """Anota en la vista el nivel requerido, sin rebajar uno más estricto ya marcado"""
+    actual = getattr(vista, 'permiso_requerido', None)
+    if actual is None or NIVELES[nivel] > NIVELES[actual]:
+        vista.permiso_requerido = nivel
+    return vista
+
+
+def tiene_permiso(user, nivel):
+    if nivel == 'superuser':
+        return user.is_superuser
+    return user.is_staff
+
+
+def admin_required(view_func):
+    """Restringe la vista a usuarios staff y la registra para PermissionsMiddleware"""
+    vista = user_passes_test(lambda u: u.is_authenticated and u.is_staff)(view_func)
+    return _marcar(vista, 'staff')
+
+
+def superuser_required(view_func):
+    """Restringe la vista a superusuarios y la registra para PermissionsMiddleware"""
+    vista = user_passes_test(lambda u: u.is_superuser)(view_func)
+    return _marcar(vista, 'superuser')
+
+
+def _recorrer_patrones(patrones, namespace=''):
+    for patron in patrones:
+        if isinstance(patron, URLResolver):
+            prefijo = f'{namespace}{patron.namespace}:' if patron.namespace else namespace
+            yield from _recorrer_patrones(patron.url_patterns, prefijo)
+        elif patron.name:
+            yield f'{namespace}{patron.name}', patron.callback
+
+
+def construir_registro(urlconf=None):
+    """
+    Recorre las URLs una sola vez y devuelve {view_name: nivel} para las vistas
+    marcadas con admin_required / superuser_required. Si un mismo nombre se usa
+    en varias rutas se aplica el nivel más estricto.
+    """
+    registro = {}
+    for nombre, vista in _recorrer_patrones(get_resolver(urlconf).url_patterns):
+        nivel = getattr(vista, 'permiso_requerido', None)
+        if nivel and (nombre not in registro or NIVELES[nivel] > NIVELES[registro[nombre]]):
+            registro[nombre] = nivel
+    return registro
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SesionUsuario
+
+# Marca para usuarios sin SesionUsuario (también se cachea la ausencia)
+SIN_SESION = ''
+
+# Caché local del proceso: usuario_id -> (session_key, expira)
+_sesiones_locales = OrderedDict()
+_lock = threading.Lock()
+
+
+def _clave_cache(usuario_id):
+    return f'autenticacion:sesion_activa:{usuario_id}'
+
+
+def _tamano_local():
+    return getattr(settings, 'SESION_ACTIVA_CACHE_LOCAL_TAMANO', 1024)
+
+
+def _guardar_local(usuario_id, session_key):
+    # La copia local dura poco: otro proceso puede haber registrado un nuevo login
+    expira = time.monotonic() + getattr(settings, 'SESION_ACTIVA_CACHE_LOCAL_SEGUNDOS', 5)
+    with _lock:
+        _sesiones_locales[usuario_id] = (session_key, expira)
+        _sesiones_locales.move_to_end(usuario_id)
+        while len(_sesiones_locales) > _tamano_local():
+            _sesiones_locales.popitem(last=False)
+
+
+def _leer_local(usuario_id):
+    with _lock:
+        entrada = _sesiones_locales.get(usuario_id)
+        if entrada is None:
+            return None
+        if entrada[1] < time.monotonic():
+            del _sesiones_locales[usuario_id]
+            return None
+        _sesiones_locales.move_to_end(usuario_id)
+        return entrada[0]
+
+
+def sesion_activa(usuario_id):
+    """
+    session_key registrada para el usuario, consultando primero la caché del
+    proceso, después la caché de Django y por último la base de datos.
+    Returns:
+        session_key o SIN_SESION si el usuario no tiene sesión registrada
+    """
+    session_key = _leer_local(usuario_id)
+    if session_key is not None:
+        return session_key
+
+    session_key = cache.get(_clave_cache(usuario_id))
+    if session_key is None:
+        session_key = (SesionUsuario.objects.filter(usuario_id=usuario_id)
+                       .values_list('session_key', flat=True).first()) or SIN_SESION
+        # add() no pisa un valor escrito entretanto por un login más reciente
+        cache.add(_clave_cache(usuario_id), session_key,
+                  getattr(settings, 'SESION_ACTIVA_CACHE_SEGUNDOS', 60 * 60))
+        session_key = cache.get(_clave_cache(usuario_id), session_key)
+
+    _guardar_local(usuario_id, session_key)
+    return session_key
+
+
+def registrar_sesion_activa(usuario_id, session_key):
+    """Actualiza las cachés tras guardar la SesionUsuario de un nuevo login"""
+    session_key = session_key or SIN_SESION
+    cache.set(_clave_cache(usuario_id), session_key,
+              getattr(settings, 'SESION_ACTIVA_CACHE_SEGUNDOS', 60 * 60))
+    _guardar_local(usuario_id, session_key)
+
+
+def invalidar_sesion_activa(usuario_id):
+    """Elimina la sesión cacheada del usuario (por ejemplo al cerrar sesión)"""
+    cache.delete(_clave_cache(usuario_id))
+    with _lock:
+        _sesiones_locales.pop(usuario_id, None)
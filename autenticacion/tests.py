@@ -1,3 +1,147 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from pedidos.models import Pedido, PedidoDetalle
+from . import sesiones
+from .permisos import construir_registro
+
+
+class AdministrarUsuariosTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='clave')
+        self.material = Material.objects.create(
+            nombre='A', codigo='A', categoria=Categoria.objects.create(nombre='General'),
+            precio=10, comision=2, cantidad=100
+        )
+        self.client.force_login(self.admin)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+
+    def crear_gestores(self, desde, hasta):
+        for i in range(desde, hasta):
+            gestor = User.objects.create_user(username=f'gestor{i:03d}')
+            cliente = Cliente.objects.create(
+                user=gestor, nombre='Cliente', apellidos=str(i),
+                carnet_identidad=f'{i:011d}', telefono='5555'
+            )
+            for estado in ('efectuado', 'efectuado', 'pendiente'):
+                pedido = Pedido.objects.create(user=gestor, cliente=cliente, estado=estado, total=30)
+                PedidoDetalle.objects.create(
+                    user=gestor, pedido=pedido, material=self.material,
+                    cantidad=3, comision_unitaria=2, total=30
+                )
+
+    def test_estadisticas_por_usuario(self):
+        self.crear_gestores(0, 1)
+
+        respuesta = self.client.get(reverse('administrar_usuarios'))
+        gestor = next(u for u in respuesta.context['usuarios'] if u.username == 'gestor000')
+
+        self.assertEqual(gestor.pedidos_count, 3)
+        self.assertEqual(gestor.ventas_mes, 60)
+        self.assertEqual(gestor.comision_total, 12)
+        self.assertEqual(respuesta.context['total_pedidos'], 2)
+
+    def test_consultas_no_dependen_del_numero_de_usuarios(self):
+        self.crear_gestores(0, 2)
+        with CaptureQueriesContext(connection) as pocos:
+            self.client.get(reverse('administrar_usuarios'))
+
+        self.crear_gestores(2, 20)
+        with CaptureQueriesContext(connection) as muchos:
+            self.client.get(reverse('administrar_usuarios'))
+
+        self.assertEqual(len(pocos.captured_queries), len(muchos.captured_queries))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SesionUnicaTests(TestCase):
+    def setUp(self):
+        for limpiar in (cache.clear, sesiones._sesiones_locales.clear):
+            limpiar()
+            self.addCleanup(limpiar)
+        self.user = User.objects.create_user(username='gestor', password='clave')
+
+    def logear(self, cliente):
+        cliente.post(reverse('Logear'), {'username': 'gestor', 'password': 'clave'})
+
+    def consultas_sesion(self, cliente):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = cliente.get(reverse('home'))
+        self.assertEqual(respuesta.status_code, 200)
+        return [q for q in contexto.captured_queries if 'sesionusuario' in q['sql']]
+
+    def test_peticiones_sucesivas_no_consultan_la_sesion(self):
+        self.logear(self.client)
+
+        self.assertEqual(self.consultas_sesion(self.client), [])
+        sesiones._sesiones_locales.clear()
+        self.assertEqual(self.consultas_sesion(self.client), [])
+
+    def test_login_en_otro_dispositivo_cierra_la_sesion_anterior(self):
+        self.logear(self.client)
+        self.consultas_sesion(self.client)
+
+        self.logear(Client())
+        sesiones._sesiones_locales.clear()  # como si el login se hubiera hecho en otro proceso
+        respuesta = self.client.get(reverse('home'))
+
+        self.assertRedirects(respuesta, reverse('Logear'), fetch_redirect_response=False)
+
+    def test_cerrar_sesion_invalida_la_cache(self):
+        self.logear(self.client)
+        self.client.get(reverse('cerrar_sesion'))
+
+        self.assertIsNone(cache.get(sesiones._clave_cache(self.user.pk)))
+        self.assertNotIn(self.user.pk, sesiones._sesiones_locales)
+
+
+class PermisosTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor')
+        self.client.force_login(self.user)
+
+    def test_registro_desde_las_urls(self):
+        registro = construir_registro()
+
+        self.assertEqual(registro['editar_inventario'], 'staff')
+        self.assertEqual(registro['pedidos:efectuar_pedido'], 'staff')
+        self.assertEqual(registro['pedidos:configurar_eliminacion'], 'superuser')
+        self.assertEqual(registro['administrar_usuarios'], 'superuser')
+        self.assertNotIn('inventario', registro)
+
+    def test_usuario_sin_permiso_vuelve_al_inicio(self):
+        respuesta = self.client.get(reverse('editar_inventario'))
+
+        self.assertRedirects(respuesta, reverse('home'), fetch_redirect_response=False)
+
+    def test_staff_no_accede_a_vistas_de_superusuario(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+
+        self.assertEqual(self.client.get(reverse('editar_inventario')).status_code, 200)
+        respuesta = self.client.get(reverse('pedidos:configurar_eliminacion'))
+        self.assertRedirects(respuesta, reverse('home'), fetch_redirect_response=False)
+
+
+MIDDLEWARE_MEDIDO = [
+    entrada
+    for middleware in settings.MIDDLEWARE
+    for entrada in ('autenticacion.medicion.MedicionMiddleware', middleware)
+] + ['autenticacion.medicion.MedicionMiddleware']
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_MEDIDO)
+class MedicionMiddlewareTests(TestCase):
+    def test_server_timing_por_middleware(self):
+        respuesta = self.client.get(reverse('Logear'))
+
+        cabecera = respuesta['Server-Timing']
+        self.assertTrue(cabecera.startswith('middleware;dur='))
+        for nombre in ('SessionMiddleware', 'SingleSessionMiddleware', 'PermissionsMiddleware', 'vista'):
+            self.assertIn(f'desc="{nombre}"', cabecera)
@@ -1,10 +1,8 @@
 from django.urls import path
 
 from .views import Vregistro, cerrar_sesion, logear, administrar_usuarios, crear_usuario, editar_usuario, eliminar_usuario, historial_usuario, toggle_estado_usuario, obtener_usuario
-from django.contrib.auth.decorators import user_passes_test, login_required
-
-def admin_required(view_func):
-    return user_passes_test(lambda u: u.is_authenticated and u.is_staff)(view_func)
+from django.contrib.auth.decorators import login_required
+from .permisos import admin_required
 
 urlpatterns = [
     path('', Vregistro.as_view(), name='Autenticacion'),
@@ -4,13 +4,16 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
-from django.contrib.auth.decorators import user_passes_test, login_required
-from django.db.models import Count, Sum, Q, F, Case, When, DecimalField as DjangoDecimalField
+from django.contrib.auth.decorators import login_required
+from .permisos import superuser_required
+from django.db.models import Count, Sum, Q, F, OuterRef, Subquery, FloatField, DecimalField as DjangoDecimalField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from pedidos.models import Pedido
+from pedidos.models import Pedido, PedidoDetalle, expresion_comision
 from .models import SesionUsuario
+from .sesiones import invalidar_sesion_activa, registrar_sesion_activa
 
 # Create your views here.
 
@@ -38,6 +41,7 @@ def cerrar_sesion(request):
             sesion.delete()
         except SesionUsuario.DoesNotExist:
             pass
+        invalidar_sesion_activa(request.user.pk)
     logout(request)
     return redirect('home')
 
@@ -71,6 +75,7 @@ def logear(request):
                         'ip_address': request.META.get('REMOTE_ADDR')
                     }
                 )
+                registrar_sesion_activa(usuario.pk, request.session.session_key)
                 
                 return redirect('home')
 
@@ -80,10 +85,17 @@ def logear(request):
     form = AuthenticationForm()
     return render(request, "login/login.html", {"form": form})
 
-def is_superuser(user):
-    return user.is_superuser
+def _total_por_usuario(queryset, campo_usuario, agregado):
+    """Subconsulta con el agregado de queryset agrupado por el usuario de la fila exterior"""
+    return Subquery(
+        queryset.filter(**{campo_usuario: OuterRef('pk')})
+        .order_by()
+        .values(campo_usuario)
+        .annotate(total=agregado)
+        .values('total')
+    )
 
-@user_passes_test(is_superuser)
+@superuser_required
 def administrar_usuarios(request):
     try:
         # Obtener fechas del filtro
@@ -103,34 +115,32 @@ def administrar_usuarios(request):
             )
 
         # Crear el filtro base para pedidos efectuados
-        pedidos_query = Pedido.objects.filter(estado='efectuado')
+        filtro_pedidos = {'estado': 'efectuado'}
         
         # Aplicar filtro de fechas a los pedidos si se especifican
         if fecha_desde and fecha_hasta:
-            pedidos_query = pedidos_query.filter(
-                created_at__date__range=[fecha_desde, fecha_hasta]
-            )
+            filtro_pedidos['created_at__date__range'] = [fecha_desde, fecha_hasta]
 
-        # Obtener usuarios con sus estadísticas
-        usuarios = usuarios.annotate(
-            pedidos_count=Count('pedido', distinct=True),
-            ventas_mes=Sum(
-                Case(
-                    When(pedido__in=pedidos_query, then=F('pedido__total')),
-                    default=0,
-                    output_field=DjangoDecimalField(max_digits=10, decimal_places=2)
-                )
-            )
+        pedidos_query = Pedido.objects.filter(**filtro_pedidos)
+        # El mismo filtro a través del join para no usar IN (subconsulta) por cada usuario
+        detalles_query = PedidoDetalle.objects.filter(
+            **{f'pedido__{campo}': valor for campo, valor in filtro_pedidos.items()}
         )
 
-        # Calcular comisiones
-        for usuario in usuarios:
-            comision_total = (pedidos_query.filter(user=usuario)
-                .annotate(
-                    comision_pedido=Sum(F('pedidodetalle__cantidad') * F('pedidodetalle__material__comision'))
-                )
-                .aggregate(total=Sum('comision_pedido'))['total'] or 0)
-            usuario.comision_total = comision_total
+        # Estadísticas por usuario como subconsultas agrupadas, de modo que la
+        # lista completa sale de una sola consulta sin importar cuántos usuarios haya
+        usuarios = usuarios.annotate(
+            pedidos_count=Coalesce(_total_por_usuario(Pedido.objects.all(), 'user', Count('id')), 0),
+            ventas_mes=Coalesce(
+                _total_por_usuario(pedidos_query, 'user', Sum('total')),
+                0, output_field=DjangoDecimalField(max_digits=10, decimal_places=2)
+            ),
+            comision_total=Coalesce(
+                _total_por_usuario(detalles_query, 'pedido__user', Sum(expresion_comision())),
+                0, output_field=FloatField()
+            ),
+            ultima_actividad=F('sesionusuario__last_activity')
+        )
 
         # Obtener usuarios activos en las últimas 24 horas
         ultima_actividad = timezone.now() - timezone.timedelta(hours=24)
@@ -138,11 +148,13 @@ def administrar_usuarios(request):
             last_activity__gte=ultima_actividad
         ).count()
 
+        totales = pedidos_query.aggregate(pedidos=Count('id'), ventas=Sum('total'))
+
         context = {
             'usuarios': usuarios,
             'usuarios_activos_hoy': usuarios_activos,
-            'total_pedidos': pedidos_query.count(),
-            'total_ventas': pedidos_query.aggregate(total=Sum('total'))['total'] or 0,
+            'total_pedidos': totales['pedidos'],
+            'total_ventas': totales['ventas'] or 0,
             'fecha_desde': fecha_desde,
             'fecha_hasta': fecha_hasta
         }
@@ -306,16 +318,12 @@ def historial_usuario(request, user_id):
             total=Sum('total'))['total'] or 0
             
         # Calcular comisiones utilizando la relación con PedidoDetalle
-        total_comisiones = (pedidos_efectuados
-            .annotate(
-                comision=Sum(F('pedidodetalle__material__comision') * 
-                           F('pedidodetalle__cantidad'))
-            )
-            .aggregate(total=Sum('comision'))['total'] or 0)
+        total_comisiones = (pedidos_efectuados.con_comision()
+            .aggregate(total=Sum('comision_anotada'))['total'] or 0)
 
         context = {
             'usuario': usuario,
-            'pedidos': pedidos.order_by('-created_at'),
+            'pedidos': pedidos.select_related('cliente').con_comision().order_by('-created_at'),
             'pedidos_count': pedidos.count(),
             'total_ventas': total_ventas,
             'total_comisiones': total_comisiones,
@@ -1,3 +1,6 @@
+from inventario.imagenes import url_variante
+
+
 class Carro:
     def __init__(self, request):
         self.request = request
@@ -26,7 +29,7 @@ class Carro:
             'precio_unitario': precio_unitario,  # ✅ Mantener como float
             'precio': precio_total,  # ✅ Mantener como float
             'cantidad': nueva_cantidad,
-            'imagen': material.imagen.url,
+            'imagen': url_variante(material, 'miniatura'),
             'en_oferta': material.en_oferta,
             'precio_regular': float(material.precio)  # ✅ Mantener como float
         }
@@ -0,0 +1,132 @@
+import re
+import unicodedata
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+LIMITE_AUTOCOMPLETADO = 10
+
+# Columnas normalizadas en las que se busca por prefijo
+CAMPOS_BUSQUEDA = ('busqueda_nombre', 'busqueda_apellidos', 'carnet_identidad', 'telefono_digitos')
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con los espacios colapsados"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.lower().split())
+
+
+def solo_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+
+def _es_numero(texto):
+    # Carnets y teléfonos se escriben a veces con espacios, guiones o prefijo +
+    return bool(re.fullmatch(r'[\d\s+\-()]+', texto)) and bool(solo_digitos(texto))
+
+
+def _prefijo(campo, valor):
+    # Rango [valor, valor + U+FFFF): igual que LIKE 'valor%' pero siempre recorre el índice
+    return Q(**{f'{campo}__gte': valor, f'{campo}__lt': valor + '\uffff'})
+
+
+def consulta_normalizada(texto):
+    """Texto del buscador tal como se compara con las columnas normalizadas"""
+    return solo_digitos(texto) if _es_numero(texto) else normalizar(texto)
+
+
+def filtro_busqueda(texto):
+    """
+    Q que busca el texto como prefijo del nombre (o nombre y apellidos), de los
+    apellidos, del carnet o del teléfono. None si el texto no tiene nada que buscar.
+    """
+    consulta = consulta_normalizada(texto)
+    if not consulta:
+        return None
+    if _es_numero(texto):
+        return _prefijo('carnet_identidad', consulta) | _prefijo('telefono_digitos', consulta)
+    return _prefijo('busqueda_nombre', consulta) | _prefijo('busqueda_apellidos', consulta)
+
+
+def _coincide(claves, consulta, numero):
+    """Mismo criterio que filtro_busqueda sobre las claves ya normalizadas de un cliente"""
+    nombre, apellidos, carnet, telefono = claves
+    if numero:
+        return carnet.startswith(consulta) or telefono.startswith(consulta)
+    return nombre.startswith(consulta) or apellidos.startswith(consulta)
+
+
+def _clave_version(user_id):
+    return f'clientes:autocompletar:version:{user_id}'
+
+
+def _clave_cache(user_id, version, numero, consulta):
+    tipo = 'numero' if numero else 'texto'
+    return f'clientes:autocompletar:{user_id}:{version}:{tipo}:{quote(consulta)}'
+
+
+def invalidar_autocompletado(user_id):
+    """
+    Descarta las búsquedas cacheadas del gestor al confirmarse la transacción
+    (se cambia la versión de sus claves en lugar de borrarlas una a una)
+    """
+    def invalidar():
+        try:
+            cache.incr(_clave_version(user_id))
+        except ValueError:
+            pass  # Sin versión no hay nada cacheado
+    transaction.on_commit(invalidar)
+
+
+def autocompletar(user_id, texto):
+    """
+    Hasta LIMITE_AUTOCOMPLETADO clientes del gestor que coinciden con el texto.
+    Las respuestas se cachean por (gestor, prefijo). Si un prefijo más corto ya
+    estaba cacheado con menos resultados que el límite, contiene todos los de
+    éste y se filtra en memoria sin ir a la base de datos.
+    Returns:
+        Lista de diccionarios con id, nombre_completo, carnet_identidad y telefono
+    """
+    from .models import Cliente
+
+    consulta = consulta_normalizada(texto)
+    if not consulta:
+        return []
+    numero = _es_numero(texto)
+    segundos = getattr(settings, 'AUTOCOMPLETADO_CACHE_SEGUNDOS', 5 * 60)
+
+    version = cache.get_or_set(_clave_version(user_id), 1, None)
+    clave = _clave_cache(user_id, version, numero, consulta)
+    filas = cache.get(clave)
+    if filas is None:
+        # Prefijo cacheado más largo: el buscador espera a que se deje de teclear,
+        # así que no siempre está el de una letra menos
+        for largo in range(len(consulta) - 1, 0, -1):
+            anteriores = cache.get(_clave_cache(user_id, version, numero, consulta[:largo]))
+            if anteriores is not None:
+                if len(anteriores) < LIMITE_AUTOCOMPLETADO:
+                    filas = [fila for fila in anteriores if _coincide(fila['claves'], consulta, numero)]
+                    cache.set(clave, filas, segundos)
+                break
+    if filas is None:
+        # Los primeros por apellidos y nombre, como el orden del modelo. Con un
+        # prefijo corto SQLite ordena todas las coincidencias del gestor, pero el
+        # resultado se cachea y los prefijos más largos se filtran en memoria
+        clientes = (
+            Cliente.objects.filter(user_id=user_id).filter(filtro_busqueda(texto))
+            .order_by('apellidos', 'nombre', 'id')[:LIMITE_AUTOCOMPLETADO]
+        )
+        filas = [{
+            'id': cliente.id,
+            'nombre_completo': cliente.get_full_name(),
+            'carnet_identidad': cliente.carnet_identidad,
+            'telefono': cliente.telefono,
+            'claves': tuple(getattr(cliente, campo) for campo in CAMPOS_BUSQUEDA),
+        } for cliente in clientes]
+        cache.set(clave, filas, segundos)
+
+    return [{k: v for k, v in fila.items() if k != 'claves'} for fila in filas]
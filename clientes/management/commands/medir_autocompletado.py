@@ -0,0 +1,74 @@
+import random
+import string
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from clientes.busqueda import autocompletar
+from clientes.models import Cliente
+
+NOMBRES = ['Ana', 'José', 'María', 'Ángel', 'Lázaro', 'Yanet', 'Raúl', 'Dayana', 'Iván', 'Mónica']
+APELLIDOS = ['Pérez', 'González', 'Rodríguez', 'Fernández', 'López', 'Martínez', 'Sánchez',
+             'Díaz', 'Hernández', 'Núñez', 'Álvarez', 'Ramírez']
+
+
+class Command(BaseCommand):
+    help = ('Crea clientes de prueba para un gestor y mide el autocompletado con la caché '
+            'vacía y caliente (los datos se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=100000,
+                            help='Número de clientes a generar')
+
+    def _medir(self, user_id, consultas):
+        tiempos = []
+        with CaptureQueriesContext(connection) as capturadas:
+            for consulta in consultas:
+                inicio = time.perf_counter()
+                autocompletar(user_id, consulta)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        return tiempos[len(tiempos) // 2], tiempos[-1], len(capturadas.captured_queries)
+
+    def handle(self, *args, **options):
+        total = options['clientes']
+        azar = random.Random(1)
+        # Caché en memoria propia para no dejar entradas de datos descartados
+        cache_medicion = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                      'LOCATION': 'medir_autocompletado'}}
+
+        with transaction.atomic(), override_settings(CACHES=cache_medicion):
+            gestor = User.objects.create_user(username='__medir_autocompletado__', password=None)
+            clientes = []
+            for i in range(total):
+                cliente = Cliente(
+                    user=gestor,
+                    nombre=azar.choice(NOMBRES),
+                    apellidos=f'{azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}',
+                    carnet_identidad=f'{i:011d}',
+                    telefono=f'5{azar.randrange(10 ** 7):07d}',
+                )
+                cliente.normalizar_busqueda()
+                clientes.append(cliente)
+            Cliente.objects.bulk_create(clientes, batch_size=2000)
+            self.stdout.write(f'{total} clientes creados')
+
+            # Lo que se escribe tecla a tecla en el buscador
+            tecleos = []
+            for palabra in ['Rodrí', 'gonz', 'Ma', 'Nuñez', '0000012', '5123', 'Lázaro Pé']:
+                tecleos += [palabra[:n] for n in range(2, len(palabra) + 1)]
+            tecleos += [''.join(azar.choices(string.ascii_lowercase, k=3)) for _ in range(50)]
+
+            caches['default'].clear()
+            mediana, maximo, consultas = self._medir(gestor.id, tecleos)
+            self.stdout.write(f'Caché vacía: mediana {mediana:.2f} ms, máx {maximo:.2f} ms, '
+                              f'{consultas} consultas para {len(tecleos)} búsquedas')
+            mediana, maximo, consultas = self._medir(gestor.id, tecleos)
+            self.stdout.write(f'Caché caliente: mediana {mediana:.2f} ms, máx {maximo:.2f} ms, '
+                              f'{consultas} consultas para {len(tecleos)} búsquedas')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_alter_cliente_apellidos_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['user', '-created_at'], name='cliente_user_creado_idx'),
+        ),
+    ]
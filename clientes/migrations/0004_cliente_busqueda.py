@@ -0,0 +1,62 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+from clientes.busqueda import normalizar, solo_digitos
+
+
+def llenar_columnas_busqueda(apps, schema_editor):
+    """Rellena las columnas normalizadas de los clientes existentes"""
+    Cliente = apps.get_model('clientes', 'Cliente')
+    clientes = list(Cliente.objects.only('nombre', 'apellidos', 'telefono'))
+    for cliente in clientes:
+        cliente.busqueda_nombre = normalizar(f'{cliente.nombre} {cliente.apellidos}')
+        cliente.busqueda_apellidos = normalizar(cliente.apellidos)
+        cliente.telefono_digitos = solo_digitos(cliente.telefono)
+    Cliente.objects.bulk_update(
+        clientes, ['busqueda_nombre', 'busqueda_apellidos', 'telefono_digitos'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_cliente_cliente_user_creado_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda_apellidos',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda_nombre',
+            field=models.CharField(default='', editable=False, max_length=201),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefono_digitos',
+            field=models.CharField(default='', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['user', 'busqueda_nombre'], name='cliente_user_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['user', 'busqueda_apellidos'], name='cliente_user_apellidos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['user', 'telefono_digitos'], name='cliente_user_telefono_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['user', 'carnet_identidad'], name='cliente_user_carnet_idx'),
+        ),
+        migrations.RunPython(llenar_columnas_busqueda, migrations.RunPython.noop),
+    ]
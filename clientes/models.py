@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .busqueda import invalidar_autocompletado, normalizar, solo_digitos
+
 
 class Cliente(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Gestor")
@@ -10,11 +12,42 @@ class Cliente(models.Model):
     telefono = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Copias normalizadas para buscar por prefijo con índice (ver clientes.busqueda)
+    busqueda_nombre = models.CharField(max_length=201, editable=False, default='')
+    busqueda_apellidos = models.CharField(max_length=100, editable=False, default='')
+    telefono_digitos = models.CharField(max_length=20, editable=False, default='')
 
     def get_full_name(self):
         return f"{self.nombre} {self.apellidos}"
 
+    def normalizar_busqueda(self):
+        """Rellena las columnas de búsqueda; save() lo hace solo, bulk_create no"""
+        self.busqueda_nombre = normalizar(self.get_full_name())
+        self.busqueda_apellidos = normalizar(self.apellidos)
+        self.telefono_digitos = solo_digitos(self.telefono)
+
+    def save(self, *args, **kwargs):
+        self.normalizar_busqueda()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'busqueda_nombre', 'busqueda_apellidos', 'telefono_digitos'}
+        super().save(*args, **kwargs)
+        invalidar_autocompletado(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        invalidar_autocompletado(self.user_id)
+        return super().delete(*args, **kwargs)
+
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['apellidos', 'nombre']
+        indexes = [
+            # Lista de clientes del gestor, los más recientes primero
+            models.Index(fields=['user', '-created_at'], name='cliente_user_creado_idx'),
+            # Autocompletado por prefijo dentro de los clientes del gestor
+            models.Index(fields=['user', 'busqueda_nombre'], name='cliente_user_nombre_idx'),
+            models.Index(fields=['user', 'busqueda_apellidos'], name='cliente_user_apellidos_idx'),
+            models.Index(fields=['user', 'telefono_digitos'], name='cliente_user_telefono_idx'),
+            models.Index(fields=['user', 'carnet_identidad'], name='cliente_user_carnet_idx'),
+        ]
@@ -1,3 +1,71 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from .busqueda import autocompletar
+from .models import Cliente
+
+
+class AutocompletadoClientesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        otro = User.objects.create_user(username='otro', password='clave')
+        self.ana = Cliente.objects.create(user=self.user, nombre='Ána', apellidos='Pérez Núñez',
+                                          carnet_identidad='90010112345', telefono='5555-1234')
+        Cliente.objects.create(user=self.user, nombre='José', apellidos='Martínez',
+                               carnet_identidad='85020254321', telefono='53331111')
+        Cliente.objects.create(user=otro, nombre='Ana', apellidos='Pérez',
+                               carnet_identidad='70010112345', telefono='55551234')
+
+    def nombres(self, texto):
+        return [cliente['nombre_completo'] for cliente in autocompletar(self.user.id, texto)]
+
+    def test_prefijos_normalizados_del_gestor(self):
+        self.assertEqual(self.nombres('ana'), ['Ána Pérez Núñez'])
+        self.assertEqual(self.nombres('ana pe'), ['Ána Pérez Núñez'])
+        self.assertEqual(self.nombres('PEREZ'), ['Ána Pérez Núñez'])
+        self.assertEqual(self.nombres('9001'), ['Ána Pérez Núñez'])
+        self.assertEqual(self.nombres('5555 12'), ['Ána Pérez Núñez'])
+        self.assertEqual(self.nombres('nunez'), [])
+
+    def test_cache_por_prefijo_e_invalidacion(self):
+        self.nombres('ma')
+        with CaptureQueriesContext(connection) as consultas:
+            # Repetido y prefijo más largo de un resultado completo: sin consultas
+            self.assertEqual(self.nombres('ma'), ['José Martínez'])
+            self.assertEqual(self.nombres('mart'), ['José Martínez'])
+            self.assertEqual(self.nombres('marte'), [])
+        self.assertEqual(len(consultas.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Cliente.objects.create(user=self.user, nombre='Mario', apellidos='Díaz',
+                                   carnet_identidad='99010112345', telefono='52220000')
+        self.assertEqual(self.nombres('ma'), ['Mario Díaz', 'José Martínez'])
+
+    def test_mas_coincidencias_que_el_limite(self):
+        # Seis coinciden por el nombre y seis por los apellidos: el límite debe
+        # aplicarse después de ordenar por apellidos y nombre
+        for i in range(6):
+            Cliente.objects.create(user=self.user, nombre='Luis', apellidos=f'Zamora {i}',
+                                   carnet_identidad=f'8001011000{i}', telefono=f'5400000{i}')
+            Cliente.objects.create(user=self.user, nombre='Eva', apellidos=f'Lugo {i}',
+                                   carnet_identidad=f'8001012000{i}', telefono=f'5410000{i}')
+        self.assertEqual(
+            self.nombres('lu'),
+            [f'Eva Lugo {i}' for i in range(6)] + [f'Luis Zamora {i}' for i in range(4)]
+        )
+
+    def test_vistas(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+        respuesta = self.client.get(reverse('clientes:buscar_clientes_ajax'), {'q': 'jose'})
+        self.assertEqual([c['nombre_completo'] for c in respuesta.json()['clientes']], ['José Martínez'])
+
+        respuesta = self.client.get(reverse('clientes:lista_clientes'), {'search': 'perez'})
+        self.assertEqual([c.id for c in respuesta.context['clientes']], [self.ana.id])
+        self.assertEqual(respuesta.context['total_clientes'], 1)
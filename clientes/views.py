@@ -3,7 +3,7 @@ from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q
+from .busqueda import autocompletar, filtro_busqueda
 from .models import Cliente
 from .forms import ClienteForm
 
@@ -45,21 +45,8 @@ def buscar_clientes_ajax(request):
     if len(query) < 2:
         return JsonResponse({'clientes': []})
     
-    clientes = Cliente.objects.filter(
-        user=request.user
-    ).filter(
-        Q(nombre__icontains=query) |
-        Q(apellidos__icontains=query) |
-        Q(carnet_identidad__icontains=query) |
-        Q(telefono__icontains=query)
-    )[:10]  # Limitar a 10 resultados
-    
-    clientes_data = [{
-        'id': cliente.id,
-        'nombre_completo': cliente.get_full_name(),
-        'carnet_identidad': cliente.carnet_identidad,
-        'telefono': cliente.telefono
-    } for cliente in clientes]
+    # Prefijos sobre columnas normalizadas con índice, cacheados por gestor y prefijo
+    clientes_data = autocompletar(request.user.id, query)
     
     return JsonResponse({'clientes': clientes_data})
 
@@ -70,12 +57,8 @@ def lista_clientes(request):
     clientes_list = Cliente.objects.filter(user=request.user)
     
     if search_query:
-        clientes_list = clientes_list.filter(
-            Q(nombre__icontains=search_query) |
-            Q(apellidos__icontains=search_query) |
-            Q(carnet_identidad__icontains=search_query) |
-            Q(telefono__icontains=search_query)
-        )
+        filtro = filtro_busqueda(search_query)
+        clientes_list = clientes_list.filter(filtro) if filtro else clientes_list.none()
     
     clientes_list = clientes_list.order_by('-created_at')
     
@@ -87,7 +70,7 @@ def lista_clientes(request):
     context = {
         'clientes': clientes,
         'search_query': search_query,
-        'total_clientes': clientes_list.count()
+        'total_clientes': paginator.count  # Ya calculado por el paginador
     }
     
     return render(request, 'clientes/lista_clientes.html', context)
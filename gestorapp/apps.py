@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class GestorappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestorapp'
+
+    def ready(self):
+        from .db import aplicar_pragmas_sqlite
+        connection_created.connect(aplicar_pragmas_sqlite, dispatch_uid='gestorapp_pragmas_sqlite')
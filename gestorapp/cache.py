@@ -0,0 +1,143 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class CacheEscalonada(BaseCache):
+    """
+    Caché en dos niveles: un LRU en memoria por proceso delante de una caché
+    compartida entre procesos (cualquier alias de CACHES: archivo, base de datos...).
+
+    Las lecturas se sirven del nivel local si la entrada sigue vigente; las
+    escrituras van siempre a la compartida y actualizan el nivel local. La copia
+    local dura como mucho TIMEOUT_LOCAL segundos, lo que acota cuánto puede tardar
+    un proceso en ver un cambio hecho por otro.
+
+    OPTIONS:
+        COMPARTIDA: alias de CACHES usado como nivel compartido
+        MAX_ENTRADAS_LOCAL: tamaño máximo del LRU local (por defecto 1000)
+        TIMEOUT_LOCAL: segundos de vida de la copia local (por defecto 5)
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        opciones = params.get('OPTIONS', {})
+        self._alias_compartida = opciones.get('COMPARTIDA', location)
+        self._max_local = int(opciones.get('MAX_ENTRADAS_LOCAL', 1000))
+        self._timeout_local = float(opciones.get('TIMEOUT_LOCAL', 5))
+        self._local = OrderedDict()  # clave -> (valor serializado, expira)
+        self._lock = threading.Lock()
+        self._metricas = dict.fromkeys(
+            ['aciertos_local', 'aciertos_compartida', 'fallos', 'escrituras', 'desalojos'], 0
+        )
+
+    @property
+    def compartida(self):
+        return caches[self._alias_compartida]
+
+    # Nivel local
+
+    def _expira_local(self, timeout):
+        expira = time.time() + self._timeout_local
+        expira_clave = self.get_backend_timeout(timeout)
+        return expira if expira_clave is None else min(expira, expira_clave)
+
+    def _guardar_local(self, clave, valor, timeout=DEFAULT_TIMEOUT):
+        serializado = pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[clave] = (serializado, self._expira_local(timeout))
+            self._local.move_to_end(clave)
+            while len(self._local) > self._max_local:
+                self._local.popitem(last=False)
+                self._metricas['desalojos'] += 1
+
+    def _leer_local(self, clave):
+        with self._lock:
+            entrada = self._local.get(clave)
+            if entrada is None:
+                return None
+            if entrada[1] <= time.time():
+                del self._local[clave]
+                return None
+            self._local.move_to_end(clave)
+            self._metricas['aciertos_local'] += 1
+        return entrada
+
+    def _olvidar_local(self, clave):
+        with self._lock:
+            self._local.pop(clave, None)
+
+    def _contar(self, metrica):
+        with self._lock:
+            self._metricas[metrica] += 1
+
+    # API de caché de Django
+
+    def get(self, key, default=None, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        entrada = self._leer_local(clave)
+        if entrada is not None:
+            return pickle.loads(entrada[0])
+
+        ausente = object()
+        valor = self.compartida.get(key, ausente, version=version)
+        if valor is ausente:
+            self._contar('fallos')
+            return default
+        self._contar('aciertos_compartida')
+        self._guardar_local(clave, valor)
+        return valor
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        self.compartida.set(key, value, timeout=timeout, version=version)
+        self._contar('escrituras')
+        if timeout is not None and timeout != DEFAULT_TIMEOUT and timeout <= 0:
+            self._olvidar_local(clave)
+        else:
+            self._guardar_local(clave, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        agregado = self.compartida.add(key, value, timeout=timeout, version=version)
+        if agregado:
+            self._contar('escrituras')
+            self._guardar_local(clave, value, timeout)
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._olvidar_local(self.make_and_validate_key(key, version=version))
+        return self.compartida.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._olvidar_local(self.make_and_validate_key(key, version=version))
+        return self.compartida.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entrada = self._local.get(clave)
+            if entrada is not None and entrada[1] > time.time():
+                return True
+        return self.compartida.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Los contadores se resuelven en la compartida para no perder incrementos
+        self._olvidar_local(self.make_and_validate_key(key, version=version))
+        return self.compartida.incr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.compartida.clear()
+
+    def close(self, **kwargs):
+        self.compartida.close(**kwargs)
+
+    def metricas(self):
+        """Contadores del proceso actual más el tamaño del nivel local"""
+        with self._lock:
+            return {**self._metricas, 'entradas_local': len(self._local)}
@@ -0,0 +1,39 @@
+import threading
+
+from django.core.cache import cache
+
+
+class ContadoresLocales:
+    """
+    Contadores en memoria del proceso, sin escrituras en la caché ni en la base
+    de datos. Cada proceso del servidor lleva los suyos, como las métricas de
+    CacheEscalonada.
+    """
+    def __init__(self, *nombres):
+        self._lock = threading.Lock()
+        self._valores = dict.fromkeys(nombres, 0)
+
+    def sumar(self, nombre, cantidad=1):
+        with self._lock:
+            self._valores[nombre] = self._valores.get(nombre, 0) + cantidad
+
+    def valores(self):
+        with self._lock:
+            return dict(self._valores)
+
+    def reiniciar(self):
+        with self._lock:
+            self._valores = dict.fromkeys(self._valores, 0)
+
+
+def sumar_en_cache(clave, cantidad=1):
+    """
+    Suma en un contador de la caché compartida, visible desde todos los procesos.
+    Cada llamada escribe en la caché: solo para eventos poco frecuentes.
+    """
+    cache.add(clave, 0, None)
+    try:
+        cache.incr(clave, cantidad)
+    except ValueError:
+        # La clave expiró o se borró entre add() e incr()
+        cache.set(clave, cantidad, None)
@@ -0,0 +1,13 @@
+from django.conf import settings
+
+
+def aplicar_pragmas_sqlite(sender, connection, **kwargs):
+    """
+    Aplica SQLITE_PRAGMAS a cada conexión SQLite nueva (señal connection_created).
+    Con CONN_MAX_AGE las conexiones se reutilizan, así que esto se ejecuta una vez
+    por conexión y no por petición.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for nombre, valor in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f'PRAGMA {nombre} = {valor}')
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.utils import timezone
+
+from .contadores import ContadoresLocales
+
+CLAVE_KPIS = 'gestorapp:kpis_home'
+# Aciertos y fallos por proceso: contarlos en la caché compartida supondría una
+# escritura en cada visita a la página más consultada
+contadores = ContadoresLocales('aciertos', 'fallos')
+
+
+def calcular_kpis():
+    """Calcula los indicadores de la página de inicio contra la base de datos"""
+    from django.contrib.auth.models import User
+    from inventario.models import Material
+    from pedidos.models import Pedido
+
+    total_ventas = Pedido.objects.filter(
+        estado='efectuado'
+    ).aggregate(
+        total=Sum('total')
+    )['total'] or 0
+
+    total_productos = Material.objects.aggregate(
+        total=Sum('cantidad')
+    )['total'] or 0
+
+    # Usuarios que han hecho pedidos en el último mes. Se recorre la tabla de usuarios
+    # (pocos) y por cada uno se busca en el índice (user, created_at) de pedidos
+    mes_anterior = timezone.now() - timedelta(days=30)
+    clientes_activos = User.objects.filter(
+        Exists(Pedido.objects.filter(user=OuterRef('pk'), created_at__gte=mes_anterior))
+    ).count()
+
+    return {
+        'total_ventas': total_ventas,
+        'total_productos': total_productos,
+        'total_clientes': clientes_activos,
+    }
+
+
+def obtener_kpis():
+    """
+    Indicadores de inicio desde la caché; se recalculan si no están o si se
+    invalidaron por un cambio de pedidos o de stock.
+    """
+    kpis = cache.get(CLAVE_KPIS)
+    if kpis is not None:
+        contadores.sumar('aciertos')
+        return kpis
+
+    contadores.sumar('fallos')
+    kpis = calcular_kpis()
+    cache.set(CLAVE_KPIS, kpis, getattr(settings, 'KPIS_HOME_CACHE_SEGUNDOS', 5 * 60))
+    return kpis
+
+
+def invalidar_kpis():
+    """
+    Descarta los indicadores cacheados al confirmarse la transacción actual,
+    para que ninguna petición vuelva a cachear datos anteriores al cambio.
+    """
+    transaction.on_commit(lambda: cache.delete(CLAVE_KPIS))
+
+
+def estadisticas_cache():
+    """Aciertos y fallos de la caché de indicadores en este proceso"""
+    valores = contadores.valores()
+    total = valores['aciertos'] + valores['fallos']
+    return {
+        **valores,
+        'tasa_aciertos': round(valores['aciertos'] / total, 4) if total else None,
+    }
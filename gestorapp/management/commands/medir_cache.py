@@ -0,0 +1,57 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.cache import caches
+from django.test import override_settings
+
+
+class Command(BaseCommand):
+    help = ('Compara la latencia de get/set de la caché en disco (FileBasedCache) con la '
+            'caché escalonada (LRU local delante del mismo disco), en un directorio temporal')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--claves', type=int, default=500,
+                            help='Número de claves distintas')
+        parser.add_argument('--lecturas', type=int, default=20,
+                            help='Veces que se lee cada clave')
+
+    def _medir(self, operacion, veces):
+        inicio = time.perf_counter()
+        for i in range(veces):
+            operacion(i)
+        return (time.perf_counter() - inicio) / veces * 1_000_000
+
+    def handle(self, *args, **options):
+        claves = options['claves']
+        lecturas = options['lecturas']
+        valor = {'total_ventas': 123456.78, 'total_productos': 4321, 'total_clientes': 87}
+
+        with tempfile.TemporaryDirectory() as directorio:
+            configuracion = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'disco': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': f'{directorio}/disco',
+                },
+                'compartida': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': f'{directorio}/compartida',
+                },
+                'escalonada': {
+                    'BACKEND': 'gestorapp.cache.CacheEscalonada',
+                    'OPTIONS': {'COMPARTIDA': 'compartida', 'MAX_ENTRADAS_LOCAL': claves},
+                },
+            }
+            with override_settings(CACHES=configuracion):
+                for alias in ('disco', 'escalonada'):
+                    cache = caches[alias]
+                    escritura = self._medir(lambda i: cache.set(f'clave:{i}', valor, 300), claves)
+                    lectura = self._medir(lambda i: cache.get(f'clave:{i % claves}'), claves * lecturas)
+                    fallo = self._medir(lambda i: cache.get(f'ausente:{i}'), claves)
+                    self.stdout.write(
+                        f'{alias}: set {escritura:.1f} µs, get {lectura:.1f} µs, '
+                        f'get sin clave {fallo:.1f} µs'
+                    )
+                    if hasattr(cache, 'metricas'):
+                        self.stdout.write(f'  métricas: {cache.metricas()}')
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class EjecutorPruebas(DiscoverRunner):
+    """Ejecuta las pruebas con CACHES_PRUEBAS en lugar de las cachés del servidor"""
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches_pruebas = override_settings(CACHES=settings.CACHES_PRUEBAS)
+        self._caches_pruebas.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches_pruebas.disable()
+        super().teardown_test_environment(**kwargs)
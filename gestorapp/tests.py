@@ -1,3 +1,184 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from autenticacion import sesiones
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from pedidos.services import actualizar_lineas, crear_pedido
+from .cache import CacheEscalonada
+from .kpis import contadores as contadores_kpis, estadisticas_cache, obtener_kpis
+
+
+class AnalyticsDashboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.categoria = Categoria.objects.create(nombre='General')
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+
+    def vender(self, desde, hasta):
+        for i in range(desde, hasta):
+            material = Material.objects.create(
+                nombre=f'Material {i}', codigo=f'M{i}', categoria=self.categoria, precio=10, cantidad=10
+            )
+            carro = {str(material.id): {'cantidad': 4, 'precio_unitario': 10}}
+            pedido, _ = crear_pedido(self.user, self.cliente, carro)
+            pedido.efectuar()
+
+    def consultas(self):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(reverse('analytics_dashboard'))
+        return respuesta, len(contexto.captured_queries)
+
+    def test_lee_el_acumulado_en_consultas_constantes(self):
+        self.vender(0, 2)
+        _, pocas = self.consultas()
+        self.vender(2, 20)
+        respuesta, muchas = self.consultas()
+
+        self.assertEqual(pocas, muchas)
+        self.assertContains(respuesta, '<td>Material 7</td>', html=False)
+        self.assertContains(respuesta, '40,00%')
+
+    def test_lista_materiales_sin_ventas_e_ingresos_cobrados(self):
+        Material.objects.create(nombre='Sin ventas', codigo='S', categoria=self.categoria, precio=10, cantidad=7)
+        material = Material.objects.create(
+            nombre='Rebajado', codigo='R', categoria=self.categoria, precio=10, cantidad=10
+        )
+        # Cobrado a 6 en oferta: los ingresos son 4 x 6, no 4 x 10
+        carro = {str(material.id): {'cantidad': 4, 'precio_unitario': 6}}
+        pedido, _ = crear_pedido(self.user, self.cliente, carro)
+        pedido.efectuar()
+
+        respuesta, _ = self.consultas()
+        filas = {
+            venta.material.nombre: (venta.unidades, venta.stock_total, venta.ingresos)
+            for filas in respuesta.context['resultados_por_mes'].values() for venta in filas
+        }
+        self.assertEqual(filas, {'Rebajado': (4, 10, 24), 'Sin ventas': (0, 7, 0)})
+
+
+class KpisHomeTests(TestCase):
+    def setUp(self):
+        # La copia local de las sesiones activas debe vaciarse junto con la caché
+        for limpiar in (cache.clear, sesiones._sesiones_locales.clear, contadores_kpis.reiniciar):
+            limpiar()
+            self.addCleanup(limpiar)
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.material = Material.objects.create(
+            nombre='A', codigo='A', categoria=Categoria.objects.create(nombre='General'), precio=10, cantidad=10
+        )
+
+    def test_pruebas_usan_la_cache_escalonada(self):
+        self.assertIsInstance(caches['default'], CacheEscalonada)
+        self.assertIn('LocMemCache', type(caches['compartida']).__name__)
+
+    def test_segunda_lectura_sale_de_cache(self):
+        obtener_kpis()
+        escrituras = caches['default'].metricas()['escrituras']
+        with CaptureQueriesContext(connection) as contexto:
+            kpis = obtener_kpis()
+
+        self.assertEqual(len(contexto.captured_queries), 0)
+        # Un acierto no escribe en la caché
+        self.assertEqual(caches['default'].metricas()['escrituras'], escrituras)
+        self.assertEqual(kpis['total_productos'], 10)
+        self.assertEqual(estadisticas_cache(), {'aciertos': 1, 'fallos': 1, 'tasa_aciertos': 0.5})
+
+    def test_pedidos_y_stock_invalidan(self):
+        obtener_kpis()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido, _ = crear_pedido(self.user, self.cliente, {str(self.material.id): {'cantidad': 4, 'precio_unitario': 10}})
+        self.assertEqual(obtener_kpis()['total_productos'], 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido.efectuar()
+        self.assertEqual(obtener_kpis()['total_ventas'], 40)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.material.refresh_from_db()
+            self.material.cantidad = 50
+            self.material.save()
+        self.assertEqual(obtener_kpis()['total_productos'], 50)
+
+    def test_editar_precios_de_efectuado_invalida(self):
+        pedido, _ = crear_pedido(self.user, self.cliente, {str(self.material.id): {'cantidad': 4, 'precio_unitario': 10}})
+        pedido.efectuar()
+        self.assertEqual(obtener_kpis()['total_ventas'], 40)
+
+        # Misma cantidad y otro precio: no se mueve stock pero cambia el total vendido
+        with self.captureOnCommitCallbacks(execute=True):
+            actualizar_lineas(pedido, [{
+                'material_id': self.material.id, 'cantidad': 4, 'precio_unitario': 15,
+                'en_oferta': False, 'precio_regular': 15,
+            }], self.user)
+        self.assertEqual(obtener_kpis()['total_ventas'], 60)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'compartida': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'compartida'},
+})
+class CacheEscalonadaTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = CacheEscalonada(None, {
+            'OPTIONS': {'COMPARTIDA': 'compartida', 'MAX_ENTRADAS_LOCAL': 2, 'TIMEOUT_LOCAL': 60},
+        })
+        self.compartida = caches['compartida']
+        self.compartida.clear()
+
+    def test_lectura_repetida_no_consulta_la_compartida(self):
+        self.cache.set('a', {'x': 1})
+        self.compartida.delete('a')  # solo queda la copia local
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertEqual(self.cache.metricas()['aciertos_local'], 1)
+
+    def test_lru_local_acotado(self):
+        for clave in ('a', 'b', 'c'):
+            self.cache.set(clave, clave)
+        metricas = self.cache.metricas()
+        self.assertEqual(metricas['entradas_local'], 2)
+        self.assertEqual(metricas['desalojos'], 1)
+        # La clave desalojada sigue disponible en la compartida
+        self.assertEqual(self.cache.get('a'), 'a')
+        self.assertEqual(self.cache.metricas()['aciertos_compartida'], 1)
+
+    def test_escrituras_e_incrementos_van_a_la_compartida(self):
+        self.cache.set('n', 1)
+        self.assertEqual(self.compartida.get('n'), 1)
+        self.assertEqual(self.cache.incr('n'), 2)
+        self.assertEqual(self.cache.get('n'), 2)
+        self.assertFalse(self.cache.add('n', 5))
+        self.cache.delete('n')
+        self.assertIsNone(self.cache.get('n'))
+        self.assertIsNone(self.compartida.get('n'))
+
+
+class PragmasSqliteTests(TestCase):
+    def test_perfil_basico_no_cambia_el_journal(self):
+        # journal_mode=WAL se guarda en el archivo: solo el perfil de producción lo activa
+        self.assertEqual(settings.SQLITE_PERFILES['basico'], {})
+        self.assertEqual(settings.SQLITE_PERFILES['produccion']['journal_mode'], 'WAL')
+
+    @override_settings(SQLITE_PRAGMAS={'synchronous': 'NORMAL', 'busy_timeout': 1234, 'cache_size': -2000})
+    def test_conexion_nueva_aplica_el_perfil(self):
+        conexion = connections.create_connection('default')
+        self.addCleanup(conexion.close)
+        with conexion.cursor() as cursor:
+            for nombre, esperado in (('synchronous', 1), ('busy_timeout', 1234), ('cache_size', -2000)):
+                cursor.execute(f'PRAGMA {nombre}')
+                self.assertEqual(cursor.fetchone()[0], esperado)
@@ -3,12 +3,14 @@ from django.urls import path
 from . import views
 from django.conf import settings
 from django.conf.urls.static import static
+from autenticacion.permisos import admin_required
 
 urlpatterns = [
     
     path('', views.home, name='home'),
     path('registro', views.registro, name='registro'),
-    path('analytics/', views.analytics_dashboard, name='analytics_dashboard')
+    path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
+    path('estado-cache-kpis/', admin_required(views.estado_cache_kpis), name='estado_cache_kpis'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
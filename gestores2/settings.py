@@ -67,6 +67,16 @@ MIDDLEWARE = [
     'autenticacion.middleware.PermissionsMiddleware',  # Nuevo middleware de permisos
 ]
 
+# Con MEDIR_MIDDLEWARE=1 se intercala una marca de tiempo entre cada middleware;
+# el tiempo de cada uno se registra en el log y en la cabecera Server-Timing
+MEDIR_MIDDLEWARE = os.environ.get('MEDIR_MIDDLEWARE') == '1'
+if MEDIR_MIDDLEWARE:
+    MIDDLEWARE = [
+        entrada
+        for middleware in MIDDLEWARE
+        for entrada in ('autenticacion.medicion.MedicionMiddleware', middleware)
+    ] + ['autenticacion.medicion.MedicionMiddleware']
+
 ROOT_URLCONF = 'gestores2.urls'
 
 TEMPLATES = [
@@ -94,14 +104,46 @@ WSGI_APPLICATION = 'gestores2.wsgi.application'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 # Database security settings
+# Perfil de ajustes de SQLite: 'basico' (valores por defecto de SQLite) o 'produccion'.
+# 'produccion' deja la base en modo WAL de forma persistente (reescribe la cabecera
+# del archivo), así que solo se activa en el despliegue con SQLITE_PERFIL=produccion
+SQLITE_PERFIL = os.environ.get('SQLITE_PERFIL', 'basico')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-        'ATOMIC_REQUESTS': True,  # Ensure database transactions are atomic
+        # Sin transacción por petición: las vistas de lectura no abren transacción y las
+        # de escritura usan bloques transaction.atomic() solo alrededor de lo que escriben
+        'ATOMIC_REQUESTS': False,
+        # Conexiones persistentes entre peticiones, comprobadas antes de reutilizarse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # Segundos esperando un bloqueo antes de "database is locked"
+            # BEGIN IMMEDIATE reserva la escritura al abrir la transacción. Con BEGIN diferido,
+            # dos transacciones que leen y luego escriben fallan al instante sin esperar el timeout
+            'transaction_mode': 'IMMEDIATE' if SQLITE_PERFIL == 'produccion' else 'DEFERRED',
+        },
     }
 }
 
+# PRAGMAs de SQLite aplicados a cada conexión nueva (gestorapp.db.aplicar_pragmas_sqlite).
+# 'produccion' usa WAL para que los lectores no esperen a los escritores.
+SQLITE_PERFILES = {
+    'produccion': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # Seguro con WAL: solo se arriesga la última transacción ante un corte
+        'busy_timeout': 20000,  # Milisegundos
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -32000,  # Negativo: KiB (unos 32 MB por conexión)
+        'temp_store': 'MEMORY',
+    },
+    # Valores por defecto de SQLite; no cambia el modo del journal guardado en el archivo
+    'basico': {},
+}
+SQLITE_PRAGMAS = SQLITE_PERFILES[SQLITE_PERFIL]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -177,12 +219,10 @@ MESSAGE_TAGS = {
     mensajes.DEBUG: 'debug',
 }
 
-'''CELERY_BEAT_SCHEDULE = {
-    'eliminar-pedidos-antiguos': {
-        'task': 'pedidos.tasks.eliminar_pedidos_antiguos',
-        'schedule': timedelta(hours=1),  # Ejecutar cada hora
-    }
-}'''
+# Barrido de pedidos pendientes vencidos (pedidos.task.barrer_pedidos_pendientes).
+# Se programa una vez con `python manage.py barrer_pedidos_pendientes --programar`
+BARRIDO_PEDIDOS_SEGUNDOS = 300
+BARRIDO_PEDIDOS_LOTE = 500
 
 CORS_ALLOW_ALL_ORIGINS = False  # Solo para desarrollo
 
@@ -202,15 +242,51 @@ LOGIN_REDIRECT_URL = '/api/'
 
 # Configuración de imágenes
 IMAGE_QUALITY = 90
+IMAGEN_VARIANTES_WEBP = True  # Generar también variantes WebP (miniatura, tarjeta, detalle)
 MAX_UPLOAD_SIZE = 5242880  # 5MB en bytes
 
-# Configuración de caché para imágenes
-CACHES = {
-    'default': {
+# Facturas PDF de pedidos efectuados ya generadas (pedidos.facturas)
+FACTURAS_CACHE_DIR = os.path.join(BASE_DIR, 'cache_facturas')
+
+# Configuración de caché: LRU en memoria por proceso delante de una caché compartida.
+# El nivel compartido es en disco por defecto; con CACHE_COMPARTIDA=bd usa una tabla
+# en la base de datos (requiere `python manage.py createcachetable`).
+CACHES_COMPARTIDAS = {
+    'archivo': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': str(BASE_DIR / 'django_cache'),
-    }
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'bd': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_compartida',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'gestorapp.cache.CacheEscalonada',
+        'OPTIONS': {
+            'COMPARTIDA': 'compartida',
+            'MAX_ENTRADAS_LOCAL': 1000,
+            'TIMEOUT_LOCAL': 5,
+        },
+    },
+    'compartida': CACHES_COMPARTIDAS[os.environ.get('CACHE_COMPARTIDA', 'archivo')],
+}
+
+# Las pruebas usan la misma caché escalonada con el nivel compartido en memoria,
+# para no compartir datos (p. ej. sesiones activas cacheadas por id de usuario)
+# con la caché en disco del servidor. La aplica gestorapp.pruebas.EjecutorPruebas
+CACHES_PRUEBAS = {
+    'default': CACHES['default'],
+    'compartida': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pruebas',
+    },
 }
+TEST_RUNNER = 'gestorapp.pruebas.EjecutorPruebas'
 
 CSRF_TRUSTED_ORIGINS = ['http://localhost:8000', 'http://127.0.0.1:8000', 'https://hecit.pythonanywhere.com']
 
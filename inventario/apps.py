@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class InventarioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventario'
+
+    def ready(self):
+        # Registrar las tareas en segundo plano de la app
+        from . import task  # noqa: F401
+        # Mantener el índice de búsqueda del catálogo
+        from . import signals  # noqa: F401
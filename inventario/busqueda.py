@@ -0,0 +1,85 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Tabla FTS5 con nombre, código y nombre de categoría de cada material (rowid = id
+# del material). La crea la migración 0008 y se mantiene con las señales de signals.py
+TABLA_FTS = 'inventario_material_fts'
+
+
+def _tablas():
+    from .models import Categoria, Material
+    return Material._meta.db_table, Categoria._meta.db_table
+
+
+def consulta_fts(texto):
+    """
+    Convierte el texto del buscador en una consulta FTS5: cada palabra como
+    prefijo entre comillas (así los operadores y signos del usuario no se interpretan)
+    y todas obligatorias. Las tildes las ignora el tokenizador.
+    """
+    return ' '.join(f'"{palabra}"*' for palabra in re.findall(r'\w+', texto))
+
+
+def indexar_materiales(materiales=None):
+    """
+    (Re)escribe en el índice de búsqueda los materiales del queryset, o todos
+    si no se indica ninguno
+    """
+    if connection.vendor != 'sqlite':
+        return
+    tabla_material, tabla_categoria = _tablas()
+    filtro_fts, filtro, params = '', '', []
+    if materiales is not None:
+        sql, params = materiales.values('id').query.sql_with_params()
+        params = list(params)
+        filtro_fts = f'WHERE rowid IN ({sql})'
+        filtro = f'WHERE m.id IN ({sql})'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLA_FTS} {filtro_fts}', params)
+        cursor.execute(
+            f'INSERT INTO {TABLA_FTS}(rowid, nombre, codigo, categoria) '
+            f"SELECT m.id, m.nombre, COALESCE(m.codigo, ''), c.nombre "
+            f'FROM {tabla_material} m JOIN {tabla_categoria} c ON c.id = m.categoria_id {filtro}',
+            params
+        )
+
+
+def quitar_materiales(ids):
+    if connection.vendor != 'sqlite' or not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLA_FTS} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', list(ids)
+        )
+
+
+def buscar_materiales(materiales, texto):
+    """
+    Filtra un queryset de Material por nombre, código o categoría (prefijos, sin
+    distinguir tildes ni mayúsculas) y anota relevancia: cuanto menor, más relevante.
+    Returns:
+        Queryset filtrado, sin ordenar; ordenar por 'relevancia' para el ranking
+    """
+    consulta = consulta_fts(texto)
+    sin_ranking = Value(0.0, output_field=FloatField())
+    if not consulta:
+        return materiales.annotate(relevancia=sin_ranking).none()
+
+    if connection.vendor != 'sqlite':
+        return materiales.filter(
+            Q(nombre__icontains=texto) | Q(codigo__icontains=texto) | Q(categoria__nombre__icontains=texto)
+        ).annotate(relevancia=sin_ranking)
+
+    tabla_material, _ = _tablas()
+    return materiales.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [consulta])
+    ).annotate(
+        # rank usa bm25 con pesos nombre > código > categoría (configurado en la migración)
+        relevancia=RawSQL(
+            f'SELECT rank FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s AND rowid = {tabla_material}.id',
+            [consulta], output_field=FloatField()
+        )
+    )
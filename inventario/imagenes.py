@@ -0,0 +1,99 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+# Variantes generadas para cada imagen subida: nombre -> lado máximo en píxeles
+VARIANTES_IMAGEN = {
+    'miniatura': 200,
+    'tarjeta': 400,
+    'detalle': 800,
+}
+
+CARPETA_VARIANTES = 'inventario/variantes'
+
+
+def imagen_sin_procesar(imagen):
+    """
+    Indica si el campo contiene un archivo recién asignado que aún no se ha
+    guardado en el storage. Las imágenes ya almacenadas se consideran procesadas.
+    """
+    return bool(imagen) and not imagen._committed
+
+
+def formatos_variantes():
+    formatos = [('jpg', 'JPEG')]
+    if getattr(settings, 'IMAGEN_VARIANTES_WEBP', True):
+        formatos.append(('webp', 'WEBP'))
+    return formatos
+
+
+def generar_variantes(imagen):
+    """
+    Genera las variantes de una imagen ya almacenada
+    Returns:
+        Diccionario {variante: {formato: ruta en el storage}}
+    """
+    calidad = getattr(settings, 'IMAGE_QUALITY', 90)
+    base = os.path.splitext(os.path.basename(imagen.name))[0]
+
+    with imagen.open('rb') as archivo:
+        img = Image.open(archivo)
+        img.load()
+
+    # Convertir a RGB si es necesario
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    variantes = {}
+    for nombre, lado in VARIANTES_IMAGEN.items():
+        copia = img.copy()
+        copia.thumbnail((lado, lado), Image.LANCZOS)
+        variantes[nombre] = {}
+        for extension, formato in formatos_variantes():
+            output = io.BytesIO()
+            copia.save(output, format=formato, quality=calidad)
+            ruta = f'{CARPETA_VARIANTES}/{nombre}/{base}.{extension}'
+            variantes[nombre][extension] = default_storage.save(ruta, ContentFile(output.getvalue()))
+    return variantes
+
+
+def rutas_variantes(variantes):
+    """Lista plana de las rutas guardadas en un diccionario de variantes"""
+    return [ruta for formatos in (variantes or {}).values() for ruta in formatos.values()]
+
+
+def eliminar_variantes(variantes):
+    for ruta in rutas_variantes(variantes):
+        default_storage.delete(ruta)
+
+
+def programar_variantes(instancia, anteriores=None):
+    """
+    Encola la generación de variantes cuando se confirme la transacción actual
+    y elimina las variantes de la imagen anterior.
+    """
+    from .task import generar_variantes_imagen
+
+    def encolar():
+        eliminar_variantes(anteriores)
+        generar_variantes_imagen(instancia._meta.model_name, instancia.pk)
+
+    transaction.on_commit(encolar)
+
+
+def url_variante(instancia, nombre, formato='jpg'):
+    """
+    URL de la variante pedida; si todavía no se generó se usa la imagen original
+    (solo para JPEG, el resto de formatos devuelve cadena vacía).
+    """
+    ruta = (instancia.imagen_variantes or {}).get(nombre, {}).get(formato)
+    if ruta:
+        return default_storage.url(ruta)
+    if formato == 'jpg' and instancia.imagen:
+        return instancia.imagen.url
+    return ''
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from inventario.models import Material, MaterialImagen
+from inventario.task import generar_variantes_imagen
+
+class Command(BaseCommand):
+    help = 'Genera las variantes (miniatura, tarjeta, detalle) de las imágenes que aún no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahora', action='store_true',
+                            help='Procesar en este proceso en lugar de encolar tareas en segundo plano')
+        parser.add_argument('--todas', action='store_true',
+                            help='Regenerar también las imágenes que ya tienen variantes')
+
+    def handle(self, *args, **options):
+        total = 0
+        for modelo in (Material, MaterialImagen):
+            pendientes = modelo.objects.exclude(imagen='').exclude(imagen__isnull=True)
+            if not options['todas']:
+                pendientes = pendientes.filter(imagen_variantes={})
+
+            for objeto_id in pendientes.values_list('id', flat=True):
+                if options['ahora']:
+                    try:
+                        generar_variantes_imagen.now(modelo._meta.model_name, objeto_id)
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(f'{modelo.__name__} {objeto_id}: {str(e)}'))
+                        continue
+                else:
+                    generar_variantes_imagen(modelo._meta.model_name, objeto_id)
+                total += 1
+
+        accion = 'procesadas' if options['ahora'] else 'encoladas'
+        self.stdout.write(self.style.SUCCESS(f'{total} imágenes {accion}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from inventario.busqueda import indexar_materiales
+from inventario.models import Material
+
+
+class Command(BaseCommand):
+    help = 'Vuelve a generar el índice de búsqueda del catálogo (FTS5) desde los materiales'
+
+    def handle(self, *args, **options):
+        indexar_materiales()
+        self.stdout.write(self.style.SUCCESS(f'{Material.objects.count()} materiales indexados'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from inventario.models import Material
+
+class Command(BaseCommand):
+    help = 'Compara cantidad_reservada con los detalles de pedidos pendientes y opcionalmente la corrige'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corregir', action='store_true',
+                            help='Reescribir cantidad_reservada con el valor recalculado')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            desviados = (Material.objects.con_cantidad_en_pedidos()
+                         .exclude(cantidad_reservada=F('cantidad_en_pedidos'))
+                         .values_list('id', 'nombre', 'cantidad_reservada', 'cantidad_en_pedidos'))
+            desviados = list(desviados)
+
+            for material_id, nombre, reservada, real in desviados:
+                self.stdout.write(self.style.WARNING(
+                    f'Material {material_id} ({nombre}): cantidad_reservada={reservada}, pedidos pendientes={real}'
+                ))
+                if options['corregir']:
+                    Material.objects.filter(id=material_id).update(cantidad_reservada=real)
+
+        if not desviados:
+            self.stdout.write(self.style.SUCCESS('cantidad_reservada coincide con los pedidos pendientes'))
+        elif options['corregir']:
+            self.stdout.write(self.style.SUCCESS(f'{len(desviados)} materiales corregidos'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{len(desviados)} materiales con desviación (use --corregir)'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0004_material_en_oferta_material_precio_oferta_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='imagen_variantes',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Variantes de imagen'),
+        ),
+        migrations.AddField(
+            model_name='materialimagen',
+            name='imagen_variantes',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Variantes de imagen'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:10
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def calcular_cantidad_reservada(apps, schema_editor):
+    Material = apps.get_model('inventario', 'Material')
+    PedidoDetalle = apps.get_model('pedidos', 'PedidoDetalle')
+    pendientes = (PedidoDetalle.objects.filter(pedido__estado='pendiente')
+                  .values('material_id').annotate(total=Sum('cantidad')))
+    for fila in pendientes:
+        Material.objects.filter(id=fila['material_id']).update(cantidad_reservada=fila['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0005_material_imagen_variantes'),
+        ('pedidos', '0006_alter_pedido_estado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='cantidad_reservada',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Cantidad en pedidos pendientes'),
+        ),
+        migrations.RunPython(calcular_cantidad_reservada, migrations.RunPython.noop),
+    ]
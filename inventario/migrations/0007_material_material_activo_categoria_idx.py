@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0006_material_cantidad_reservada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria'], name='material_activo_categoria_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    """Tabla FTS5 del catálogo y carga inicial desde los materiales existentes"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE inventario_material_fts USING fts5('
+        'nombre, codigo, categoria, '
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    # Ranking: el nombre pesa más que el código y éste más que la categoría
+    schema_editor.execute(
+        "INSERT INTO inventario_material_fts(inventario_material_fts, rank) "
+        "VALUES ('rank', 'bm25(10.0, 5.0, 2.0)')"
+    )
+    schema_editor.execute(
+        'INSERT INTO inventario_material_fts(rowid, nombre, codigo, categoria) '
+        "SELECT m.id, m.nombre, COALESCE(m.codigo, ''), c.nombre "
+        'FROM inventario_material m JOIN inventario_categoria c ON c.id = m.categoria_id'
+    )
+
+
+def borrar_indice_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS inventario_material_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0007_material_material_activo_categoria_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, borrar_indice_busqueda),
+    ]
@@ -1,22 +1,45 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
-from PIL import Image
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import io
-import sys
+from django.db import transaction
+from django.db.models import Sum, F, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from gestorapp.kpis import invalidar_kpis
+from .imagenes import imagen_sin_procesar, programar_variantes
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 
 
+class StockInsuficiente(Exception):
+    """Algún material no tiene stock suficiente para la reserva"""
+
+
 class Categoria(models.Model):
     nombre = models.CharField(verbose_name='Nombre', max_length=50)
     imagen = models.ImageField(verbose_name='Imagen', upload_to='categorias', null=True, blank=True)
     def __str__(self):
         return self.nombre
 
+class MaterialQuerySet(models.QuerySet):
+    def con_cantidad_en_pedidos(self):
+        """
+        Anota cantidad_en_pedidos (unidades en pedidos pendientes) con una
+        subconsulta agrupada, en lugar de una consulta por material
+        """
+        from pedidos.models import PedidoDetalle
+        pendientes = PedidoDetalle.objects.filter(
+            material=OuterRef('pk'),
+            pedido__estado='pendiente'
+        ).values('material').annotate(
+            total=Sum('cantidad')
+        ).values('total')
+        return self.annotate(
+            cantidad_en_pedidos=Coalesce(Subquery(pendientes), 0)
+        )
+
+
 class Material(models.Model):
     nombre = models.CharField(verbose_name='Nombre', max_length=50)
     codigo = models.CharField(verbose_name='Código', max_length=50, unique=True, null=True, blank=True)
@@ -25,6 +48,7 @@ class Material(models.Model):
     precio = models.FloatField(verbose_name='Precio', max_length=20)
     comision = models.FloatField(verbose_name='Comisión', max_length=20, default=0)
     cantidad = models.IntegerField(verbose_name='Cantidad')
+    cantidad_reservada = models.IntegerField(verbose_name='Cantidad en pedidos pendientes', default=0, editable=False)
     ficha_tecnica = models.FileField(verbose_name='Ficha técnica', upload_to='fichas_tecnicas', null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -32,10 +56,21 @@ class Material(models.Model):
     activo = models.BooleanField(default=True)
     en_oferta = models.BooleanField(verbose_name='En Oferta', default=False)
     precio_oferta = models.FloatField(verbose_name='Precio en Oferta', null=True, blank=True)
+    imagen_variantes = models.JSONField(verbose_name='Variantes de imagen', default=dict, blank=True)
+
+    objects = MaterialQuerySet.as_manager()
 
     def __str__(self):
         return self.nombre
 
+    class Meta:
+        indexes = [
+            # Catálogo por categoría. Parcial porque Django compara los booleanos como
+            # WHERE "activo" (sin = 1), y esa condición no puede buscar en un índice normal
+            models.Index(fields=['categoria'], condition=models.Q(activo=True),
+                         name='material_activo_categoria_idx'),
+        ]
+
     def actualizar_stock(self, cantidad):
         """
         Actualiza el stock del material
@@ -44,17 +79,117 @@ class Material(models.Model):
         Returns:
             Boolean: True si la operación fue exitosa
         """
-        nuevo_stock = self.cantidad + cantidad
-        if nuevo_stock < 0:
-            return False
-        self.cantidad = nuevo_stock
-        self.save()
+        if cantidad < 0:
+            reservados, fallidos = Material.reservar_stock({self.id: -cantidad}, pendiente=False)
+            if fallidos:
+                return False
+        else:
+            Material.liberar_stock({self.id: cantidad}, pendiente=False)
+        self.refresh_from_db(fields=['cantidad', 'updated'])
         return True
 
+    @staticmethod
+    def _cantidades_por_id(cantidades):
+        return Case(
+            *[When(id=material_id, then=Value(cantidad)) for material_id, cantidad in cantidades.items()],
+            output_field=models.IntegerField()
+        )
+
+    @classmethod
+    def reservar_stock(cls, cantidades, pendiente=True):
+        """
+        Descuenta stock de varios materiales con UPDATE condicionales
+        (cantidad = cantidad - n WHERE cantidad >= n), sin leer ni guardar instancias.
+        Las cantidades negativas devuelven stock y nunca fallan, así que los cambios
+        netos de un pedido editado se aplican en un solo UPDATE.
+        Args:
+            cantidades: diccionario {material_id: cantidad a descontar}
+            pendiente: si las unidades pasan a un pedido pendiente (suma cantidad_reservada)
+        Returns:
+            Tupla (reservados, fallidos) con los ids de cada grupo. Los reservados
+            quedan descontados; el llamador decide si revertir la transacción.
+        """
+        cantidades = {int(material_id): int(cantidad) for material_id, cantidad in cantidades.items() if cantidad}
+        if not cantidades:
+            return [], []
+
+        def cambios(n):
+            campos = {'cantidad': F('cantidad') - n, 'updated': timezone.now()}
+            if pendiente:
+                campos['cantidad_reservada'] = F('cantidad_reservada') + n
+            return campos
+
+        # Intento rápido: un único UPDATE para todas las filas dentro de un savepoint
+        try:
+            with transaction.atomic():
+                casos = cls._cantidades_por_id(cantidades)
+                actualizados = cls.objects.filter(
+                    id__in=list(cantidades),
+                    cantidad__gte=casos
+                ).update(**cambios(casos))
+                if actualizados != len(cantidades):
+                    raise StockInsuficiente()
+            invalidar_kpis()
+            return list(cantidades), []
+        except StockInsuficiente:
+            pass
+
+        # Alguna fila no alcanzó: repetir fila a fila para saber cuáles fallan
+        reservados, fallidos = [], []
+        for material_id, cantidad in cantidades.items():
+            actualizados = cls.objects.filter(
+                id=material_id,
+                cantidad__gte=cantidad
+            ).update(**cambios(cantidad))
+            if actualizados:
+                reservados.append(material_id)
+            else:
+                fallidos.append(material_id)
+        if reservados:
+            invalidar_kpis()
+        return reservados, fallidos
+
+    @classmethod
+    def liberar_stock(cls, cantidades, pendiente=True):
+        """
+        Devuelve stock a varios materiales con un único UPDATE
+        Args:
+            cantidades: diccionario {material_id: cantidad a devolver}
+            pendiente: si las unidades salen de un pedido pendiente (resta cantidad_reservada)
+        Returns:
+            Número de materiales actualizados
+        """
+        cantidades = {int(material_id): int(cantidad) for material_id, cantidad in cantidades.items() if cantidad}
+        if not cantidades:
+            return 0
+        casos = cls._cantidades_por_id(cantidades)
+        campos = {'cantidad': F('cantidad') + casos, 'updated': timezone.now()}
+        if pendiente:
+            campos['cantidad_reservada'] = F('cantidad_reservada') - casos
+        invalidar_kpis()
+        return cls.objects.filter(id__in=list(cantidades)).update(**campos)
+
+    @classmethod
+    def confirmar_reserva(cls, cantidades):
+        """
+        Descuenta de cantidad_reservada las unidades de un pedido que se efectúa.
+        El stock ya se descontó al crear el pedido.
+        """
+        cantidades = {int(material_id): int(cantidad) for material_id, cantidad in cantidades.items() if cantidad}
+        if not cantidades:
+            return 0
+        casos = cls._cantidades_por_id(cantidades)
+        return cls.objects.filter(id__in=list(cantidades)).update(
+            cantidad_reservada=F('cantidad_reservada') - casos
+        )
+
     def get_cantidad_en_pedidos(self):
         """
         Obtiene la cantidad total en pedidos pendientes
         """
+        if hasattr(self, 'cantidad_en_pedidos'):
+            # Ya anotada con Material.objects.con_cantidad_en_pedidos()
+            return self.cantidad_en_pedidos
         from pedidos.models import PedidoDetalle
         cantidad = PedidoDetalle.objects.filter(
             material=self,
@@ -65,34 +200,18 @@ class Material(models.Model):
         return cantidad or 0
 
     def save(self, *args, **kwargs):
-        if self.imagen:
-            # Abrir imagen
-            img = Image.open(self.imagen)
-            
-            # Convertir a RGB si es necesario
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Redimensionar manteniendo proporción
-            output_size = (800, 800)
-            img.thumbnail(output_size, Image.LANCZOS)
-            
-            # Guardar con buena calidad
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=90)
-            output.seek(0)
-            
-            # Reemplazar la imagen original
-            self.imagen = InMemoryUploadedFile(
-                output,
-                'ImageField',
-                f"{self.imagen.name.split('.')[0]}.jpg",
-                'image/jpeg',
-                sys.getsizeof(output),
-                None
-            )
-            
+        # Las variantes solo se generan para subidas nuevas y fuera de la petición;
+        # los cambios de stock, destacado, oferta, etc. no tocan la imagen
+        nueva_imagen = imagen_sin_procesar(self.imagen)
+        if nueva_imagen:
+            variantes_anteriores, self.imagen_variantes = self.imagen_variantes, {}
+
         super().save(*args, **kwargs)
+        invalidar_kpis()
+
+        if nueva_imagen:
+            programar_variantes(self, variantes_anteriores)
+
     def calcular_precio_cup(self, precio):
         self.precio = precio * 350
         self.save()
@@ -119,6 +238,7 @@ class Material(models.Model):
 class MaterialImagen(models.Model):
     material = models.ForeignKey(Material, related_name='imagenes', on_delete=models.CASCADE)
     imagen = models.ImageField(verbose_name='Imagen', upload_to='inventario/materiales')
+    imagen_variantes = models.JSONField(verbose_name='Variantes de imagen', default=dict, blank=True)
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -127,24 +247,12 @@ class MaterialImagen(models.Model):
         ordering = ['created']
 
     def save(self, *args, **kwargs):
-        if self.imagen:
-            img = Image.open(self.imagen)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            output_size = (800, 800)
-            img.thumbnail(output_size, Image.LANCZOS)
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=90)
-            output.seek(0)
-            self.imagen = InMemoryUploadedFile(
-                output,
-                'ImageField',
-                f"{self.imagen.name.split('.')[0]}.jpg",
-                'image/jpeg',
-                sys.getsizeof(output),
-                None
-            )
+        nueva_imagen = imagen_sin_procesar(self.imagen)
+        if nueva_imagen:
+            variantes_anteriores, self.imagen_variantes = self.imagen_variantes, {}
         super().save(*args, **kwargs)
+        if nueva_imagen:
+            programar_variantes(self, variantes_anteriores)
 
 @login_required
 def editar_material(request, material_id):
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .busqueda import indexar_materiales, quitar_materiales
+from .models import Categoria, Material
+
+# Campos de Material que forman parte del índice de búsqueda
+CAMPOS_BUSQUEDA = {'nombre', 'codigo', 'categoria', 'categoria_id'}
+
+
+@receiver(post_save, sender=Material)
+def indexar_material(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Los cambios de stock, destacado, oferta... se guardan con update_fields o con
+    # UPDATE directos y no tocan el índice
+    if raw or (update_fields and not CAMPOS_BUSQUEDA & set(update_fields)):
+        return
+    indexar_materiales(Material.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Material)
+def quitar_material(sender, instance, **kwargs):
+    quitar_materiales([instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    indexar_materiales(Material.objects.filter(categoria=instance))
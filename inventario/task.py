@@ -6,4 +6,39 @@ from .models import Pedido
 @shared_task
 def eliminar_pedidos_antiguos():
     limite = timezone.now() - timedelta(hours=24)
-    Pedido.objects.filter(created_at__lte=limite).delete()'''
\ No newline at end of file
+    Pedido.objects.filter(created_at__lte=limite).delete()'''
+import logging
+
+from background_task import background
+from django.apps import apps
+
+from .imagenes import generar_variantes, eliminar_variantes
+
+logger = logging.getLogger(__name__)
+
+
+@background(schedule=0)
+def generar_variantes_imagen(modelo, objeto_id):
+    """Genera las variantes de la imagen de un Material o MaterialImagen"""
+    model = apps.get_model('inventario', modelo)
+    instancia = model.objects.filter(id=objeto_id).first()
+    if instancia is None or not instancia.imagen:
+        return
+
+    try:
+        variantes = generar_variantes(instancia.imagen)
+    except Exception as e:
+        logger.error(f"Error generando variantes de {modelo} {objeto_id}: {str(e)}")
+        raise
+
+    # Solo guardar si la imagen no cambió mientras se procesaba
+    actualizados = model.objects.filter(
+        id=objeto_id,
+        imagen=instancia.imagen.name
+    ).update(imagen_variantes=variantes)
+    if not actualizados:
+        eliminar_variantes(variantes)
+        return
+
+    eliminar_variantes(instancia.imagen_variantes)
+    logger.info(f"Variantes generadas para {modelo} {objeto_id}")
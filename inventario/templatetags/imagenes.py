@@ -0,0 +1,21 @@
+from django import template
+
+from inventario.imagenes import url_variante
+
+register = template.Library()
+
+
+@register.filter(name='variante')
+def variante(instancia, nombre):
+    """URL JPEG de la variante (miniatura, tarjeta, detalle) o de la imagen original"""
+    if not instancia:
+        return ''
+    return url_variante(instancia, nombre)
+
+
+@register.filter(name='variante_webp')
+def variante_webp(instancia, nombre):
+    """URL WebP de la variante, vacía si aún no existe"""
+    if not instancia:
+        return ''
+    return url_variante(instancia, nombre, formato='webp')
@@ -1,3 +1,237 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from background_task.models import Task
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from .busqueda import buscar_materiales
+from .imagenes import VARIANTES_IMAGEN
+from .models import Categoria, Material, MaterialImagen
+from .task import generar_variantes_imagen
+from .templatetags.imagenes import variante, variante_webp
+
+
+def imagen_subida(nombre='foto.png', size=(1200, 900)):
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, (200, 30, 30, 255)).save(buffer, format='PNG')
+    return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/png')
+
+
+class StockMaterialTests(TestCase):
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='General')
+        self.a = Material.objects.create(nombre='A', codigo='A', categoria=categoria, precio=1, cantidad=5)
+        self.b = Material.objects.create(nombre='B', codigo='B', categoria=categoria, precio=1, cantidad=2)
+
+    def cantidades(self):
+        return dict(Material.objects.values_list('id', 'cantidad'))
+
+    def test_reservar_stock_descuenta_todas_las_filas(self):
+        reservados, fallidos = Material.reservar_stock({self.a.id: 3, self.b.id: 2})
+
+        self.assertEqual(sorted(reservados), sorted([self.a.id, self.b.id]))
+        self.assertEqual(fallidos, [])
+        self.assertEqual(self.cantidades(), {self.a.id: 2, self.b.id: 0})
+
+    def test_reservar_stock_informa_filas_sin_stock(self):
+        reservados, fallidos = Material.reservar_stock({self.a.id: 3, self.b.id: 4})
+
+        self.assertEqual(reservados, [self.a.id])
+        self.assertEqual(fallidos, [self.b.id])
+        self.assertEqual(self.cantidades(), {self.a.id: 2, self.b.id: 2})
+
+    def test_liberar_stock(self):
+        Material.liberar_stock({self.a.id: 1, self.b.id: 3})
+
+        self.assertEqual(self.cantidades(), {self.a.id: 6, self.b.id: 5})
+
+    def test_actualizar_stock_no_usa_instancia_obsoleta(self):
+        obsoleto = Material.objects.get(id=self.b.id)
+        Material.reservar_stock({self.b.id: 2})
+
+        self.assertFalse(obsoleto.actualizar_stock(-1))
+        self.assertTrue(obsoleto.actualizar_stock(4))
+        self.assertEqual(obsoleto.cantidad, 4)
+
+
+class ProcesamientoImagenTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.categoria = Categoria.objects.create(nombre='General')
+        self.material = Material.objects.create(
+            nombre='Con imagen', codigo='IMG', categoria=self.categoria,
+            precio=1, cantidad=10, imagen=imagen_subida()
+        )
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_subida_no_usa_pil_en_la_peticion(self):
+        with mock.patch('inventario.imagenes.Image.open') as abrir:
+            with self.captureOnCommitCallbacks(execute=True):
+                material = Material.objects.create(
+                    nombre='Otra', codigo='IMG2', categoria=self.categoria,
+                    precio=1, cantidad=1, imagen=imagen_subida('otra.png')
+                )
+
+        abrir.assert_not_called()
+        self.assertTrue(material.imagen.name.endswith('.png'))
+        self.assertTrue(Task.objects.filter(task_name='inventario.task.generar_variantes_imagen').exists())
+
+    def test_tarea_genera_variantes(self):
+        generar_variantes_imagen.now('material', self.material.id)
+
+        self.material.refresh_from_db()
+        self.assertEqual(set(self.material.imagen_variantes), set(VARIANTES_IMAGEN))
+        with Image.open(default_storage.path(self.material.imagen_variantes['tarjeta']['jpg'])) as img:
+            self.assertEqual(img.size, (400, 300))
+        self.assertTrue(self.material.imagen_variantes['miniatura']['webp'].endswith('.webp'))
+        self.assertEqual(
+            variante(self.material, 'detalle'),
+            default_storage.url(self.material.imagen_variantes['detalle']['jpg'])
+        )
+
+    def test_sin_variantes_se_usa_la_original(self):
+        self.assertEqual(variante(self.material, 'tarjeta'), self.material.imagen.url)
+        self.assertEqual(variante_webp(self.material, 'tarjeta'), '')
+
+    def test_cambios_de_stock_y_flags_no_usan_pil(self):
+        material = Material.objects.get(id=self.material.id)
+        nombre_imagen = material.imagen.name
+
+        with mock.patch('inventario.imagenes.Image.open') as abrir:
+            material.actualizar_stock(-3)
+            material.actualizar_stock(1)
+            material.destacado = True
+            material.save()
+            material.soft_delete()
+
+        abrir.assert_not_called()
+        material.refresh_from_db()
+        self.assertEqual(material.imagen.name, nombre_imagen)
+        self.assertEqual(material.cantidad, 8)
+
+    def test_imagen_secundaria_solo_se_procesa_al_subirla(self):
+        secundaria = MaterialImagen.objects.create(material=self.material, imagen=imagen_subida('extra.png'))
+
+        with mock.patch('inventario.imagenes.Image.open') as abrir:
+            secundaria.save()
+
+        abrir.assert_not_called()
+
+
+class CantidadEnPedidosTests(TestCase):
+    def setUp(self):
+        from clientes.models import Cliente
+        from pedidos.models import Pedido, PedidoDetalle
+
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='5555'
+        )
+        categoria = Categoria.objects.create(nombre='General')
+        self.materiales = [
+            Material.objects.create(nombre=f'M{i}', codigo=f'M{i}', categoria=categoria, precio=1, cantidad=10)
+            for i in range(5)
+        ]
+        for estado, cantidad in (('pendiente', 2), ('pendiente', 3), ('efectuado', 7)):
+            pedido = Pedido.objects.create(user=self.user, cliente=cliente, estado=estado)
+            PedidoDetalle.objects.bulk_create([
+                PedidoDetalle(user=self.user, pedido=pedido, material=material, cantidad=cantidad)
+                for material in self.materiales[:3]
+            ])
+
+    def test_anotacion_suma_solo_pendientes(self):
+        cantidades = dict(
+            Material.objects.con_cantidad_en_pedidos().values_list('id', 'cantidad_en_pedidos')
+        )
+
+        self.assertEqual([cantidades[m.id] for m in self.materiales], [5, 5, 5, 0, 0])
+        self.assertEqual(self.materiales[0].get_cantidad_en_pedidos(), 5)
+
+    def test_comando_detecta_y_corrige_desviacion(self):
+        salida = io.StringIO()
+        call_command('verificar_cantidad_reservada', stdout=salida)
+        self.assertIn('3 materiales con desviación', salida.getvalue())
+
+        call_command('verificar_cantidad_reservada', '--corregir', stdout=io.StringIO())
+
+        self.assertEqual(
+            [m.cantidad_reservada for m in Material.objects.filter(id__in=[m.id for m in self.materiales]).order_by('id')],
+            [5, 5, 5, 0, 0]
+        )
+
+    def test_catalogo_no_consulta_por_material(self):
+        call_command('verificar_cantidad_reservada', '--corregir', stdout=io.StringIO())
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+        with CaptureQueriesContext(connection) as pocos:
+            self.client.get(reverse('inventario'))
+
+        categoria = self.materiales[0].categoria
+        for i in range(5, 25):
+            Material.objects.create(nombre=f'M{i}', codigo=f'M{i}', categoria=categoria, precio=1, cantidad=10)
+        with CaptureQueriesContext(connection) as muchos:
+            respuesta = self.client.get(reverse('inventario'))
+
+        self.assertContains(respuesta, 'En Pedidos Pendientes: 5')
+        self.assertEqual(len(pocos.captured_queries), len(muchos.captured_queries))
+
+
+class BusquedaCatalogoTests(TestCase):
+    def setUp(self):
+        self.plomeria = Categoria.objects.create(nombre='Plomería')
+        construccion = Categoria.objects.create(nombre='Construcción')
+        self.tuberia = Material.objects.create(nombre='Tubería PVC', codigo='TB-20', categoria=self.plomeria,
+                                               precio=1, cantidad=5)
+        self.codo = Material.objects.create(nombre='Codo 90', codigo='CD-90', categoria=self.plomeria,
+                                            precio=1, cantidad=5)
+        self.cemento = Material.objects.create(nombre='Cemento gris', codigo='CEM-1', categoria=construccion,
+                                               precio=1, cantidad=5)
+
+    def buscar(self, texto):
+        return list(buscar_materiales(Material.objects.all(), texto)
+                    .order_by('relevancia', 'nombre').values_list('nombre', flat=True))
+
+    def test_prefijos_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.buscar('TUBERI'), ['Tubería PVC'])
+        self.assertEqual(self.buscar('cem gri'), ['Cemento gris'])
+        self.assertEqual(self.buscar('cd-90'), ['Codo 90'])
+        self.assertEqual(self.buscar('"%*'), [])
+
+    def test_nombre_antes_que_categoria(self):
+        Material.objects.create(nombre='Llave de plomero', categoria=self.cemento.categoria, precio=1, cantidad=1)
+        self.assertEqual(self.buscar('plomer'), ['Llave de plomero', 'Codo 90', 'Tubería PVC'])
+
+    def test_indice_sigue_a_los_cambios(self):
+        self.tuberia.nombre = 'Manguera'
+        self.tuberia.save()
+        self.plomeria.nombre = 'Fontanería'
+        self.plomeria.save()
+        self.codo.delete()
+
+        self.assertEqual(self.buscar('tuberia'), [])
+        self.assertEqual(self.buscar('manguera'), ['Manguera'])
+        self.assertEqual(self.buscar('fontaneria'), ['Manguera'])
+
+    def test_catalogo_y_api(self):
+        respuesta = self.client.get(reverse('inventario'), {'search': 'tuberia'})
+        self.assertEqual([m.nombre for m in respuesta.context['materiales']], ['Tubería PVC'])
+
+        self.client.force_login(User.objects.create_user(username='gestor', password='clave'))
+        respuesta = self.client.get('/api/materiales/', {'search': 'codo'})
+        self.assertEqual([m['nombre'] for m in respuesta.json()['results']], ['Codo 90'])
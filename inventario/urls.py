@@ -1,10 +1,7 @@
 from django.urls import path
 
 from . import views
-from django.contrib.auth.decorators import user_passes_test
-
-def admin_required(view_func):
-    return user_passes_test(lambda u: u.is_authenticated and u.is_staff)(view_func)
+from autenticacion.permisos import admin_required
 
 urlpatterns = [
     path('', views.inventario, name='inventario'),
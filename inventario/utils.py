@@ -3,6 +3,7 @@ from django.conf import settings
 from django.core.files.storage import default_storage
 from django.db.models import F
 from .models import Material, MaterialImagen
+from .imagenes import rutas_variantes
 
 def limpiar_imagenes_huerfanas():
     """Elimina las imágenes que no están asociadas a ningún material"""
@@ -48,6 +49,12 @@ def limpiar_imagenes_huerfanas():
             print(f"Imagen secundaria en DB: {img_path}")
             print(f"Ruta alternativa: {img_path_alt}")
 
+    # Variantes generadas (miniatura, tarjeta, detalle) de ambas tablas
+    for modelo in (Material, MaterialImagen):
+        for variantes in modelo.objects.exclude(imagen_variantes={}).values_list('imagen_variantes', flat=True):
+            for ruta in rutas_variantes(variantes):
+                imagenes_db.add(ruta.replace('\\', '/'))
+
     # Encontrar y eliminar imágenes huérfanas
     total_eliminadas = 0
     for archivo in archivos_media:
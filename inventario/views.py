@@ -3,35 +3,39 @@ from django.contrib import messages
 
 from django.shortcuts import render, redirect
 from inventario.models import Categoria, Material, MaterialImagen
+from inventario.busqueda import buscar_materiales
+from inventario.imagenes import url_variante
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView
 from django.http import JsonResponse
-from django.db.models import Q
 from pedidos.models import PedidoDetalle
 from django.db.models import F
+from django.db import transaction
 from django.views.decorators.http import require_POST
-from django.contrib.auth.decorators import user_passes_test
+from autenticacion.permisos import superuser_required
 
 # Create your views here.
 def inventario(request):
     categoria_id = request.GET.get('categoria')
     search_query = request.GET.get('search', '')
+    stock = request.GET.get('stock', '')
     categorias = Categoria.objects.all()
     
     # Start with all active materials
-    materiales = Material.objects.filter(activo=True)
+    materiales = Material.objects.filter(activo=True).select_related('categoria')
     
     # Apply category filter if selected
     if categoria_id:
         materiales = materiales.filter(categoria_id=categoria_id)
     
-    # Apply search filter if provided
+    # Búsqueda en el índice de texto completo (nombre, código y categoría)
     if search_query:
-        materiales = materiales.filter(
-            Q(nombre__icontains=search_query) | 
-            Q(codigo__icontains=search_query)
-        )
+        materiales = buscar_materiales(materiales, search_query)
     
+    # Filtrar por stock disponible (cantidad ya descuenta lo reservado en pedidos pendientes)
+    if stock == 'disponible':
+        materiales = materiales.filter(cantidad__gt=0)
+
     # Order the materials based on multiple criteria using annotate and Case
     from django.db.models import Case, When, Value, IntegerField
     materiales = materiales.annotate(
@@ -49,12 +53,20 @@ def inventario(request):
         'categoria__nombre',  # Then by category name
         'nombre'  # Finally alphabetically
     )
+
+    # Al buscar, primero los resultados más relevantes
+    if search_query:
+        materiales = materiales.order_by('relevancia', 'order_priority', 'nombre')
+
+    if stock == 'mayor':
+        materiales = materiales.order_by('-cantidad', 'nombre')
     
     context = {
         'materiales': materiales,
         'categorias': categorias,
         'categoria_seleccionada': categoria_id,
-        'search_query': search_query
+        'search_query': search_query,
+        'stock_seleccionado': stock
     }
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -76,7 +88,9 @@ def editar_inventario(request):
     # Usar Case y When para ordenar como en la vista inventario
     from django.db.models import Case, When, Value, IntegerField
     
-    materiales = Material.objects.all().order_by('categoria', 'nombre')
+    materiales = Material.objects.select_related('categoria').prefetch_related(
+        'imagenes'
+    ).order_by('categoria', 'nombre')
     
     categoria_id = request.GET.get('categoria')
     search_query = request.GET.get('search', '')
@@ -86,10 +100,7 @@ def editar_inventario(request):
         materiales = materiales.filter(categoria_id=categoria_id)
     
     if search_query:
-        materiales = materiales.filter(
-            Q(nombre__icontains=search_query) |
-            Q(codigo__icontains=search_query)
-        )
+        materiales = buscar_materiales(materiales, search_query).order_by('relevancia', 'nombre')
 
     context = {
         'materiales': materiales,
@@ -179,38 +190,40 @@ def editar_material(request, material_id):
                 else:
                     material.ficha_tecnica = nueva_ficha
 
-            if 'imagenes_secundarias' in request.FILES:
-                imagenes_nuevas = request.FILES.getlist('imagenes_secundarias')
-                if any(img.size > 0 for img in imagenes_nuevas):
-                    for imagen in imagenes_nuevas:
-                        if imagen.size > 0:  # Solo procesar imágenes que realmente se subieron
-                            MaterialImagen.objects.create(
-                                material=material,
-                                imagen=imagen
-                            )
-
-            # Manejar estado de oferta y precio de oferta
-            material.en_oferta = request.POST.get('en_oferta') == 'on'
+            # Las imágenes nuevas se descartan si falla la validación de la oferta
+            with transaction.atomic():
+                if 'imagenes_secundarias' in request.FILES:
+                    imagenes_nuevas = request.FILES.getlist('imagenes_secundarias')
+                    if any(img.size > 0 for img in imagenes_nuevas):
+                        for imagen in imagenes_nuevas:
+                            if imagen.size > 0:  # Solo procesar imágenes que realmente se subieron
+                                MaterialImagen.objects.create(
+                                    material=material,
+                                    imagen=imagen
+                                )
+
+                # Manejar estado de oferta y precio de oferta
+                material.en_oferta = request.POST.get('en_oferta') == 'on'
             
-            # Solo procesar precio_oferta si está en oferta
-            if material.en_oferta:
-                precio_oferta_str = request.POST.get('precio_oferta', '').strip()
-                if precio_oferta_str:
-                    try:
-                        precio_oferta = float(precio_oferta_str)
-                        if precio_oferta < 0:
-                            raise ValueError("El precio de oferta no puede ser negativo")
-                        if precio_oferta >= material.precio:
-                            raise ValueError("El precio de oferta debe ser menor al precio regular")
-                        material.precio_oferta = precio_oferta
-                    except ValueError as e:
-                        raise ValueError("El precio de oferta debe ser un número válido y menor al precio regular")
+                # Solo procesar precio_oferta si está en oferta
+                if material.en_oferta:
+                    precio_oferta_str = request.POST.get('precio_oferta', '').strip()
+                    if precio_oferta_str:
+                        try:
+                            precio_oferta = float(precio_oferta_str)
+                            if precio_oferta < 0:
+                                raise ValueError("El precio de oferta no puede ser negativo")
+                            if precio_oferta >= material.precio:
+                                raise ValueError("El precio de oferta debe ser menor al precio regular")
+                            material.precio_oferta = precio_oferta
+                        except ValueError as e:
+                            raise ValueError("El precio de oferta debe ser un número válido y menor al precio regular")
+                    else:
+                        raise ValueError("Debe especificar un precio de oferta")
                 else:
-                    raise ValueError("Debe especificar un precio de oferta")
-            else:
-                material.precio_oferta = None
+                    material.precio_oferta = None
 
-            material.save()
+                material.save()
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
@@ -246,28 +259,29 @@ def editar_material(request, material_id):
 def crear_material(request):
     if request.method == 'POST':
         try:
-            # Crear nuevo material
-            material = Material.objects.create(
-                nombre=request.POST['nombre'],
-                codigo=request.POST.get('codigo'),
-                precio=float(request.POST['precio']),
-                comision=float(request.POST.get('comision', 0)),
-                cantidad=int(request.POST['cantidad']),
-                categoria_id=int(request.POST['categoria']),
-                imagen=request.FILES['imagen']
-            )
-            
-            # Procesar imágenes secundarias
-            for imagen in request.FILES.getlist('imagenes_secundarias'):
-                MaterialImagen.objects.create(
-                    material=material,
-                    imagen=imagen
+            with transaction.atomic():
+                # Crear nuevo material
+                material = Material.objects.create(
+                    nombre=request.POST['nombre'],
+                    codigo=request.POST.get('codigo'),
+                    precio=float(request.POST['precio']),
+                    comision=float(request.POST.get('comision', 0)),
+                    cantidad=int(request.POST['cantidad']),
+                    categoria_id=int(request.POST['categoria']),
+                    imagen=request.FILES['imagen']
                 )
             
-            # Procesar ficha técnica
-            if 'ficha_tecnica' in request.FILES:
-                material.ficha_tecnica = request.FILES['ficha_tecnica']
-                material.save()
+                # Procesar imágenes secundarias
+                for imagen in request.FILES.getlist('imagenes_secundarias'):
+                    MaterialImagen.objects.create(
+                        material=material,
+                        imagen=imagen
+                    )
+            
+                # Procesar ficha técnica
+                if 'ficha_tecnica' in request.FILES:
+                    material.ficha_tecnica = request.FILES['ficha_tecnica']
+                    material.save()
             
             return JsonResponse({
                 'status': 'success',
@@ -350,7 +364,7 @@ def toggle_destacado(request, material_id):
     try:
         material = Material.objects.get(id=material_id)
         material.destacado = not material.destacado
-        material.save()
+        material.save(update_fields=['destacado', 'updated'])
         return JsonResponse({
             'status': 'success',
             'destacado': material.destacado
@@ -366,7 +380,7 @@ def toggle_activo(request, material_id):
     try:
         material = Material.objects.get(id=material_id)
         material.activo = not material.activo
-        material.save()
+        material.save(update_fields=['activo', 'updated'])
         return JsonResponse({
             'status': 'success',
             'activo': material.activo
@@ -383,7 +397,7 @@ def material_imagenes(request, material_id):
     
     # Preparar datos para la respuesta
     data = {
-        'imagen_principal': material.imagen.url if material.imagen else None,
+        'imagen_principal': url_variante(material, 'detalle') if material.imagen else None,
         'imagenes_secundarias': []
     }
     
@@ -391,7 +405,7 @@ def material_imagenes(request, material_id):
     imagenes_secundarias = MaterialImagen.objects.filter(material=material)
     if imagenes_secundarias.exists():
         data['imagenes_secundarias'] = [
-            {'url': imagen.imagen.url} 
+            {'url': url_variante(imagen, 'detalle')} 
             for imagen in imagenes_secundarias
         ]
     
@@ -403,12 +417,9 @@ class MaterialListView(ListView):
     context_object_name = 'materiales'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        for material in queryset:
-            material.cantidad_en_pedidos = material.get_cantidad_en_pedidos()
-        return queryset
+        return super().get_queryset().con_cantidad_en_pedidos()
 
-@user_passes_test(lambda u: u.is_superuser)
+@superuser_required
 def crear_categoria(request):
     if request.method == 'POST':
         try:
@@ -440,7 +451,7 @@ def toggle_oferta(request, material_id):
         elif not material.en_oferta:
             material.precio_oferta = None
         
-        material.save()
+        material.save(update_fields=['en_oferta', 'precio_oferta', 'updated'])
         return JsonResponse({
             'status': 'success',
             'en_oferta': material.en_oferta,
@@ -459,7 +470,7 @@ def toggle_oferta(request, material_id):
         }, status=500)
 
 @require_POST
-@user_passes_test(lambda u: u.is_superuser)
+@superuser_required
 def editar_categoria(request, categoria_id):
     try:
         categoria = get_object_or_404(Categoria, id=categoria_id)
@@ -495,7 +506,7 @@ def editar_categoria(request, categoria_id):
         }, status=500)
 
 @require_POST
-@user_passes_test(lambda u: u.is_superuser)
+@superuser_required
 def eliminar_categoria(request, categoria_id):
     try:
         categoria = get_object_or_404(Categoria, id=categoria_id)
@@ -506,10 +517,11 @@ def eliminar_categoria(request, categoria_id):
         if materiales_count > 0:
             # Si hay confirmación para eliminar todo
             if request.POST.get('confirm_delete') == 'true':
-                # Eliminar los materiales asociados primero
-                Material.objects.filter(categoria=categoria).delete()
-                # Luego eliminar la categoría
-                categoria.delete()
+                with transaction.atomic():
+                    # Eliminar los materiales asociados primero
+                    Material.objects.filter(categoria=categoria).delete()
+                    # Luego eliminar la categoría
+                    categoria.delete()
                 return JsonResponse({
                     'status': 'success',
                     'message': 'Categoría y materiales asociados eliminados exitosamente'
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PedidosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pedidos'
+
+    def ready(self):
+        # Registrar las tareas en segundo plano de la app
+        from .task import programar_barrido_tras_migrar
+        post_migrate.connect(programar_barrido_tras_migrar, sender=self, dispatch_uid='pedidos_programar_barrido')
@@ -0,0 +1,253 @@
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from .models import PedidoDetalle
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar el diseño para no servir facturas cacheadas con el anterior
+VERSION_FACTURA = 2
+
+
+def rutas_logo():
+    """Ubicaciones donde puede estar el logo de los PDF, por orden de preferencia"""
+    carpetas = [
+        settings.STATIC_ROOT,
+        os.path.join(settings.BASE_DIR, 'static'),
+        os.path.join(settings.BASE_DIR, 'staticfiles'),
+        settings.MEDIA_ROOT,
+    ]
+    return [
+        os.path.join(carpeta, 'img', nombre)
+        for carpeta in carpetas if carpeta
+        for nombre in ('logo.jpg', 'logo.png')
+    ]
+
+
+@lru_cache(maxsize=None)
+def logo():
+    """
+    Logo de los PDF ya decodificado. Se busca y se carga una sola vez por
+    proceso; devuelve None si no está en ninguna ubicación o no se puede leer.
+    """
+    for ruta in rutas_logo():
+        if os.path.exists(ruta):
+            try:
+                imagen = ImageReader(ruta)
+                logger.info(f"Logo encontrado en: {ruta}")
+                return imagen
+            except Exception as e:
+                logger.error(f"Error al cargar el logo {ruta}: {str(e)}")
+                return None
+    logger.warning("No se encontró el archivo del logo en ninguna ubicación")
+    return None
+
+
+def version_factura(pedido):
+    """
+    Identifica el contenido de la factura: cambia al guardarse el pedido o su
+    cliente. No incluye el nombre ni el código de los materiales ni el nombre
+    del gestor: a propósito, una factura ya emitida conserva los que tenía al
+    generarse aunque después se renombren. El pedido debe venir con
+    select_related('cliente').
+    Returns:
+        Tupla (clave, última modificación)
+    """
+    modificado = max(pedido.updated_at, pedido.cliente.updated_at)
+    clave = (
+        f'{pedido.id}-{pedido.updated_at.timestamp():.6f}-'
+        f'{pedido.cliente.updated_at.timestamp():.6f}-v{VERSION_FACTURA}'
+    )
+    return clave, modificado
+
+
+def etag_factura(clave):
+    return f'"{hashlib.sha1(clave.encode()).hexdigest()}"'
+
+
+# Disposición de la página (puntos)
+ANCHO_LOGO = 252  # 180 * 1.4
+ALTO_LOGO = 126  # 90 * 1.4
+ALTO_FILA = 20
+Y_TABLA_PRIMERA_PAGINA = letter[1] - 260  # debajo del encabezado y los datos del cliente
+Y_TABLA_SIGUIENTES = letter[1] - 50
+MARGEN_INFERIOR = 70  # ninguna fila baja de aquí; debajo queda el número de página
+ALTO_TOTAL = 30  # la línea del total va 10 puntos y el importe 30 bajo la última fila
+
+
+def _plan_paginas(total_filas):
+    """
+    Reparte las filas de la tabla entre páginas.
+    Returns:
+        Tupla (posiciones, total) donde posiciones es la lista (página, y) de cada
+        fila y total el (página, y) de la línea del total
+    """
+    pagina, y = 1, Y_TABLA_PRIMERA_PAGINA - ALTO_FILA
+    posiciones = []
+    for _ in range(total_filas):
+        if y < MARGEN_INFERIOR:
+            pagina, y = pagina + 1, Y_TABLA_SIGUIENTES - ALTO_FILA
+        posiciones.append((pagina, y))
+        y -= ALTO_FILA
+    # El importe del total puede bajar una fila más que las líneas de la tabla
+    if y - ALTO_TOTAL < MARGEN_INFERIOR - ALTO_FILA:
+        pagina, y = pagina + 1, Y_TABLA_SIGUIENTES - ALTO_FILA
+    return posiciones, (pagina, y)
+
+
+def _dibujar_logo(p):
+    imagen = logo()
+    if imagen is None:
+        return
+    width, height = letter
+    try:
+        # Esquina superior derecha; mask='auto' respeta las transparencias
+        p.drawImage(imagen, width - ANCHO_LOGO - 40, height - ALTO_LOGO - 20,
+                    width=ANCHO_LOGO, height=ALTO_LOGO,
+                    preserveAspectRatio=True, mask='auto')
+    except Exception as e:
+        logger.error(f"Error al dibujar el logo: {str(e)}")
+
+
+def _dibujar_encabezado(p, pedido, titulo):
+    height = letter[1]
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(50, height - 50, titulo)
+    p.setFont("Helvetica", 12)
+    p.drawString(50, height - 70, f"Código: {pedido.codigo_unico}")
+    p.drawString(50, height - 90, f"Fecha: {pedido.created_at.strftime('%d/%m/%Y %H:%M:%S')}")
+    p.drawString(50, height - 110, f"Gestor: {pedido.user.get_full_name()}")
+
+    # Datos del cliente
+    p.drawString(50, height - 140, "Cliente:")
+    p.drawString(70, height - 160, f"Nombre: {pedido.cliente.get_full_name()}")
+    p.drawString(70, height - 180, f"CI: {pedido.cliente.carnet_identidad}")
+    p.drawString(70, height - 200, f"Teléfono: {pedido.cliente.telefono}")
+    p.drawString(70, height - 220, f"Transportista: {pedido.transportista or 'No especificado'}")
+
+
+def _dibujar_cabecera_tabla(p, y):
+    p.setFont("Helvetica", 12)
+    p.drawString(50, y, "Producto")
+    p.drawString(200, y, "Código")
+    p.drawString(300, y, "Cantidad")
+    p.drawString(380, y, "Precio Unit.")
+    p.drawString(460, y, "Total")
+
+
+def _dibujar_linea(p, y, detalle):
+    nombre_producto = f"(*) {detalle.material.nombre}" if detalle.en_oferta else detalle.material.nombre
+    p.drawString(50, y, nombre_producto)
+    p.drawString(200, y, str(detalle.material.codigo or 'N/A'))
+    p.drawString(300, y, str(detalle.cantidad))
+
+    if detalle.en_oferta:
+        # Precio de oferta en rojo con el precio regular tachado encima, más pequeño y en gris
+        p.setFillColorRGB(1, 0, 0)
+        p.drawString(380, y, f"${detalle.precio_unitario:.2f}")
+
+        p.setFont("Helvetica", 8)
+        p.setFillColorRGB(0.5, 0.5, 0.5)
+        precio_str = f"${detalle.precio_regular:.2f}"
+        p.drawString(380, y + 10, precio_str)
+        p.line(380, y + 12, 380 + p.stringWidth(precio_str, "Helvetica", 8), y + 12)
+
+        p.setFont("Helvetica", 12)
+        p.setFillColorRGB(0, 0, 0)
+    else:
+        p.drawString(380, y, f"${detalle.precio_unitario:.2f}")
+
+    p.drawString(460, y, f"${float(detalle.total):.2f}")
+
+
+def _dibujar_pie(p, pagina, total_paginas):
+    if total_paginas > 1:
+        p.setFont("Helvetica", 9)
+        p.drawRightString(letter[0] - 50, 30, f"Página {pagina} de {total_paginas}")
+        p.setFont("Helvetica", 12)
+
+
+def dibujar_documento(salida, pedido, titulo):
+    """
+    Escribe en salida (ruta o archivo binario) el PDF de un pedido: logo,
+    encabezado con los datos del cliente, tabla de líneas que continúa en
+    páginas nuevas repitiendo la cabecera, y total. Lo usan la factura y la
+    oferta. El pedido debe venir con select_related('user', 'cliente').
+    """
+    detalles = list(PedidoDetalle.objects.filter(pedido=pedido).select_related('material').order_by('id'))
+    posiciones, (pagina_total, y_total) = _plan_paginas(len(detalles))
+
+    p = canvas.Canvas(salida, pagesize=letter)
+    _dibujar_logo(p)
+    _dibujar_encabezado(p, pedido, titulo)
+    _dibujar_cabecera_tabla(p, Y_TABLA_PRIMERA_PAGINA)
+
+    pagina = 1
+    for detalle, (pagina_fila, y) in zip(detalles, posiciones):
+        if pagina_fila != pagina:
+            _dibujar_pie(p, pagina, pagina_total)
+            p.showPage()
+            pagina = pagina_fila
+            _dibujar_cabecera_tabla(p, Y_TABLA_SIGUIENTES)
+        _dibujar_linea(p, y, detalle)
+
+    if pagina_total != pagina:
+        _dibujar_pie(p, pagina, pagina_total)
+        p.showPage()
+        pagina = pagina_total
+    p.setFont("Helvetica", 12)
+    p.line(50, y_total - 10, 500, y_total - 10)
+    p.drawString(380, y_total - ALTO_TOTAL, "Total:")
+    p.drawString(460, y_total - ALTO_TOTAL, f"${float(pedido.total):.2f}")
+    _dibujar_pie(p, pagina, pagina_total)
+
+    p.showPage()
+    p.save()
+
+
+def ruta_factura(clave):
+    return os.path.join(settings.FACTURAS_CACHE_DIR, f'factura_{clave}.pdf')
+
+
+def factura_en_disco(pedido, clave):
+    """
+    Factura cacheada en FACTURAS_CACHE_DIR, abierta en modo binario; si no
+    existe se genera. Las versiones anteriores del mismo pedido se borran
+    después de abrir la nueva y nunca se toca la que se está sirviendo, así que
+    otro proceso que genere una versión distinta a la vez no deja esta sin archivo.
+    """
+    ruta = ruta_factura(clave)
+    try:
+        return open(ruta, 'rb')
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(settings.FACTURAS_CACHE_DIR, exist_ok=True)
+    # Escribir a un temporal y renombrar para que otro proceso nunca lea un PDF a medias
+    descriptor, temporal = tempfile.mkstemp(dir=settings.FACTURAS_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            dibujar_documento(archivo, pedido, "FACTURA")
+    except Exception:
+        os.remove(temporal)
+        raise
+    os.replace(temporal, ruta)
+    archivo = open(ruta, 'rb')
+
+    for anterior in glob.glob(ruta_factura(f'{pedido.id}-*')):
+        if anterior == ruta:
+            continue
+        try:
+            os.remove(anterior)
+        except OSError:
+            pass
+    return archivo
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pedidos.services import cancelar_pedidos_vencidos, estadisticas_barrido
+from pedidos.task import programar_barrido
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancela los pedidos pendientes vencidos. migrate ya deja el barrido programado '
+        'como tarea repetitiva de background_task (process_tasks); --programar '
+        'permite cambiar el intervalo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--programar', action='store_true',
+                            help='Programar el barrido periódico en lugar de ejecutarlo ahora')
+        parser.add_argument('--intervalo', type=int,
+                            default=getattr(settings, 'BARRIDO_PEDIDOS_SEGUNDOS', 300),
+                            help='Segundos entre barridos al programar')
+
+    def handle(self, *args, **options):
+        if options['programar']:
+            creada = programar_barrido(options['intervalo'])
+            accion = 'programado' if creada else 'actualizado'
+            self.stdout.write(self.style.SUCCESS(
+                f"Barrido de pedidos {accion} cada {options['intervalo']} s"
+            ))
+            return
+
+        metricas = cancelar_pedidos_vencidos()
+        if not metricas['activo']:
+            self.stdout.write('Cancelación automática desactivada')
+            return
+        totales = estadisticas_barrido()
+        self.stdout.write(self.style.SUCCESS(
+            f"{metricas['cancelados']} pedidos cancelados en {metricas['lotes']} lotes, "
+            f"{metricas['duracion_ms']} ms (acumulado: {totales['cancelados']} en "
+            f"{totales['ejecuciones']} barridos)"
+        ))
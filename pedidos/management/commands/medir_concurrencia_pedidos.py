@@ -0,0 +1,157 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.urls import reverse
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from pedidos.models import Pedido
+
+
+class Command(BaseCommand):
+    help = ('Lanza N gestores en paralelo creando pedidos con prosesar_pedido, opcionalmente '
+            'con lectores consultando el catálogo y la lista de pedidos a la vez, y mide '
+            'latencia, peticiones por segundo y errores "database is locked". '
+            'Escribe en la base de datos configurada y borra sus datos al terminar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trabajadores', type=int, default=8,
+                            help='Gestores creando pedidos a la vez')
+        parser.add_argument('--pedidos', type=int, default=25,
+                            help='Pedidos por trabajador')
+        parser.add_argument('--lectores', type=int, default=0,
+                            help='Hilos leyendo el catálogo y la lista de pedidos mientras se escribe')
+        parser.add_argument('--atomic-requests', action='store_true',
+                            help='Envuelve cada petición en una transacción (comportamiento anterior)')
+
+    def _preparar(self, trabajadores):
+        categoria = Categoria.objects.create(nombre='__medir_concurrencia__')
+        materiales = [
+            Material.objects.create(nombre=f'Medición {i}', codigo=f'__MC{i}', categoria=categoria,
+                                    precio=10, cantidad=1_000_000)
+            for i in range(5)
+        ]
+        gestores = []
+        for i in range(trabajadores):
+            user = User.objects.create_user(username=f'__medir_concurrencia_{i}__', password=None)
+            cliente = Cliente.objects.create(user=user, nombre='Medición', apellidos='Concurrencia',
+                                             carnet_identidad=f'{99000000000 + i}', telefono='0')
+            gestores.append((user, cliente))
+        return categoria, materiales, gestores
+
+    def _cliente_http(self, user):
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        return client
+
+    def _lector(self, user, terminado):
+        client = self._cliente_http(user)
+        urls = [reverse('inventario'), reverse('pedidos:lista_pedidos')]
+        tiempos, errores = [], []
+        try:
+            while not terminado.is_set():
+                for url in urls:
+                    inicio = time.perf_counter()
+                    try:
+                        respuesta = client.get(url)
+                        if respuesta.status_code != 200:
+                            errores.append(f'HTTP {respuesta.status_code}')
+                    except Exception as e:
+                        errores.append(str(e))
+                    tiempos.append(time.perf_counter() - inicio)
+        finally:
+            connection.close()
+        return tiempos, errores
+
+    def _trabajador(self, user, cliente, materiales, pedidos):
+        client = self._cliente_http(user)
+        carro = {
+            str(material.id): {'material_id': material.id, 'nombre': material.nombre,
+                               'precio_unitario': 10.0, 'precio': 20.0, 'cantidad': 2}
+            for material in materiales
+        }
+        datos = {'nombre_cliente': cliente.nombre, 'apellidos_cliente': cliente.apellidos,
+                 'carnet_identidad_cliente': cliente.carnet_identidad,
+                 'telefono_cliente': cliente.telefono}
+        tiempos, errores = [], []
+        try:
+            for _ in range(pedidos):
+                sesion = client.session
+                sesion['carro'] = carro
+                sesion.save()
+                inicio = time.perf_counter()
+                try:
+                    respuesta = client.post(reverse('pedidos:prosesar_pedido'), datos)
+                    if respuesta.status_code != 302:
+                        # La vista captura el error y vuelve a mostrar el formulario
+                        errores.append('database is locked' if b'database is locked' in respuesta.content
+                                       else f'HTTP {respuesta.status_code}')
+                except Exception as e:
+                    errores.append(str(e))
+                tiempos.append(time.perf_counter() - inicio)
+        finally:
+            connection.close()
+        return tiempos, errores
+
+    def _resumen(self, nombre, resultados, duracion):
+        tiempos = sorted(t for resultado in resultados for t in resultado[0])
+        errores = [e for resultado in resultados for e in resultado[1]]
+        if not tiempos:
+            return
+        bloqueos = sum('locked' in e for e in errores)
+        self.stdout.write(
+            f'{nombre}: {len(tiempos)} peticiones ({len(tiempos) / duracion:.1f}/s), '
+            f'p50 {statistics.median(tiempos) * 1000:.0f} ms, '
+            f'p95 {tiempos[int(len(tiempos) * 0.95) - 1] * 1000:.0f} ms, '
+            f'máx {tiempos[-1] * 1000:.0f} ms, '
+            f'{len(errores)} errores ({bloqueos} "database is locked")'
+        )
+
+    def handle(self, *args, **options):
+        trabajadores = options['trabajadores']
+        pedidos = options['pedidos']
+        lectores = options['lectores']
+        # Las conexiones de cada hilo se crean a partir de este mismo diccionario
+        connections.settings[DEFAULT_DB_ALIAS]['ATOMIC_REQUESTS'] = options['atomic_requests']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            modo = cursor.fetchone()[0]
+        self.stdout.write(
+            f"journal_mode={modo}, ATOMIC_REQUESTS={options['atomic_requests']}, "
+            f"PRAGMAs={getattr(settings, 'SQLITE_PRAGMAS', {})}"
+        )
+
+        categoria, materiales, gestores = self._preparar(trabajadores)
+        try:
+            terminado = threading.Event()
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=trabajadores + lectores) as ejecutor:
+                lecturas = [ejecutor.submit(self._lector, gestores[i % trabajadores][0], terminado)
+                            for i in range(lectores)]
+                escrituras = list(ejecutor.map(
+                    lambda gestor: self._trabajador(*gestor, materiales, pedidos), gestores
+                ))
+                terminado.set()
+                lecturas = [futuro.result() for futuro in lecturas]
+            duracion = time.perf_counter() - inicio
+
+            creados = Pedido.objects.filter(user__in=[user for user, _ in gestores]).count()
+            self.stdout.write(
+                f'{trabajadores} trabajadores x {pedidos} pedidos: {creados} creados en {duracion:.2f} s '
+                f'({creados / duracion:.1f} pedidos/s)'
+            )
+            self._resumen('Escrituras', escrituras, duracion)
+            self._resumen('Lecturas', lecturas, duracion)
+        finally:
+            Pedido.objects.filter(user__in=[user for user, _ in gestores]).delete()
+            User.objects.filter(id__in=[user.id for user, _ in gestores]).delete()
+            Material.objects.filter(categoria=categoria).delete()
+            categoria.delete()
+            connections.close_all()
@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from pedidos.services import crear_pedido
+
+
+class Command(BaseCommand):
+    help = ('Mide consultas y tiempo de crear_pedido según el número de líneas del carro '
+            '(los datos se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, nargs='+', default=[1, 10, 100],
+                            help='Tamaños de carro a medir')
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Pedidos creados por cada tamaño')
+
+    def handle(self, *args, **options):
+        tamanos = options['lineas']
+        repeticiones = options['repeticiones']
+
+        with transaction.atomic():
+            admin = User.objects.create_superuser(username='__medir_crear_pedido__', password=None)
+            cliente = Cliente.objects.create(
+                user=admin, nombre='Medición', apellidos='Pedido',
+                carnet_identidad='00000000000', telefono='0'
+            )
+            categoria = Categoria.objects.create(nombre='__medir_crear_pedido__')
+            # Stock suficiente para todas las repeticiones de todos los tamaños
+            materiales = Material.objects.bulk_create(
+                Material(nombre=f'Medición {i}', codigo=f'__medir_{i}', categoria=categoria,
+                         precio=10, comision=1, cantidad=len(tamanos) * repeticiones)
+                for i in range(max(tamanos))
+            )
+
+            for total in tamanos:
+                carro = {
+                    str(material.id): {
+                        'material_id': material.id,
+                        'nombre': material.nombre,
+                        'precio_unitario': 10.0,
+                        'precio': 10.0,
+                        'cantidad': 1,
+                        'en_oferta': False,
+                        'precio_regular': 10.0,
+                    }
+                    for material in materiales[:total]
+                }
+                tiempos = []
+                for _ in range(repeticiones):
+                    with CaptureQueriesContext(connection) as consultas:
+                        inicio = time.perf_counter()
+                        pedido, fallos = crear_pedido(admin, cliente, carro)
+                        tiempos.append(time.perf_counter() - inicio)
+                    if fallos:
+                        self.stderr.write('; '.join(fallo['mensaje'] for fallo in fallos))
+                        transaction.set_rollback(True)
+                        return
+                self.stdout.write(
+                    f'{total} líneas: {min(tiempos) * 1000:.1f} ms (mínimo de {repeticiones}), '
+                    f'{len(consultas.captured_queries)} consultas'
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,97 @@
+import glob
+import os
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from pedidos.facturas import logo
+from pedidos.models import Pedido, PedidoDetalle
+from pedidos.views import generar_factura
+
+
+class Command(BaseCommand):
+    help = ('Crea un pedido efectuado de prueba y mide la descarga de su factura sin caché, '
+            'desde la caché en disco y revalidada con ETag (los datos se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=30,
+                            help='Líneas del pedido de prueba')
+        parser.add_argument('--repeticiones', type=int, default=20,
+                            help='Descargas medidas en cada escenario')
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        carpeta = tempfile.mkdtemp()
+
+        with transaction.atomic(), override_settings(FACTURAS_CACHE_DIR=carpeta):
+            admin = User.objects.create_superuser(username='__medir_facturas__', password=None)
+            cliente = Cliente.objects.create(
+                user=admin, nombre='Medición', apellidos='Facturas',
+                carnet_identidad='00000000000', telefono='0'
+            )
+            categoria = Categoria.objects.create(nombre='__medir_facturas__')
+            materiales = Material.objects.bulk_create([
+                Material(nombre=f'Material {i}', codigo=f'MF{i}', categoria=categoria,
+                         precio=10, comision=1, cantidad=100)
+                for i in range(options['lineas'])
+            ])
+            pedido = Pedido.objects.create(user=admin, cliente=cliente, estado='efectuado', total=0)
+            PedidoDetalle.objects.bulk_create([
+                PedidoDetalle(pedido=pedido, user=admin, material=material, cantidad=2,
+                              precio_unitario=10, precio_regular=10, en_oferta=i % 3 == 0, total=20)
+                for i, material in enumerate(materiales)
+            ])
+
+            factory = RequestFactory()
+
+            def descargar(**cabeceras):
+                request = factory.get(f'/pedidos/factura/{pedido.id}/', **cabeceras)
+                request.user = admin
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    response = generar_factura(request, pedido.id)
+                    if response.streaming:
+                        # Incluir el envío del archivo, que FileResponse hace después de la vista
+                        b''.join(response.streaming_content)
+                    duracion = time.perf_counter() - inicio
+                if response.streaming:
+                    # response.close() emitiría request_finished y cerraría la conexión
+                    response.file_to_stream.close()
+                return duracion, len(consultas.captured_queries), response
+
+            logo.cache_clear()
+            primera, _, response = descargar()
+            self.stdout.write(f'Primera descarga del proceso (incluye cargar el logo): {primera * 1000:.1f} ms')
+
+            def medir(nombre, antes=None, **cabeceras):
+                tiempos = []
+                for _ in range(repeticiones):
+                    if antes:
+                        antes()
+                    duracion, consultas, respuesta = descargar(**cabeceras)
+                    tiempos.append(duracion)
+                self.stdout.write(
+                    f'{nombre}: mediana {statistics.median(tiempos) * 1000:.2f} ms, '
+                    f'máximo {max(tiempos) * 1000:.2f} ms, {consultas} consultas, HTTP {respuesta.status_code}'
+                )
+
+            def vaciar():
+                for ruta in glob.glob(os.path.join(carpeta, '*.pdf')):
+                    os.remove(ruta)
+
+            medir('Sin caché (genera el PDF)', antes=vaciar)
+            medir('Caché en disco')
+            medir('Revalidación con ETag', HTTP_IF_NONE_MATCH=response['ETag'])
+
+            transaction.set_rollback(True)
+
+        for ruta in glob.glob(os.path.join(carpeta, '*')):
+            os.remove(ruta)
+        os.rmdir(carpeta)
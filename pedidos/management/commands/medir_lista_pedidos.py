@@ -0,0 +1,58 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from clientes.models import Cliente
+from pedidos.models import Pedido
+from pedidos.views import lista_pedidos
+
+
+class Command(BaseCommand):
+    help = ('Crea pedidos de prueba y mide el coste de la lista de pedidos al principio, '
+            'en medio y al final (los datos se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=100000,
+                            help='Número de pedidos a generar')
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Veces que se pide cada página')
+
+    def handle(self, *args, **options):
+        total = options['pedidos']
+        repeticiones = options['repeticiones']
+
+        with transaction.atomic():
+            admin = User.objects.create_superuser(username='__medir_lista_pedidos__', password=None)
+            cliente = Cliente.objects.create(
+                user=admin, nombre='Medición', apellidos='Lista',
+                carnet_identidad='00000000000', telefono='0'
+            )
+            Pedido.objects.bulk_create(
+                (Pedido(user=admin, cliente=cliente, total=10) for _ in range(total)),
+                batch_size=5000
+            )
+            ids = list(Pedido.objects.filter(user=admin).order_by('-id').values_list('id', flat=True))
+            self.stdout.write(f'{len(ids)} pedidos creados')
+
+            factory = RequestFactory()
+            cursores = [('primera', None), ('media', ids[len(ids) // 2]), ('última', ids[-51] if len(ids) > 51 else None)]
+            for nombre, cursor in cursores:
+                request = factory.get('/pedidos/lista/', {'despues': cursor} if cursor else {},
+                                      HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                request.user = admin
+                request.session = {}
+                tiempos = []
+                for _ in range(repeticiones):
+                    with CaptureQueriesContext(connection) as consultas:
+                        inicio = time.perf_counter()
+                        lista_pedidos(request)
+                        tiempos.append(time.perf_counter() - inicio)
+                self.stdout.write(
+                    f'Página {nombre}: {min(tiempos) * 1000:.1f} ms (mínimo de {repeticiones}), '
+                    f'{len(consultas.captured_queries)} consultas'
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from pedidos.models import VentaMensualMaterial
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el acumulado mensual de ventas por material desde los pedidos efectuados'
+
+    def handle(self, *args, **options):
+        filas = VentaMensualMaterial.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{filas} filas de ventas mensuales generadas'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:15
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copiar_comision_actual(apps, schema_editor):
+    """Congela en los detalles existentes la comisión actual de su material"""
+    PedidoDetalle = apps.get_model('pedidos', 'PedidoDetalle')
+    Material = apps.get_model('inventario', 'Material')
+    PedidoDetalle.objects.filter(comision_unitaria__isnull=True).update(
+        comision_unitaria=Subquery(
+            Material.objects.filter(id=OuterRef('material_id')).values('comision')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0006_material_cantidad_reservada'),
+        ('pedidos', '0006_alter_pedido_estado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidodetalle',
+            name='comision_unitaria',
+            field=models.FloatField(blank=True, null=True, verbose_name='Comisión Unitaria Usada'),
+        ),
+        migrations.RunPython(copiar_comision_actual, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def llenar_ventas_mensuales(apps, schema_editor):
+    """Carga inicial del acumulado desde los pedidos efectuados existentes"""
+    PedidoDetalle = apps.get_model('pedidos', 'PedidoDetalle')
+    VentaMensualMaterial = apps.get_model('pedidos', 'VentaMensualMaterial')
+    filas = (
+        PedidoDetalle.objects.filter(pedido__estado='efectuado')
+        .annotate(mes=TruncMonth('pedido__created_at', output_field=models.DateField()))
+        .values('material_id', 'mes')
+        .annotate(unidades=Sum('cantidad'), ingresos=Sum('total'), stock_cierre=F('material__cantidad'))
+        .order_by()
+    )
+    VentaMensualMaterial.objects.bulk_create([VentaMensualMaterial(**fila) for fila in filas], batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0006_material_cantidad_reservada'),
+        ('pedidos', '0007_pedidodetalle_comision_unitaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaMensualMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mes')),
+                ('unidades', models.IntegerField(default=0, verbose_name='Unidades vendidas')),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Ingresos')),
+                ('stock_cierre', models.IntegerField(default=0, verbose_name='Stock al cierre')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventario.material')),
+            ],
+            options={
+                'verbose_name': 'Venta mensual de material',
+                'verbose_name_plural': 'Ventas mensuales de materiales',
+                'db_table': 'ventas_mensuales_material',
+                'constraints': [models.UniqueConstraint(fields=('material', 'mes'), name='venta_mensual_material_unica')],
+            },
+        ),
+        migrations.RunPython(llenar_ventas_mensuales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_cliente_cliente_user_creado_idx'),
+        ('inventario', '0007_material_material_activo_categoria_idx'),
+        ('pedidos', '0008_ventamensualmaterial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['user', 'estado'], name='pedido_user_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'created_at'], name='pedido_estado_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['user', 'created_at'], name='pedido_user_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidodetalle',
+            index=models.Index(fields=['material', 'pedido'], name='detalle_material_pedido_idx'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Prefetch, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from clientes.models import Cliente
+from gestorapp.kpis import invalidar_kpis
 from inventario.models import Material
 import uuid
 from django.contrib.auth.decorators import login_required
@@ -11,6 +15,81 @@ from django.db import transaction
 
 User = get_user_model()
 
+
+def expresion_comision(prefijo=''):
+    """
+    Comisión de una línea de pedido en SQL: cantidad por la comisión guardada en
+    el detalle o, para detalles anteriores a ese campo, la comisión del material.
+    """
+    return ExpressionWrapper(
+        F(f'{prefijo}cantidad') * Coalesce(F(f'{prefijo}comision_unitaria'), F(f'{prefijo}material__comision')),
+        output_field=FloatField()
+    )
+
+
+class PedidoQuerySet(models.QuerySet):
+    def con_reactivaciones(self):
+        """
+        Anota total_reactivaciones y precarga los ids de las reactivaciones,
+        para que las listas no consulten reactivaciones por cada fila.
+        """
+        reactivaciones = (
+            Pedido.objects.filter(pedido_original=OuterRef('pk'))
+            .order_by()
+            .values('pedido_original')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return self.annotate(
+            total_reactivaciones=Coalesce(Subquery(reactivaciones), 0)
+        ).prefetch_related(
+            Prefetch('reactivaciones', queryset=Pedido.objects.only('id', 'pedido_original_id'))
+        )
+
+    def con_comision(self):
+        """
+        Anota comision_anotada con la comisión de cada pedido calculada en la
+        misma consulta; la propiedad comision_total la usa si está presente.
+        """
+        comisiones = (
+            PedidoDetalle.objects.filter(pedido=OuterRef('pk'))
+            .order_by()
+            .values('pedido')
+            .annotate(total=Sum(expresion_comision()))
+            .values('total')
+        )
+        return self.annotate(
+            comision_anotada=Coalesce(Subquery(comisiones), 0, output_field=FloatField())
+        )
+
+    def cantidades_por_material(self):
+        """Cantidades de todos los pedidos del queryset agrupadas por material: {material_id: cantidad}"""
+        return dict(
+            PedidoDetalle.objects.filter(pedido__in=self)
+            .order_by()
+            .values('material_id')
+            .annotate(total=Sum('cantidad'))
+            .values_list('material_id', 'total')
+        )
+
+    def liberar_stock(self):
+        """
+        Devuelve al inventario el stock reservado por los pedidos pendientes del
+        queryset: una consulta agrupa las cantidades por material y un único
+        UPDATE las suma. Debe llamarse dentro de la transacción que cambia el
+        estado de los pedidos o los elimina.
+        Returns:
+            Número de materiales actualizados
+        """
+        return Material.liberar_stock(self.filter(estado='pendiente').cantidades_por_material())
+
+    def con_detalles(self):
+        """Precarga los detalles de cada pedido junto con su material"""
+        return self.prefetch_related(
+            Prefetch('pedidodetalle_set', queryset=PedidoDetalle.objects.select_related('material'))
+        )
+
+
 class Pedido(models.Model):
     ESTADOS = [
         ('pendiente', 'Pendiente'),
@@ -50,6 +129,8 @@ class Pedido(models.Model):
     )
     numero_reactivacion = models.IntegerField(default=0)
 
+    objects = PedidoQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if self.pedido_original:
             # Contar el número de reactivaciones previas
@@ -64,6 +145,15 @@ class Pedido(models.Model):
         verbose_name = 'pedido'
         verbose_name_plural = 'pedidos'
         ordering = ['id']
+        indexes = [
+            # Lista de pedidos del gestor filtrada por estado; SQLite añade el rowid
+            # al índice, así que el ORDER BY id DESC de la paginación sale del índice
+            models.Index(fields=['user', 'estado'], name='pedido_user_estado_idx'),
+            # Cancelación de pendientes antiguos: estado='pendiente' AND created_at <= límite
+            models.Index(fields=['estado', 'created_at'], name='pedido_estado_creado_idx'),
+            # ¿Tiene el gestor pedidos desde una fecha? (KPIs de inicio)
+            models.Index(fields=['user', 'created_at'], name='pedido_user_creado_idx'),
+        ]
 
     def actualizar_cantidades_material(self):
         """Actualiza las cantidades de materiales cuando se efectúa un pedido"""
@@ -82,13 +172,57 @@ class Pedido(models.Model):
             return False
 
     def efectuar(self):
+        """
+        Efectúa el pedido si sigue pendiente en la base de datos. El cambio de
+        estado es un UPDATE condicional, así que si el barrido u otra petición lo
+        canceló después de cargarlo no se confirma una reserva ya devuelta.
+        Returns:
+            True si el pedido pasó a efectuado
+        """
         with transaction.atomic():
-            self.estado = 'efectuado'
+            ahora = timezone.now()
+            if not Pedido.objects.filter(pk=self.pk, estado='pendiente').update(estado='efectuado', updated_at=ahora):
+                self.refresh_from_db(fields=['estado', 'updated_at'])
+                return False
+            self.estado, self.updated_at = 'efectuado', ahora
+            # El stock ya se descontó al crear el pedido; solo deja de estar reservado
+            Material.confirmar_reserva(self.cantidades_por_material())
+            VentaMensualMaterial.acumular(self)
+            invalidar_kpis()
+        return True
+
+    def cancelar(self):
+        """Cancela un pedido pendiente devolviendo su stock al inventario"""
+        with transaction.atomic():
+            anterior = self.estado
+            if anterior == 'pendiente':
+                self.liberar_stock()
+            self.estado = 'cancelado'
             self.save()
+            if anterior == 'efectuado':
+                VentaMensualMaterial.acumular(self, signo=-1)
+                invalidar_kpis()
+
+    def liberar_stock(self):
+        """Devuelve al inventario el stock del pedido si sigue pendiente en la base de datos"""
+        return Pedido.objects.filter(pk=self.pk).liberar_stock()
+
+    def cantidades_por_material(self):
+        """Cantidades del pedido agrupadas por material: {material_id: cantidad}"""
+        return dict(
+            self.pedidodetalle_set.values('material_id')
+            .annotate(total=models.Sum('cantidad'))
+            .values_list('material_id', 'total')
+        )
 
     @property
     def comision_total(self):
-        """Calcula la comisión total del pedido basada en los detalles"""
+        """
+        Comisión total del pedido; usa la anotación de con_comision() si está
+        presente y si no la calcula a partir de los detalles.
+        """
+        if hasattr(self, 'comision_anotada'):
+            return self.comision_anotada
         return sum(detalle.comision for detalle in self.pedidodetalle_set.all())
     
 class PedidoDetalle(models.Model):
@@ -101,10 +235,13 @@ class PedidoDetalle(models.Model):
     precio_unitario = models.FloatField(verbose_name='Precio Unitario Usado', null=True, blank=True)
     en_oferta = models.BooleanField(default=False)
     precio_regular = models.FloatField(verbose_name='Precio Regular', null=True, blank=True)
+    comision_unitaria = models.FloatField(verbose_name='Comisión Unitaria Usada', null=True, blank=True)
     
     @property
     def comision(self):
-        """Calcula la comisión para este detalle"""
+        """Calcula la comisión para este detalle con la comisión vigente al crearlo"""
+        if self.comision_unitaria is not None:
+            return self.cantidad * self.comision_unitaria
         if self.material and self.material.comision:
             return self.cantidad * self.material.comision
         return 0
@@ -122,6 +259,102 @@ class PedidoDetalle(models.Model):
         db_table = 'pedidosdetalle'
         verbose_name = 'Detalle de pedido'
         verbose_name_plural = 'Detalles de pedidos'
+        indexes = [
+            # Unidades en pedidos de un material: se recorre el índice y se une con
+            # pedidos por pedido_id sin leer las filas de detalle
+            models.Index(fields=['material', 'pedido'], name='detalle_material_pedido_idx'),
+        ]
+
+class VentaMensualMaterial(models.Model):
+    """
+    Acumulado de ventas efectuadas por material y mes (mes de creación del
+    pedido). Se mantiene al efectuar o cancelar pedidos y se puede reconstruir
+    con el comando reconstruir_ventas_mensuales.
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE)
+    mes = models.DateField(verbose_name='Mes')
+    unidades = models.IntegerField(default=0, verbose_name='Unidades vendidas')
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Ingresos')
+    stock_cierre = models.IntegerField(default=0, verbose_name='Stock al cierre')
+
+    class Meta:
+        db_table = 'ventas_mensuales_material'
+        verbose_name = 'Venta mensual de material'
+        verbose_name_plural = 'Ventas mensuales de materiales'
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'mes'], name='venta_mensual_material_unica'),
+        ]
+
+    @property
+    def stock_total(self):
+        """Stock disponible en el mes: lo que quedó al cierre más lo vendido"""
+        return self.stock_cierre + self.unidades
+
+    @property
+    def porcentaje_ventas(self):
+        return 100 * self.unidades / self.stock_total if self.stock_total else 0
+
+    @staticmethod
+    def mes_de(pedido):
+        return timezone.localtime(pedido.created_at).date().replace(day=1)
+
+    @classmethod
+    def acumular(cls, pedido, signo=1):
+        """
+        Suma (signo=1) o resta (signo=-1) las líneas del pedido en el mes del
+        pedido con UPDATE incrementales, sin recalcular el mes completo.
+        Debe llamarse después de escribir el pedido dentro de la misma transacción
+        para que SQLite ya tenga el bloqueo de escritura.
+        """
+        lineas = {
+            fila['material_id']: fila
+            for fila in pedido.pedidodetalle_set.values('material_id')
+            .annotate(unidades=Sum('cantidad'), ingresos=Sum('total'))
+        }
+        if not lineas:
+            return
+
+        mes = cls.mes_de(pedido)
+        filas_mes = cls.objects.filter(mes=mes, material_id__in=list(lineas))
+        with transaction.atomic():
+            existentes = set(filas_mes.values_list('material_id', flat=True))
+            if existentes:
+                filas_mes.filter(material_id__in=existentes).update(
+                    unidades=F('unidades') + Case(
+                        *[When(material_id=m, then=Value(signo * lineas[m]['unidades'])) for m in existentes],
+                        output_field=models.IntegerField()
+                    ),
+                    ingresos=F('ingresos') + Case(
+                        *[When(material_id=m, then=Value(signo * lineas[m]['ingresos'])) for m in existentes],
+                        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+                    ),
+                )
+            cls.objects.bulk_create([
+                cls(material_id=m, mes=mes, unidades=signo * fila['unidades'], ingresos=signo * fila['ingresos'])
+                for m, fila in lineas.items() if m not in existentes
+            ])
+            filas_mes.update(stock_cierre=Subquery(
+                Material.objects.filter(id=OuterRef('material_id')).values('cantidad')[:1]
+            ))
+            if signo < 0:
+                filas_mes.filter(unidades__lte=0).delete()
+
+    @classmethod
+    def reconstruir(cls):
+        """Recalcula toda la tabla desde los pedidos efectuados"""
+        filas = (
+            PedidoDetalle.objects.filter(pedido__estado='efectuado')
+            .annotate(mes=TruncMonth('pedido__created_at', output_field=models.DateField()))
+            .values('material_id', 'mes')
+            .annotate(unidades=Sum('cantidad'), ingresos=Sum('total'), stock_cierre=F('material__cantidad'))
+            .order_by()
+        )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            return len(cls.objects.bulk_create(
+                [cls(**fila) for fila in filas.iterator()], batch_size=500
+            ))
+
 
 class ConfiguracionPedidos(models.Model):
     tiempo_eliminacion = models.IntegerField(
@@ -163,8 +396,7 @@ def efectuar_pedido(request, pedido_id):
                     raise ValueError(f"Stock insuficiente para {detalle.material.nombre}")
 
             # Actualizar estado del pedido
-            pedido.estado = 'efectuado'
-            pedido.save()
+            pedido.efectuar()
             
             # No es necesario llamar a actualizar_cantidades_material() 
             # porque el stock ya se restó cuando se creó el pedido
@@ -0,0 +1,289 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from gestorapp.contadores import sumar_en_cache
+from gestorapp.kpis import invalidar_kpis
+from inventario.models import Material, StockInsuficiente
+from .models import ConfiguracionPedidos, Pedido, PedidoDetalle, VentaMensualMaterial
+
+logger = logging.getLogger(__name__)
+
+# Detalles por INSERT: con sus 11 columnas quedan por debajo del límite de 999
+# parámetros por consulta de SQLite
+DETALLES_POR_INSERT = 80
+
+CLAVE_ULTIMO_BARRIDO = 'pedidos:barrido:ultimo'
+CLAVE_TOTAL_CANCELADOS = 'pedidos:barrido:cancelados'
+CLAVE_TOTAL_BARRIDOS = 'pedidos:barrido:ejecuciones'
+
+
+def _validar_lineas(lineas, materiales):
+    """
+    Compara las cantidades pedidas contra el stock cargado en memoria
+    Returns:
+        Lista de fallos por línea (vacía si todas las líneas tienen stock)
+    """
+    fallos = []
+    for material_id, cantidad in lineas.items():
+        material = materiales.get(material_id)
+        if material is None:
+            fallos.append({
+                'material_id': material_id,
+                'cantidad': cantidad,
+                'disponible': 0,
+                'mensaje': f"El material {material_id} ya no existe"
+            })
+        elif material.cantidad < cantidad:
+            fallos.append({
+                'material_id': material_id,
+                'cantidad': cantidad,
+                'disponible': material.cantidad,
+                'mensaje': f"No hay suficiente stock de {material.nombre}"
+            })
+    return fallos
+
+
+def crear_pedido(user, cliente, items_carro, transportista=None):
+    """
+    Crea un pedido pendiente a partir de los items del carro y descuenta el stock
+    Args:
+        items_carro: diccionario del carro en sesión {material_id: {...}}
+    Returns:
+        Tupla (pedido, fallos). Si hay fallos el pedido es None y no se escribe nada.
+    """
+    lineas = {}
+    for key, value in items_carro.items():
+        material_id = int(key)
+        lineas[material_id] = lineas.get(material_id, 0) + int(value['cantidad'])
+
+    if not lineas:
+        return None, [{'material_id': None, 'cantidad': 0, 'disponible': 0,
+                       'mensaje': "El carro está vacío"}]
+
+    with transaction.atomic():
+        # Una sola consulta para todos los materiales del carro
+        materiales = Material.objects.select_for_update().in_bulk(list(lineas))
+
+        fallos = _validar_lineas(lineas, materiales)
+        if fallos:
+            return None, fallos
+
+        try:
+            with transaction.atomic():
+                reservados, fallidos = Material.reservar_stock(lineas)
+                if fallidos:
+                    raise StockInsuficiente()
+        except StockInsuficiente:
+            # Otro pedido consumió stock entre la lectura y el UPDATE
+            materiales = Material.objects.in_bulk(list(lineas))
+            fallos = _validar_lineas(lineas, materiales)
+            # Sin pedido siempre hay fallos, aunque al releer el stock ya alcance
+            return None, fallos or [{'material_id': None, 'cantidad': 0, 'disponible': 0,
+                                     'mensaje': "El stock cambió mientras se creaba el pedido, inténtelo de nuevo"}]
+
+        detalles = []
+        total_pedido = 0
+        for key, value in items_carro.items():
+            cantidad = int(value['cantidad'])
+            # Usar el precio que estaba en el carro
+            precio_unitario = float(value['precio_unitario'])
+            subtotal = precio_unitario * cantidad
+
+            detalles.append(PedidoDetalle(
+                material=materiales[int(key)],
+                cantidad=cantidad,
+                precio_unitario=precio_unitario,
+                en_oferta=value.get('en_oferta', False),
+                precio_regular=float(value.get('precio_regular', precio_unitario)),
+                comision_unitaria=materiales[int(key)].comision,
+                total=subtotal,
+                user=user
+            ))
+            total_pedido += subtotal
+
+        pedido = Pedido.objects.create(
+            user=user,
+            cliente=cliente,
+            transportista=transportista,
+            estado='pendiente',
+            total=total_pedido
+        )
+        for detalle in detalles:
+            detalle.pedido = pedido
+        PedidoDetalle.objects.bulk_create(detalles, batch_size=DETALLES_POR_INSERT)
+
+    return pedido, []
+
+
+def actualizar_lineas(pedido, lineas, user):
+    """
+    Sustituye las líneas del pedido aplicando solo las diferencias con sus
+    detalles actuales: el stock se ajusta con los cambios netos por material en
+    un UPDATE condicional y solo se escriben los detalles que cambian. Las
+    líneas se emparejan con los detalles existentes del mismo material por
+    orden; los detalles conservados mantienen su comisión unitaria.
+    Args:
+        lineas: lista de diccionarios con material_id, cantidad, precio_unitario,
+            en_oferta y precio_regular
+    Raises:
+        Exception si falta stock; el llamador debe envolverlo en una transacción
+    """
+    actuales = {}
+    for detalle in PedidoDetalle.objects.filter(pedido=pedido).order_by('id'):
+        actuales.setdefault(detalle.material_id, []).append(detalle)
+
+    # Cambios netos de stock por material (positivo: se descuenta más)
+    deltas = {material_id: -sum(d.cantidad for d in detalles) for material_id, detalles in actuales.items()}
+    for linea in lineas:
+        deltas[linea['material_id']] = deltas.get(linea['material_id'], 0) + linea['cantidad']
+    deltas = {material_id: delta for material_id, delta in deltas.items() if delta}
+
+    campos = ['cantidad', 'precio_unitario', 'en_oferta', 'precio_regular', 'total']
+    modificados, nuevas = [], []
+    total_pedido = 0
+    for linea in lineas:
+        subtotal = linea['precio_unitario'] * linea['cantidad']
+        total_pedido += subtotal
+        existentes = actuales.get(linea['material_id'])
+        if not existentes:
+            nuevas.append(linea)
+            continue
+        detalle = existentes.pop(0)
+        if any(getattr(detalle, campo) != linea[campo] for campo in campos[:-1]):
+            for campo in campos[:-1]:
+                setattr(detalle, campo, linea[campo])
+            detalle.total = subtotal
+            modificados.append(detalle)
+
+    sobrantes = [detalle.id for detalles in actuales.values() for detalle in detalles]
+    efectuado = pedido.estado == 'efectuado'
+    cambia = bool(modificados or nuevas or sobrantes)
+    if efectuado and cambia:
+        # El acumulado mensual se recalcula con las líneas anteriores y las nuevas
+        VentaMensualMaterial.acumular(pedido, signo=-1)
+
+    # Solo los pedidos pendientes cuentan en cantidad_reservada
+    reservados, fallidos = Material.reservar_stock(deltas, pendiente=pedido.estado == 'pendiente')
+    if fallidos:
+        nombre = Material.objects.filter(id=fallidos[0]).values_list('nombre', flat=True).first()
+        raise Exception(f"No hay suficiente stock de {nombre or fallidos[0]}")
+
+    if sobrantes:
+        PedidoDetalle.objects.filter(id__in=sobrantes).delete()
+    if modificados:
+        PedidoDetalle.objects.bulk_update(modificados, campos)
+    if nuevas:
+        comisiones = dict(
+            Material.objects.filter(id__in={linea['material_id'] for linea in nuevas})
+            .values_list('id', 'comision')
+        )
+        PedidoDetalle.objects.bulk_create([
+            PedidoDetalle(
+                pedido=pedido,
+                user=user,
+                comision_unitaria=comisiones[linea['material_id']],
+                total=linea['precio_unitario'] * linea['cantidad'],
+                **linea
+            )
+            for linea in nuevas
+        ])
+
+    if cambia:
+        # También actualiza updated_at, que identifica la versión de la factura cacheada
+        pedido.total = total_pedido
+        pedido.save(update_fields=['total', 'updated_at'])
+    if efectuado and cambia:
+        VentaMensualMaterial.acumular(pedido)
+        # Cambia total_ventas aunque no se mueva stock (p. ej. solo cambian precios)
+        invalidar_kpis()
+
+
+def _cancelar_lote(limite, tamano_lote):
+    """
+    Cancela hasta tamano_lote pedidos pendientes creados antes de limite en una
+    transacción: devuelve su stock agrupado por material y cambia el estado con
+    un único UPDATE.
+    Returns:
+        Número de pedidos cancelados
+    """
+    with transaction.atomic():
+        # Recorre el índice (estado, created_at). Los pedidos con alguna línea sin
+        # cantidad quedan fuera para no devolver stock negativo. En SQLite la
+        # transacción IMMEDIATE ya bloquea la escritura; en otros motores se
+        # bloquean las filas leídas
+        ids = list(
+            Pedido.objects.select_for_update().filter(estado='pendiente', created_at__lte=limite)
+            .exclude(Exists(PedidoDetalle.objects.filter(pedido=OuterRef('pk'), cantidad__lte=0)))
+            .order_by()
+            .values_list('id', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return 0
+
+        vencidos = Pedido.objects.filter(id__in=ids)
+        vencidos.liberar_stock()
+        return vencidos.update(estado='cancelado', updated_at=timezone.now())
+
+
+def cancelar_pedidos_vencidos(tamano_lote=None):
+    """
+    Cancela los pedidos pendientes más antiguos que ConfiguracionPedidos.tiempo_eliminacion.
+    Sin configuración guardada se aplican los valores por defecto del modelo,
+    igual que en la pantalla de configuración. Trabaja por lotes, cada uno en su
+    propia transacción, para no retener el bloqueo de escritura de SQLite
+    durante todo el barrido.
+    Returns:
+        Diccionario con las métricas de la ejecución (también queda guardado en caché)
+    """
+    inicio = time.perf_counter()
+    config = ConfiguracionPedidos.objects.first() or ConfiguracionPedidos()
+    if not config.activo:
+        return registrar_barrido({'activo': False, 'cancelados': 0, 'lotes': 0, 'duracion_ms': 0})
+
+    tamano_lote = tamano_lote or getattr(settings, 'BARRIDO_PEDIDOS_LOTE', 500)
+    limite = timezone.now() - timedelta(hours=config.tiempo_eliminacion)
+    cancelados = lotes = 0
+    while True:
+        en_lote = _cancelar_lote(limite, tamano_lote)
+        if not en_lote:
+            break
+        cancelados += en_lote
+        lotes += 1
+        if en_lote < tamano_lote:
+            break
+
+    return registrar_barrido({
+        'activo': True,
+        'cancelados': cancelados,
+        'lotes': lotes,
+        'duracion_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    })
+
+
+def registrar_barrido(metricas):
+    """Guarda las métricas del último barrido y acumula los totales en la caché"""
+    metricas = {**metricas, 'fecha': timezone.now()}
+    cache.set(CLAVE_ULTIMO_BARRIDO, metricas, None)
+    if metricas['activo']:
+        sumar_en_cache(CLAVE_TOTAL_BARRIDOS)
+        sumar_en_cache(CLAVE_TOTAL_CANCELADOS, metricas['cancelados'])
+        logger.info(
+            f"Barrido de pedidos: {metricas['cancelados']} cancelados en "
+            f"{metricas['lotes']} lotes, {metricas['duracion_ms']} ms"
+        )
+    return metricas
+
+
+def estadisticas_barrido():
+    return {
+        'ultimo': cache.get(CLAVE_ULTIMO_BARRIDO),
+        'ejecuciones': cache.get(CLAVE_TOTAL_BARRIDOS, 0),
+        'cancelados': cache.get(CLAVE_TOTAL_CANCELADOS, 0),
+    }
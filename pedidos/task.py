@@ -1,69 +1,48 @@
-from celery import shared_task
-from django.utils import timezone
-from datetime import timedelta
-from django.db import transaction
 import logging
-from .models import Pedido, ConfiguracionPedidos, PedidoDetalle
 
-'''@shared_task
-def eliminar_pedidos_antiguos():
-    try:
-        config = ConfiguracionPedidos.objects.first()
-        if not config or not config.activo:
-            return "Eliminación automática desactivada"
+from background_task import background
+from background_task.models import Task
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
 
-        limite = timezone.now() - timedelta(hours=config.tiempo_eliminacion)
-        pedidos = Pedido.objects.filter(
-            created_at__lte=limite,
-            estado='pendiente'
-        )
-        
-        count = pedidos.count()
-        pedidos.delete()
-        
-        return f"Se eliminaron {count} pedidos antiguos"
-    except Exception as e:
-        return f"Error al eliminar pedidos: {str(e)}"'''
+from .services import cancelar_pedidos_vencidos
 
-@shared_task
-def cancelar_pedidos_antiguos():
-    logger = logging.getLogger(__name__)
-    try:
-        config = ConfiguracionPedidos.objects.first()
-        logger.info(f"Iniciando cancelación automática de pedidos. Configuración: {config}")
-        if not config or not config.activo:
-            return "Cancelación automática desactivada"
+logger = logging.getLogger(__name__)
 
-        limite = timezone.now() - timedelta(hours=config.tiempo_eliminacion)
-        pedidos = Pedido.objects.filter(
-            created_at__lte=limite,
-            estado='pendiente'
-        )
-        
-        count = 0
-        for pedido in pedidos:
-            try:
-                with transaction.atomic():
-                    # Verificar consistencia antes de restaurar
-                    for detalle in pedido.pedidodetalle_set.all():
-                        if detalle.cantidad <= 0:
-                            raise ValueError(f"Cantidad inválida en detalle {detalle.id}")
-                        
-                    # Restaurar stock y cancelar
-                    for detalle in pedido.pedidodetalle_set.all():
-                        detalle.material.actualizar_stock(detalle.cantidad)
-                    
-                    pedido.estado = 'cancelado'
-                    pedido.save()
-                    count += 1
-                    logger.info(f"Pedido {pedido.id} cancelado exitosamente")
-            except Exception as e:
-                logger.error(f"Error en pedido {pedido.id}: {str(e)}")
-                continue
-        
-        return f"Se cancelaron {count} pedidos antiguos"
-    except Exception as e:
-        logger.error(f"Error en cancelación automática: {str(e)}")
-        return f"Error al cancelar pedidos: {str(e)}"
+TAREA_BARRIDO = 'pedidos.task.barrer_pedidos_pendientes'
+# Tarea por pedido que se usaba antes del barrido periódico
+TAREA_POR_PEDIDO = 'pedidos.views.cancelar_pedido_no_efectuado'
 
 
+@background(schedule=0)
+def barrer_pedidos_pendientes():
+    """Cancela los pedidos pendientes vencidos; se repite cada BARRIDO_PEDIDOS_SEGUNDOS"""
+    cancelar_pedidos_vencidos()
+
+
+def programar_barrido(intervalo):
+    """
+    Deja una única tarea repetitiva de barrido con el intervalo indicado (en
+    segundos) y descarta las tareas por pedido que queden en la cola.
+    Returns:
+        True si se creó la tarea, False si ya existía y solo se actualizó el intervalo
+    """
+    antiguas, _ = Task.objects.filter(task_name=TAREA_POR_PEDIDO).delete()
+    if antiguas:
+        logger.info(f"Eliminadas {antiguas} tareas de cancelación por pedido")
+    if Task.objects.filter(task_name=TAREA_BARRIDO).update(repeat=intervalo):
+        return False
+    barrer_pedidos_pendientes(repeat=intervalo)
+    return True
+
+
+def programar_barrido_tras_migrar(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Receptor de post_migrate: si no hay tarea de barrido la crea cada
+    BARRIDO_PEDIDOS_SEGUNDOS. Una tarea existente no se toca, para conservar el
+    intervalo elegido con barrer_pedidos_pendientes --programar. Las tareas solo
+    se ejecutan con un worker de background_task en marcha (manage.py process_tasks).
+    """
+    if using != DEFAULT_DB_ALIAS or Task.objects.filter(task_name=TAREA_BARRIDO).exists():
+        return
+    programar_barrido(settings.BARRIDO_PEDIDOS_SEGUNDOS)
@@ -1,3 +1,668 @@
-from django.test import TestCase
+import math
+import os
+import re
+from io import BytesIO
+from unittest import mock
+import shutil
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from background_task.models import Task
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clientes.models import Cliente
+from inventario.models import Categoria, Material
+from .facturas import _plan_paginas, dibujar_documento, factura_en_disco, ruta_factura, version_factura
+from .models import ConfiguracionPedidos, Pedido, PedidoDetalle, VentaMensualMaterial
+from .services import DETALLES_POR_INSERT, cancelar_pedidos_vencidos, crear_pedido, estadisticas_barrido
+from .task import TAREA_BARRIDO, TAREA_POR_PEDIDO, programar_barrido
+from .views import PEDIDOS_POR_PAGINA
+
+
+def crear_materiales(categoria, total, cantidad=50):
+    return [
+        Material.objects.create(
+            nombre=f'Material {i}',
+            codigo=f'M{i}',
+            categoria=categoria,
+            precio=10,
+            comision=1,
+            cantidad=cantidad
+        )
+        for i in range(total)
+    ]
+
+
+def items_carro(materiales, cantidad=2):
+    return {
+        str(material.id): {
+            'material_id': material.id,
+            'nombre': material.nombre,
+            'precio_unitario': float(material.precio),
+            'precio': float(material.precio) * cantidad,
+            'cantidad': cantidad,
+            'en_oferta': False,
+            'precio_regular': float(material.precio)
+        }
+        for material in materiales
+    }
+
+
+class CrearPedidoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user,
+            nombre='Ana',
+            apellidos='Pérez',
+            carnet_identidad='90010112345',
+            telefono='55555555'
+        )
+        self.categoria = Categoria.objects.create(nombre='General')
+
+    def test_descuenta_stock_y_crea_detalles(self):
+        materiales = crear_materiales(self.categoria, 3)
+
+        pedido, fallos = crear_pedido(self.user, self.cliente, items_carro(materiales))
+
+        self.assertEqual(fallos, [])
+        self.assertEqual(pedido.estado, 'pendiente')
+        self.assertEqual(float(pedido.total), 60)
+        self.assertEqual(PedidoDetalle.objects.filter(pedido=pedido).count(), 3)
+        self.assertEqual(
+            list(Material.objects.order_by('id').values_list('cantidad', flat=True)),
+            [48, 48, 48]
+        )
+
+    def test_stock_insuficiente_devuelve_fallos_sin_escribir(self):
+        materiales = crear_materiales(self.categoria, 2)
+        escaso = Material.objects.create(
+            nombre='Escaso', codigo='E1', categoria=self.categoria, precio=5, cantidad=1
+        )
+
+        pedido, fallos = crear_pedido(self.user, self.cliente, items_carro(materiales + [escaso]))
+
+        self.assertIsNone(pedido)
+        self.assertEqual([fallo['material_id'] for fallo in fallos], [escaso.id])
+        self.assertEqual(fallos[0]['disponible'], 1)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertEqual(
+            list(Material.objects.order_by('id').values_list('cantidad', flat=True)),
+            [50, 50, 1]
+        )
+
+    def test_reserva_fallida_sin_fallos_al_releer(self):
+        materiales = crear_materiales(self.categoria, 2)
+        # El UPDATE falla por un cambio concurrente que ya no se ve al releer el stock
+        with mock.patch.object(Material, 'reservar_stock', return_value=([], [materiales[0].id])):
+            pedido, fallos = crear_pedido(self.user, self.cliente, items_carro(materiales))
+
+        self.assertIsNone(pedido)
+        self.assertEqual(len(fallos), 1)
+        self.assertIn('inténtelo de nuevo', fallos[0]['mensaje'])
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_consultas_constantes_segun_tamano_del_carro(self):
+        conteos = []
+        for total in (1, 10, 100):
+            Material.objects.all().delete()
+            materiales = crear_materiales(self.categoria, total)
+            with CaptureQueriesContext(connection) as contexto:
+                pedido, fallos = crear_pedido(self.user, self.cliente, items_carro(materiales))
+            self.assertEqual(fallos, [])
+            inserts = [q for q in contexto.captured_queries if q['sql'].startswith('INSERT INTO "pedidosdetalle"')]
+            self.assertEqual(len(inserts), math.ceil(total / DETALLES_POR_INSERT))
+            # Lo único que crece con el carro es un INSERT de detalles por lote
+            conteos.append(len(contexto.captured_queries) - len(inserts))
+        self.assertEqual(len(set(conteos)), 1, conteos)
+
+
+class CantidadReservadaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 2, cantidad=10)
+        self.pedido, _ = crear_pedido(self.user, self.cliente, items_carro(self.materiales, cantidad=3))
+
+    def estado_stock(self):
+        return list(Material.objects.order_by('id').values_list('cantidad', 'cantidad_reservada'))
+
+    def test_crear_pedido_reserva(self):
+        self.assertEqual(self.estado_stock(), [(7, 3), (7, 3)])
+
+    def test_efectuar_libera_la_reserva_sin_devolver_stock(self):
+        self.pedido.efectuar()
+        self.assertEqual(self.estado_stock(), [(7, 0), (7, 0)])
+
+    def test_efectuar_un_pedido_cancelado_tras_cargarlo(self):
+        cargado = Pedido.objects.get(id=self.pedido.id)
+        # El barrido lo cancela y devuelve el stock antes de que se efectúe
+        Pedido.objects.get(id=self.pedido.id).cancelar()
+
+        self.assertFalse(cargado.efectuar())
+        self.assertEqual(cargado.estado, 'cancelado')
+        self.assertEqual(self.estado_stock(), [(10, 0), (10, 0)])
+        self.assertFalse(VentaMensualMaterial.objects.exists())
+
+    def test_cancelar_devuelve_stock_y_reserva(self):
+        self.pedido.cancelar()
+        self.assertEqual(self.estado_stock(), [(10, 0), (10, 0)])
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, 'cancelado')
+
+    def test_eliminar_pendiente_devuelve_stock(self):
+        self.client.force_login(self.user)
+        respuesta = self.client.get(reverse('pedidos:eliminar_pedido', args=[self.pedido.id]))
+        self.assertEqual(respuesta.json()['status'], 'success')
+        self.assertEqual(self.estado_stock(), [(10, 0), (10, 0)])
+
+    def test_liberar_stock_de_varios_pedidos_en_dos_consultas(self):
+        otro, _ = crear_pedido(self.user, self.cliente, items_carro(self.materiales[:1], cantidad=2))
+        self.pedido.efectuar()
+        # Solo cuentan los pendientes: el efectuado ya no tiene stock reservado
+        with self.assertNumQueries(2):
+            Pedido.objects.filter(id__in=[self.pedido.id, otro.id]).liberar_stock()
+        self.assertEqual(self.estado_stock(), [(7, 0), (7, 0)])
+
+
+class ListaPedidosTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        Pedido.objects.bulk_create([Pedido(user=self.user, cliente=self.cliente) for _ in range(120)])
+        self.ids = list(Pedido.objects.order_by('-id').values_list('id', flat=True))
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+
+    def test_recorre_todas_las_paginas_por_cursor(self):
+        respuesta = self.client.get(reverse('pedidos:lista_pedidos'))
+        vistos = [pedido.id for pedido in respuesta.context['pedidos']]
+        siguiente = respuesta.context['url_mas_pedidos']
+
+        while siguiente:
+            datos = self.client.get(siguiente).json()
+            vistos += [int(i) for i in re.findall(r'<td>#(\d+)</td>', datos['filas'])]
+            siguiente = datos['siguiente']
+
+        self.assertEqual(len(respuesta.context['pedidos']), PEDIDOS_POR_PAGINA)
+        self.assertEqual(vistos, self.ids)
+
+    def test_coste_constante_en_cualquier_pagina(self):
+        with CaptureQueriesContext(connection) as primera:
+            self.client.get(reverse('pedidos:mas_pedidos'))
+        with CaptureQueriesContext(connection) as ultima:
+            self.client.get(reverse('pedidos:mas_pedidos'), {'despues': self.ids[-10]})
+
+        self.assertEqual(len(primera.captured_queries), len(ultima.captured_queries))
+        consulta = next(q['sql'] for q in ultima.captured_queries if '"pedidos"' in q['sql'])
+        self.assertIn('LIMIT 51', consulta)
+        self.assertNotIn('OFFSET', consulta)
+        self.assertNotIn('DISTINCT', consulta)
+
+
+class ConsultasPorPaginaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 20)
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+
+    def crear_pedidos(self, total):
+        """Pedidos cancelados con dos líneas, cada uno reactivado una vez"""
+        materiales = self.materiales[:2]
+        for _ in range(total):
+            original = Pedido.objects.create(user=self.user, cliente=self.cliente, estado='cancelado')
+            PedidoDetalle.objects.bulk_create([
+                PedidoDetalle(user=self.user, pedido=original, material=material, cantidad=1)
+                for material in materiales
+            ])
+            Pedido.objects.create(user=self.user, cliente=self.cliente, pedido_original=original)
+        return original
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def test_lista_y_estadisticas_no_dependen_del_numero_de_filas(self):
+        for nombre in ('pedidos:lista_pedidos', 'pedidos:estadisticas_usuario'):
+            with self.subTest(url=nombre):
+                Pedido.objects.all().delete()
+                self.crear_pedidos(2)
+                pocas = self.contar_consultas(reverse(nombre))
+                self.crear_pedidos(15)
+                self.assertEqual(self.contar_consultas(reverse(nombre)), pocas)
+
+    def test_detalle_no_depende_del_numero_de_lineas(self):
+        corto = self.crear_pedidos(1)
+        largo = Pedido.objects.create(user=self.user, cliente=self.cliente)
+        PedidoDetalle.objects.bulk_create([
+            PedidoDetalle(user=self.user, pedido=largo, material=material, cantidad=1)
+            for material in self.materiales
+        ])
+
+        self.assertEqual(
+            self.contar_consultas(reverse('pedidos:detalle_pedido', args=[corto.id])),
+            self.contar_consultas(reverse('pedidos:detalle_pedido', args=[largo.id]))
+        )
+
+
+class ComisionPedidoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave', is_staff=True)
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 3)
+        self.pedido, _ = crear_pedido(self.user, self.cliente, items_carro(self.materiales, cantidad=2))
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))  # deja la sesión activa en caché
+
+    def test_anotacion_coincide_con_la_propiedad(self):
+        anotado = Pedido.objects.con_comision().get(id=self.pedido.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(anotado.comision_total, 6)
+        self.assertEqual(Pedido.objects.get(id=self.pedido.id).comision_total, 6)
+        # La propiedad es de solo lectura
+        with self.assertRaises(AttributeError):
+            anotado.comision_total = 1
+
+    def test_editar_la_comision_del_material_no_cambia_pedidos_existentes(self):
+        Material.objects.update(comision=5)
+
+        self.assertEqual(Pedido.objects.con_comision().get(id=self.pedido.id).comision_total, 6)
+        self.assertEqual(Pedido.objects.get(id=self.pedido.id).comision_total, 6)
+
+    def test_historiales_en_consultas_constantes(self):
+        urls = [reverse('pedidos:estadisticas_usuario'), reverse('historial_usuario', args=[self.user.id])]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as pocos:
+                    self.client.get(url)
+                for _ in range(10):
+                    crear_pedido(self.user, self.cliente, items_carro(self.materiales, cantidad=1))
+                with CaptureQueriesContext(connection) as muchos:
+                    respuesta = self.client.get(url)
+
+                self.assertEqual(len(pocos.captured_queries), len(muchos.captured_queries))
+                self.assertContains(respuesta, '$6,00')
+
+
+class VentaMensualMaterialTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 2, cantidad=10)
+
+    def pedido(self, cantidad):
+        pedido, _ = crear_pedido(self.user, self.cliente, items_carro(self.materiales, cantidad=cantidad))
+        return pedido
+
+    def acumulado(self):
+        return list(VentaMensualMaterial.objects.order_by('material_id')
+                    .values_list('unidades', 'ingresos', 'stock_cierre'))
+
+    def test_efectuar_y_cancelar_actualizan_el_acumulado(self):
+        primero, segundo = self.pedido(2), self.pedido(3)
+        self.assertEqual(self.acumulado(), [])
+
+        primero.efectuar()
+        segundo.efectuar()
+        segundo.efectuar()  # repetir no vuelve a sumar
+        self.assertEqual(self.acumulado(), [(5, 50, 5), (5, 50, 5)])
+
+        segundo.cancelar()
+        self.assertEqual(self.acumulado(), [(2, 20, 5), (2, 20, 5)])
+
+        primero.cancelar()
+        self.assertEqual(self.acumulado(), [])
+
+    def test_reconstruir_coincide_con_el_acumulado_incremental(self):
+        for cantidad in (1, 2):
+            self.pedido(cantidad).efectuar()
+        self.pedido(4)  # pendiente: no cuenta en las ventas
+        incremental = [(unidades, ingresos) for unidades, ingresos, _ in self.acumulado()]
+
+        VentaMensualMaterial.reconstruir()
+
+        # Al reconstruir, el stock al cierre es el stock actual
+        self.assertEqual(self.acumulado(), [(u, i, 3) for u, i in incremental])
+
+
+class EditarDetalleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 3, cantidad=10)
+        self.pedido, _ = crear_pedido(self.user, self.cliente, items_carro(self.materiales[:2], cantidad=3))
+        self.client.force_login(self.user)
+        self.url = reverse('pedidos:editar_detalle', args=[self.pedido.id])
+
+    def enviar(self, lineas):
+        return self.client.post(self.url, {
+            'articulo[]': [m.id for m, _ in lineas],
+            'cantidad[]': [c for _, c in lineas],
+            'precio_unitario[]': ['10.0'] * len(lineas),
+            'en_oferta[]': ['false'] * len(lineas),
+            'precio_regular[]': ['10.0'] * len(lineas),
+        })
+
+    def estado_stock(self):
+        return list(Material.objects.order_by('id').values_list('cantidad', 'cantidad_reservada'))
+
+    def mensajes(self, respuesta):
+        return ' '.join(str(m) for m in get_messages(respuesta.wsgi_request))
+
+    def test_sin_cambios_no_escribe(self):
+        detalles = list(PedidoDetalle.objects.filter(pedido=self.pedido).values_list('id', 'cantidad'))
+        with CaptureQueriesContext(connection) as consultas:
+            self.enviar([(self.materiales[0], 3), (self.materiales[1], 3)])
+        escrituras = [q['sql'] for q in consultas if q['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual([sql for sql in escrituras if 'django_session' not in sql], [])
+        self.assertEqual(list(PedidoDetalle.objects.filter(pedido=self.pedido).values_list('id', 'cantidad')), detalles)
+
+    def test_aplica_solo_las_diferencias(self):
+        conservado = PedidoDetalle.objects.get(pedido=self.pedido, material=self.materiales[0])
+        respuesta = self.enviar([(self.materiales[0], 5), (self.materiales[2], 4)])
+        self.assertRedirects(respuesta, reverse('pedidos:detalle_pedido', args=[self.pedido.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.estado_stock(), [(5, 5), (10, 0), (6, 4)])
+        detalles = PedidoDetalle.objects.filter(pedido=self.pedido).order_by('id')
+        self.assertEqual(
+            [(d.id == conservado.id, d.material_id, d.cantidad) for d in detalles],
+            [(True, self.materiales[0].id, 5), (False, self.materiales[2].id, 4)]
+        )
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total, 90)
+
+    def test_sin_stock_no_cambia_nada(self):
+        self.enviar([(self.materiales[0], 3), (self.materiales[1], 30)])
+        self.assertEqual(self.estado_stock(), [(7, 3), (7, 3), (10, 0)])
+        self.assertEqual(
+            sorted(PedidoDetalle.objects.filter(pedido=self.pedido).values_list('cantidad', flat=True)), [3, 3]
+        )
+
+    def test_rechaza_cantidades_no_enteras(self):
+        respuesta = self.enviar([(self.materiales[0], '2.7'), (self.materiales[1], 3)])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('número entero', self.mensajes(respuesta))
+        self.assertEqual(self.estado_stock(), [(7, 3), (7, 3), (10, 0)])
+
+    def test_rechaza_columnas_de_distinta_longitud(self):
+        respuesta = self.client.post(self.url, {
+            'articulo[]': [self.materiales[0].id, self.materiales[2].id],
+            'cantidad[]': [3, 4],
+            'precio_unitario[]': ['10.0'],
+            'en_oferta[]': ['false'] * 2,
+            'precio_regular[]': ['10.0'] * 2,
+        })
+        self.assertIn('incompleto', self.mensajes(respuesta))
+        self.assertEqual(PedidoDetalle.objects.filter(pedido=self.pedido).count(), 2)
+        self.assertEqual(self.estado_stock(), [(7, 3), (7, 3), (10, 0)])
+
+    def test_formulario_lista_articulos(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['articulos']), 3)
+        self.assertContains(respuesta, 'selected>', count=2)
+
+
+class FacturaTests(TestCase):
+    def setUp(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        ajustes = override_settings(FACTURAS_CACHE_DIR=carpeta)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.carpeta = carpeta
+
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 5)
+        self.pedido, _ = crear_pedido(self.user, self.cliente, items_carro(self.materiales))
+        self.client.force_login(self.user)
+        self.url = reverse('pedidos:generar_factura', args=[self.pedido.id])
+
+    def paginas(self, pdf):
+        return len(re.findall(rb'/Type /Page\b(?!s)', pdf))
+
+    def test_detalles_en_una_consulta(self):
+        pedido = Pedido.objects.select_related('user', 'cliente').get(id=self.pedido.id)
+        salida = BytesIO()
+        with self.assertNumQueries(1):
+            dibujar_documento(salida, pedido, "FACTURA")
+        self.assertTrue(salida.getvalue().startswith(b'%PDF'))
+        self.assertEqual(self.paginas(salida.getvalue()), 1)
+
+    def test_plan_paginas(self):
+        posiciones, total = _plan_paginas(23)
+        self.assertEqual({pagina for pagina, _ in posiciones}, {1})
+        # El total no cabe debajo de la fila 23 y pasa a la segunda página
+        self.assertEqual(total[0], 2)
+        posiciones, total = _plan_paginas(50)
+        self.assertEqual([pagina for pagina, _ in posiciones].count(1), 23)
+        self.assertEqual(total[0], 2)
+        self.assertTrue(all(y >= 70 for _, y in posiciones))
+
+    def test_oferta_larga_en_varias_paginas(self):
+        materiales = Material.objects.bulk_create([
+            Material(nombre=f'Otro {i}', codigo=f'O{i}', categoria=self.materiales[0].categoria,
+                     precio=10, comision=1, cantidad=5)
+            for i in range(50)
+        ])
+        pedido, _ = crear_pedido(self.user, self.cliente, items_carro(materiales, cantidad=1))
+        respuesta = self.client.get(reverse('pedidos:generar_oferta', args=[pedido.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        pdf = b''.join(respuesta.streaming_content)
+        respuesta.close()
+        self.assertEqual(self.paginas(pdf), 2)
+        self.assertIn('oferta_', respuesta['Content-Disposition'])
+
+    def test_efectuado_se_cachea_y_revalida(self):
+        self.pedido.efectuar()
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertEqual(len(os.listdir(self.carpeta)), 1)
+
+        revalidada = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(revalidada.status_code, 304)
+        self.assertEqual(revalidada['ETag'], respuesta['ETag'])
+
+        # Guardar el pedido cambia la versión y reemplaza el PDF cacheado
+        Pedido.objects.filter(id=self.pedido.id).update(updated_at=timezone.now() + timedelta(seconds=1))
+        nueva = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(nueva.status_code, 200)
+        self.assertNotEqual(nueva['ETag'], respuesta['ETag'])
+        self.assertEqual(len(os.listdir(self.carpeta)), 1)
+
+    def test_otra_version_no_borra_la_factura_servida(self):
+        self.pedido.efectuar()
+        pedido = Pedido.objects.select_related('user', 'cliente').get(id=self.pedido.id)
+        clave, _ = version_factura(pedido)
+        with factura_en_disco(pedido, clave) as servida:
+            # Otro proceso genera a la vez otra versión del mismo pedido
+            factura_en_disco(pedido, f'{clave}-otra').close()
+            self.assertTrue(servida.read().startswith(b'%PDF'))
+        self.assertEqual(os.listdir(self.carpeta), [os.path.basename(ruta_factura(f'{clave}-otra'))])
+
+    def test_pendiente_no_se_cachea(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.has_header('ETag'))
+        self.assertEqual(os.listdir(self.carpeta), [])
+
+
+class BarridoPedidosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nombre='Ana', apellidos='Pérez',
+            carnet_identidad='90010112345', telefono='55555555'
+        )
+        self.materiales = crear_materiales(Categoria.objects.create(nombre='General'), 2, cantidad=100)
+        ConfiguracionPedidos.objects.create(tiempo_eliminacion=24, activo=True)
+
+    def crear_pedidos(self, total, horas):
+        pedidos = [
+            crear_pedido(self.user, self.cliente, items_carro(self.materiales, cantidad=2))[0]
+            for _ in range(total)
+        ]
+        Pedido.objects.filter(id__in=[p.id for p in pedidos]).update(
+            created_at=timezone.now() - timedelta(hours=horas)
+        )
+        return pedidos
+
+    def test_cancela_vencidos_y_devuelve_stock(self):
+        vencidos = self.crear_pedidos(3, horas=30)
+        reciente, = self.crear_pedidos(1, horas=1)
+
+        metricas = cancelar_pedidos_vencidos()
+
+        self.assertEqual(metricas['cancelados'], 3)
+        self.assertEqual(
+            set(Pedido.objects.filter(estado='cancelado').values_list('id', flat=True)),
+            {p.id for p in vencidos}
+        )
+        reciente.refresh_from_db()
+        self.assertEqual(reciente.estado, 'pendiente')
+        # Solo queda reservado el pedido reciente
+        self.assertEqual(
+            list(Material.objects.order_by('id').values_list('cantidad', 'cantidad_reservada')),
+            [(98, 2), (98, 2)]
+        )
+        self.assertEqual(estadisticas_barrido()['cancelados'], 3)
+
+    def test_consultas_no_dependen_del_numero_de_pedidos(self):
+        self.crear_pedidos(2, horas=30)
+        with CaptureQueriesContext(connection) as pocos:
+            cancelar_pedidos_vencidos()
+        self.crear_pedidos(8, horas=30)
+        with CaptureQueriesContext(connection) as muchos:
+            metricas = cancelar_pedidos_vencidos()
+        self.assertEqual(metricas['cancelados'], 8)
+        self.assertEqual(len(pocos), len(muchos))
+
+    def test_por_lotes(self):
+        self.crear_pedidos(5, horas=30)
+        metricas = cancelar_pedidos_vencidos(tamano_lote=2)
+        self.assertEqual((metricas['cancelados'], metricas['lotes']), (5, 3))
+        self.assertFalse(Pedido.objects.filter(estado='pendiente').exists())
+
+    def test_desactivado(self):
+        ConfiguracionPedidos.objects.update(activo=False)
+        self.crear_pedidos(1, horas=30)
+        self.assertFalse(cancelar_pedidos_vencidos()['activo'])
+        self.assertTrue(Pedido.objects.filter(estado='pendiente').exists())
+
+    def test_sin_configuracion_usa_los_valores_por_defecto(self):
+        ConfiguracionPedidos.objects.all().delete()
+        self.crear_pedidos(2, horas=30)
+        self.crear_pedidos(1, horas=1)
+        metricas = cancelar_pedidos_vencidos()
+        self.assertTrue(metricas['activo'])
+        self.assertEqual(metricas['cancelados'], 2)
+
+    def test_migrate_programa_el_barrido(self):
+        Task.objects.all().delete()
+        emit_post_migrate_signal(verbosity=0, interactive=False, db='default')
+        emit_post_migrate_signal(verbosity=0, interactive=False, db='default')
+        self.assertEqual(
+            list(Task.objects.values_list('task_name', 'repeat')),
+            [(TAREA_BARRIDO, settings.BARRIDO_PEDIDOS_SEGUNDOS)]
+        )
+
+    def test_migrate_conserva_el_intervalo_programado(self):
+        Task.objects.all().delete()
+        programar_barrido(60)
+        emit_post_migrate_signal(verbosity=0, interactive=False, db='default')
+        self.assertEqual(list(Task.objects.values_list('task_name', 'repeat')), [(TAREA_BARRIDO, 60)])
+
+    def test_programar_deja_una_sola_tarea(self):
+        Task.objects.all().delete()
+        Task.objects.create(task_name=TAREA_POR_PEDIDO, task_params='[[1], {}]', run_at=timezone.now())
+        self.assertTrue(programar_barrido(300))
+        self.assertFalse(programar_barrido(600))
+        self.assertEqual(list(Task.objects.values_list('task_name', 'repeat')), [(TAREA_BARRIDO, 600)])
+
+
+class PlanesDeConsultaTests(TestCase):
+    """Las consultas más frecuentes deben resolverse con un índice (EXPLAIN QUERY PLAN)"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='gestor', password='clave')
+        self.categoria = Categoria.objects.create(nombre='General')
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' | '.join(fila[-1] for fila in cursor.fetchall())
+
+    def assertUsaIndice(self, queryset, indice, sin_ordenar_en_memoria=False):
+        plan = self.plan(queryset)
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {indice}\b')
+        if sin_ordenar_en_memoria:
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_lista_pedidos_por_gestor_y_estado(self):
+        pedidos = Pedido.objects.filter(user=self.user, estado='pendiente').order_by('-id')
+        self.assertUsaIndice(pedidos[:PEDIDOS_POR_PAGINA + 1], 'pedido_user_estado_idx',
+                             sin_ordenar_en_memoria=True)
+
+    def test_pendientes_antiguos(self):
+        limite = timezone.now() - timedelta(hours=24)
+        pedidos = Pedido.objects.filter(created_at__lte=limite, estado='pendiente')
+        self.assertUsaIndice(pedidos, 'pedido_estado_creado_idx')
+
+    def test_gestores_con_pedidos_recientes(self):
+        # Misma consulta que calcular_kpis
+        gestores = User.objects.filter(Exists(Pedido.objects.filter(
+            user=OuterRef('pk'), created_at__gte=timezone.now() - timedelta(days=30)
+        )))
+        self.assertUsaIndice(gestores, 'pedido_user_creado_idx')
+
+    def test_cantidad_en_pedidos_por_material(self):
+        self.assertUsaIndice(Material.objects.con_cantidad_en_pedidos(), 'detalle_material_pedido_idx')
+
+    def test_catalogo_por_categoria(self):
+        materiales = Material.objects.filter(activo=True, categoria=self.categoria)
+        self.assertUsaIndice(materiales, 'material_activo_categoria_idx')
+
+    def test_lista_clientes_del_gestor(self):
+        clientes = Cliente.objects.filter(user=self.user).order_by('-created_at')
+        self.assertUsaIndice(clientes[:10], 'cliente_user_creado_idx', sin_ordenar_en_memoria=True)
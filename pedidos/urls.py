@@ -1,16 +1,14 @@
 from django.urls import path
 
 from . import views
-from django.contrib.auth.decorators import user_passes_test
+from autenticacion.permisos import admin_required
 
 app_name = 'pedidos'
 
-def admin_required(view_func):
-    return user_passes_test(lambda u: u.is_authenticated and u.is_staff)(view_func)
-
 urlpatterns = [
     path('prosesar_pedido/', views.prosesar_pedido, name='prosesar_pedido'),
     path('lista/', views.lista_pedidos, name='lista_pedidos'),
+    path('lista/mas/', views.mas_pedidos, name='mas_pedidos'),
     path('detalle/<int:pedido_id>/', views.detalle_pedido, name='detalle_pedido'),
     path('eliminar/<int:pedido_id>/', views.eliminar_pedido, name='eliminar_pedido'),
     path('editar/<int:pedido_id>/', views.editar_pedido, name='editar_pedido'),
@@ -1,53 +1,36 @@
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.decorators import user_passes_test
+from autenticacion.permisos import superuser_required
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from io import BytesIO
 import logging
 from django.contrib.auth.models import User
 from django.urls import reverse
 from clientes.models import Cliente
-from django.db.models import Q, Sum, F
+from django.db.models import Q, Sum, F, Exists, OuterRef
+from django.template.loader import render_to_string
 from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
 import os
+import tempfile
 from pathlib import Path
-from background_task import background
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
 logger = logging.getLogger(__name__)
 
+# Pedidos por página en la lista (paginación por cursor)
+PEDIDOS_POR_PAGINA = 50
+
 from carro.carro import Carro
 from inventario.models import Material
-from pedidos.models import Pedido, PedidoDetalle, ConfiguracionPedidos
+from pedidos.models import Pedido, PedidoDetalle, ConfiguracionPedidos, VentaMensualMaterial
+from .facturas import dibujar_documento, etag_factura, factura_en_disco, version_factura
 from .forms import PedidoForm
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-
-@background(schedule=2*60)  # Tiempo para cancelar pedidos
-def cancelar_pedido_no_efectuado(pedido_id):
-    try:
-        pedido = Pedido.objects.get(id=pedido_id)
-        # Verificar si el pedido existe y está pendiente
-        if pedido.estado == 'pendiente':
-            with transaction.atomic():
-                # Restaurar stock
-                detalles = PedidoDetalle.objects.filter(pedido=pedido)
-                for detalle in detalles:
-                    material = detalle.material
-                    material.actualizar_stock(detalle.cantidad)
-
-                # Cambiar estado a cancelado
-                pedido.estado = 'cancelado'
-                pedido.save()
-
-            logger.info(f"Pedido {pedido_id} cancelado automáticamente después de 20 segundos")
-    except Pedido.DoesNotExist:
-        logger.error(f"Pedido {pedido_id} no encontrado")
-    except Exception as e:
-        logger.error(f"Error al cancelar pedido {pedido_id}: {str(e)}")
+from .services import actualizar_lineas, cancelar_pedidos_vencidos, crear_pedido, estadisticas_barrido
 
 @login_required(login_url='/autenticacion/logear')
 def prosesar_pedido(request):
@@ -77,57 +60,19 @@ def prosesar_pedido(request):
 
                     carro = Carro(request)
 
-                    # Verificar stock disponible antes de crear el pedido
-                    for key, value in carro.carro.items():
-                        material = Material.objects.get(id=key)
-                        cantidad = int(value['cantidad'])
-                        if material.cantidad < cantidad:
-                            raise ValueError(f"No hay suficiente stock de {material.nombre}")
-
-                    # Crear pedido
-                    pedido = Pedido.objects.create(
-                        user=request.user,
-                        cliente=cliente,
-                        transportista=form.cleaned_data.get('transportista', None),
-                        estado='pendiente'
+                    # Validar stock, descontarlo y crear el pedido en bloque
+                    pedido, fallos = crear_pedido(
+                        request.user,
+                        cliente,
+                        carro.carro,
+                        transportista=form.cleaned_data.get('transportista', None)
                     )
+                    if fallos:
+                        raise ValueError("; ".join(fallo['mensaje'] for fallo in fallos))
 
-                    # Crear detalles y actualizar stock
-                    detalles = []
-                    total_pedido = 0
-
-                    for key, value in carro.carro.items():
-                        material = Material.objects.get(id=key)
-                        cantidad = int(value['cantidad'])
-
-                        # Actualizar stock
-                        if not material.actualizar_stock(-cantidad):
-                            raise ValueError(f"Error al actualizar stock de {material.nombre}")
-
-                        # Usar el precio que estaba en el carro
-                        precio_unitario = float(value['precio_unitario'])
-                        subtotal = precio_unitario * cantidad
-
-                        detalles.append(PedidoDetalle(
-                            pedido=pedido,
-                            material=material,
-                            cantidad=cantidad,
-                            precio_unitario=precio_unitario,  # Guardar el precio unitario usado
-                            en_oferta=value.get('en_oferta', False),  # Guardar si estaba en oferta
-                            precio_regular=float(value.get('precio_regular', precio_unitario)),  # Guardar precio regular
-                            total=subtotal,
-                            user=request.user
-                        ))
-                        total_pedido += subtotal
-
-                    pedido.total = total_pedido
-                    pedido.save()
-                    PedidoDetalle.objects.bulk_create(detalles)
+                    # Si no se efectúa, lo cancela el barrido periódico de pendientes
                     carro.limpiar_carro()
 
-                    # Programar la cancelación automática
-                    cancelar_pedido_no_efectuado(pedido.id)
-
                     messages.success(request, 'Pedido creado exitosamente')
                     return redirect('inventario')  # Redirigir al inventario
 
@@ -141,17 +86,15 @@ def prosesar_pedido(request):
         'carro': request.session.get('carro', {})
     })
 
-@login_required(login_url='/autenticacion/logear')
-def lista_pedidos(request):
-    # Consulta base
-    if request.user.is_superuser:
-        pedidos = Pedido.objects.select_related('cliente', 'user').all()
-        # Para admin, mostrar todos los clientes
-        clientes = Cliente.objects.values('id', 'nombre', 'apellidos').distinct()
-    else:
-        pedidos = Pedido.objects.select_related('cliente', 'user').filter(user=request.user)
-        # Para gestor normal, solo mostrar sus clientes
-        clientes = Cliente.objects.filter(pedido__user=request.user).distinct().values('id', 'nombre', 'apellidos')
+def _pedidos_filtrados(request):
+    """
+    Pedidos visibles para el usuario con los filtros del GET aplicados.
+    Los filtros por material y reactivación usan subconsultas para no necesitar
+    DISTINCT y poder paginar por id sobre el índice de la clave primaria.
+    """
+    pedidos = Pedido.objects.select_related('cliente', 'user').con_reactivaciones()
+    if not request.user.is_superuser:
+        pedidos = pedidos.filter(user=request.user)
 
     # Filtrar por cliente
     if cliente_id := request.GET.get('cliente'):
@@ -163,12 +106,16 @@ def lista_pedidos(request):
 
     # Filtrar por material
     if material_id := request.GET.get('material'):
-        pedidos = pedidos.filter(pedidodetalle__material_id=material_id).distinct()
+        pedidos = pedidos.filter(
+            id__in=PedidoDetalle.objects.filter(material_id=material_id).values('pedido_id')
+        )
 
     # Filtrar por estado
     if estado := request.GET.get('estado'):
         if estado == 'reactivado':
-            pedidos = pedidos.filter(reactivaciones__isnull=False).distinct()
+            pedidos = pedidos.filter(
+                Exists(Pedido.objects.filter(pedido_original=OuterRef('pk')))
+            )
         elif estado == 'reactivacion':
             pedidos = pedidos.filter(pedido_original__isnull=False)
         else:
@@ -180,6 +127,43 @@ def lista_pedidos(request):
     if fecha_hasta := request.GET.get('fecha_hasta'):
         pedidos = pedidos.filter(created_at__date__lte=fecha_hasta)
 
+    return pedidos
+
+
+def _pagina_pedidos(pedidos, despues=None):
+    """
+    Página de pedidos por cursor sobre el id (keyset): en lugar de OFFSET se
+    filtra por id < cursor, así el coste es el mismo en cualquier página.
+    Returns:
+        Tupla (pedidos de la página, id para pedir la siguiente página o None)
+    """
+    try:
+        despues = int(despues) if despues else None
+    except (TypeError, ValueError):
+        despues = None
+
+    if despues is not None:
+        pedidos = pedidos.filter(id__lt=despues)
+
+    # Se pide un elemento extra para saber si hay más páginas
+    pagina = list(pedidos.order_by('-id')[:PEDIDOS_POR_PAGINA + 1])
+    if len(pagina) > PEDIDOS_POR_PAGINA:
+        pagina = pagina[:PEDIDOS_POR_PAGINA]
+        return pagina, pagina[-1].id
+    return pagina, None
+
+
+@login_required(login_url='/autenticacion/logear')
+def lista_pedidos(request):
+    pedidos, siguiente = _pagina_pedidos(_pedidos_filtrados(request), request.GET.get('despues'))
+
+    if request.user.is_superuser:
+        # Para admin, mostrar todos los clientes
+        clientes = Cliente.objects.values('id', 'nombre', 'apellidos').distinct()
+    else:
+        # Para gestor normal, solo mostrar sus clientes
+        clientes = Cliente.objects.filter(pedido__user=request.user).distinct().values('id', 'nombre', 'apellidos')
+
     # Definir estados disponibles
     estados = [
         {'value': 'pendiente', 'label': 'Pendiente'},
@@ -189,14 +173,13 @@ def lista_pedidos(request):
         {'value': 'reactivado', 'label': 'Reactivados'}
     ]
 
-    # Ordenar pedidos por ID descendente
-    pedidos = pedidos.distinct().order_by('-id')
-
     context = {
         'pedidos': pedidos,
+        'siguiente': siguiente,
+        'url_mas_pedidos': _url_mas_pedidos(request, siguiente),
         'clientes': clientes,
         'gestores': User.objects.filter(is_active=True).values('id', 'first_name', 'last_name', 'username').distinct() if request.user.is_superuser else None,
-        'materiales': Material.objects.filter(activo=True).order_by('nombre'),
+        'materiales': Material.objects.filter(activo=True).order_by('nombre').values('id', 'nombre'),
         'estados': estados,
         'filtros_activos': {
             'cliente': request.GET.get('cliente'),
@@ -212,17 +195,39 @@ def lista_pedidos(request):
         return render(request, 'pedidos/includes/tabla_pedidos.html', context)
     return render(request, 'pedidos/lista_pedidos.html', context)
 
+
+def _url_mas_pedidos(request, siguiente):
+    """URL del scroll infinito conservando los filtros activos"""
+    if siguiente is None:
+        return ''
+    parametros = request.GET.copy()
+    parametros['despues'] = siguiente
+    return f"{reverse('pedidos:mas_pedidos')}?{parametros.urlencode()}"
+
+
+@login_required(login_url='/autenticacion/logear')
+def mas_pedidos(request):
+    """Siguiente página de la lista de pedidos para el scroll infinito"""
+    pedidos, siguiente = _pagina_pedidos(_pedidos_filtrados(request), request.GET.get('despues'))
+    context = {'pedidos': pedidos}
+    return JsonResponse({
+        'filas_movil': render_to_string('pedidos/includes/filas_pedidos_movil.html', context, request=request),
+        'filas': render_to_string('pedidos/includes/filas_pedidos.html', context, request=request),
+        'siguiente': _url_mas_pedidos(request, siguiente),
+    })
+
 @login_required(login_url='/autenticacion/logear')
 def detalle_pedido(request, pedido_id):
     # Obtener el pedido o devolver 404 si no existe
+    pedidos = Pedido.objects.select_related('cliente').con_detalles()
     if request.user.is_superuser:
-        pedido = get_object_or_404(Pedido, id=pedido_id)
+        pedido = get_object_or_404(pedidos, id=pedido_id)
     else:
-        pedido = get_object_or_404(Pedido, id=pedido_id, user=request.user)
+        pedido = get_object_or_404(pedidos, id=pedido_id, user=request.user)
 
     context = {
         'pedido': pedido,
-        'detalles': pedido.pedidodetalle_set.all().select_related('material'),
+        'detalles': pedido.pedidodetalle_set.all(),
         'cliente': pedido.cliente  # Now referencing cliente through relationship
     }
 
@@ -242,9 +247,7 @@ def eliminar_pedido(request, pedido_id):
 
         with transaction.atomic():
             # Restaurar stock si el pedido estaba pendiente
-            if pedido.estado == 'pendiente':
-                for detalle in pedido.pedidodetalle_set.all():
-                    detalle.material.actualizar_stock(detalle.cantidad)
+            pedido.liberar_stock()
 
             pedido.delete()
             return JsonResponse({
@@ -421,81 +424,65 @@ def editar_pedido(request, pedido_id):
 @login_required(login_url='/autenticacion/logear')
 def editar_detalle(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id) if request.user.is_superuser else get_object_or_404(Pedido, id=pedido_id, user=request.user)
-    detalles_antiguos = {detalle.material_id: detalle.cantidad for detalle in PedidoDetalle.objects.filter(pedido=pedido)}
 
     if request.method == 'POST':
         try:
-            articulos_ids = request.POST.getlist('articulo[]')
-            cantidades = request.POST.getlist('cantidad[]')
-            en_ofertas = request.POST.getlist('en_oferta[]')  # Obtener estados de oferta
-            precios_regulares = request.POST.getlist('precio_regular[]')  # Obtener precios regulares
-            precios_unitarios = request.POST.getlist('precio_unitario[]')  # Obtener precios unitarios
-
-            # 1. Devolver el stock de los artículos anteriores
-            for material_id, cantidad_antigua in detalles_antiguos.items():
-                material = Material.objects.get(id=material_id)
-                material.actualizar_stock(cantidad_antigua)
-
-            # 2. Procesar las nuevas cantidades
-            nuevos_detalles = []
-            total_pedido = 0
-
-            for i, (articulo_id, cantidad) in enumerate(zip(articulos_ids, cantidades)):
-                if articulo_id and cantidad and float(cantidad) > 0:
-                    material = Material.objects.get(id=articulo_id)
-                    nueva_cantidad = float(cantidad)
-
-                    # Verificar stock disponible
-                    if (material.cantidad < nueva_cantidad):
-                        # Restaurar estado original si falla
-                        for mat_id, cant in detalles_antiguos.items():
-                            mat = Material.objects.get(id=mat_id)
-                            mat.actualizar_stock(-cant)
-                        raise Exception(f"No hay suficiente stock de {material.nombre}")
-
-                    # Descontar nuevo stock
-                    if not material.actualizar_stock(-nueva_cantidad):
-                        raise Exception(f"Error al actualizar stock de {material.nombre}")
-
-                    # Crear nuevo detalle con la información de oferta
-                    precio_unitario = float(precios_unitarios[i])
-                    en_oferta = en_ofertas[i].lower() == 'true'
-                    precio_regular = float(precios_regulares[i])
-                    subtotal = precio_unitario * nueva_cantidad
-
-                    detalle = PedidoDetalle(
-                        pedido=pedido,
-                        material=material,
-                        cantidad=nueva_cantidad,
-                        user=request.user,
-                        precio_unitario=precio_unitario,
-                        en_oferta=en_oferta,
-                        precio_regular=precio_regular,
-                        total=subtotal
-                    )
-
-                    nuevos_detalles.append(detalle)
-                    total_pedido += subtotal
-
-            # 3. Actualizar la base de datos
-            PedidoDetalle.objects.filter(pedido=pedido).delete()
-            PedidoDetalle.objects.bulk_create(nuevos_detalles)
-
-            pedido.total = total_pedido
-            pedido.save()
+            lineas = _lineas_formulario(request.POST)
+            with transaction.atomic():
+                actualizar_lineas(pedido, lineas, request.user)
 
             messages.success(request, "Detalles del pedido actualizados correctamente")
             return redirect('pedidos:detalle_pedido', pedido_id=pedido.id)
 
+        except ValidationError as e:
+            messages.error(request, f"Error al actualizar el pedido: {' '.join(e.messages)}")
         except Exception as e:
             messages.error(request, f"Error al actualizar el pedido: {str(e)}")
 
     return render(request, 'pedidos/editar_detalle.html', {
         'pedido': pedido,
-        'detalles': PedidoDetalle.objects.filter(pedido=pedido),
-        'articulos': Material.objects.all()
+        'detalles': PedidoDetalle.objects.filter(pedido=pedido).order_by('id'),
+        # Solo los campos que usa el selector de artículos
+        'articulos': list(Material.objects.order_by('id').values(
+            'id', 'nombre', 'precio', 'en_oferta', 'precio_oferta'
+        ))
     })
 
+def _lineas_formulario(datos):
+    """
+    Líneas del formulario de edición con cantidad positiva, en el orden enviado
+    Raises:
+        ValidationError si las columnas no tienen el mismo número de filas o
+        alguna cantidad no es un número entero
+    """
+    columnas = [
+        datos.getlist('articulo[]'),
+        datos.getlist('cantidad[]'),
+        datos.getlist('precio_unitario[]'),
+        datos.getlist('en_oferta[]'),
+        datos.getlist('precio_regular[]'),
+    ]
+    if len({len(columna) for columna in columnas}) > 1:
+        raise ValidationError("El formulario llegó incompleto: las líneas no tienen todos sus campos")
+
+    lineas = []
+    for articulo_id, cantidad, precio_unitario, en_oferta, precio_regular in zip(*columnas):
+        if not articulo_id or not cantidad:
+            continue
+        try:
+            cantidad = int(cantidad)
+        except ValueError:
+            raise ValidationError(f"La cantidad debe ser un número entero: {cantidad}")
+        if cantidad > 0:
+            lineas.append({
+                'material_id': int(articulo_id),
+                'cantidad': cantidad,
+                'precio_unitario': float(precio_unitario),
+                'en_oferta': en_oferta.lower() == 'true',
+                'precio_regular': float(precio_regular),
+            })
+    return lineas
+
 @login_required(login_url='/autenticacion/logear')
 def efectuar_pedido(request, pedido_id):
     try:
@@ -514,17 +501,20 @@ def efectuar_pedido(request, pedido_id):
                 'message': 'Solo se pueden efectuar pedidos pendientes'
             })
 
-        with transaction.atomic():
-            # No necesitamos actualizar el stock porque ya se actualizó cuando se creó el pedido
-            pedido.estado = 'efectuado'
-            pedido.save()
-
+        # No necesitamos actualizar el stock porque ya se actualizó cuando se creó el pedido
+        if not pedido.efectuar():
+            # Se canceló mientras tanto (p. ej. el barrido de pendientes vencidos)
             return JsonResponse({
-                'status': 'success',
-                'message': 'Pedido efectuado correctamente',
-                'refresh': True
+                'status': 'warning',
+                'message': 'Solo se pueden efectuar pedidos pendientes'
             })
 
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Pedido efectuado correctamente',
+            'refresh': True
+        })
+
     except Exception as e:
         return JsonResponse({
             'status': 'error',
@@ -544,13 +534,8 @@ def cancelar_pedido(request, pedido_id):
             })
 
         with transaction.atomic():
-            # Devolver stock al inventario
-            for detalle in pedido.pedidodetalle_set.all():
-                detalle.material.actualizar_stock(detalle.cantidad)
-
-            # Actualizar estado del pedido
-            pedido.estado = 'cancelado'
-            pedido.save()
+            # Devolver stock al inventario y actualizar estado del pedido
+            pedido.cancelar()
 
             return JsonResponse({
                 'status': 'success',
@@ -586,13 +571,16 @@ def reactivar_pedido(request, pedido_id):
 
             total_pedido = 0
             detalles_nuevos = []
+            detalles_originales = pedido_original.pedidodetalle_set.select_related('material')
 
-            # Copiar los detalles del pedido original usando precios actuales
-            for detalle in pedido_original.pedidodetalle_set.all():
-                # Verificar stock disponible
-                if detalle.material.cantidad < detalle.cantidad:
-                    raise ValueError(f'No hay suficiente stock de {detalle.material.nombre}')
+            # Descontar el stock de todas las líneas de una vez
+            reservados, fallidos = Material.reservar_stock(pedido_original.cantidades_por_material())
+            if fallidos:
+                material = next(d.material for d in detalles_originales if d.material_id == fallidos[0])
+                raise ValueError(f'No hay suficiente stock de {material.nombre}')
 
+            # Copiar los detalles del pedido original usando precios actuales
+            for detalle in detalles_originales:
                 # Obtener el precio actual del material
                 precio_actual = detalle.material.precio_actual
                 subtotal = precio_actual * detalle.cantidad
@@ -606,24 +594,18 @@ def reactivar_pedido(request, pedido_id):
                     precio_unitario=precio_actual,
                     en_oferta=detalle.material.en_oferta,
                     precio_regular=detalle.material.precio,
+                    comision_unitaria=detalle.material.comision,
                     total=subtotal
                 )
 
                 detalles_nuevos.append(detalle_nuevo)
                 total_pedido += subtotal
 
-                # Actualizar stock
-                if not detalle.material.actualizar_stock(-detalle.cantidad):
-                    raise ValueError(f'Error al actualizar stock de {detalle.material.nombre}')
-
             # Guardar detalles y actualizar total
             PedidoDetalle.objects.bulk_create(detalles_nuevos)
             nuevo_pedido.total = total_pedido
             nuevo_pedido.save()
 
-            # Programar la cancelación automática del pedido reactivado
-            cancelar_pedido_no_efectuado(nuevo_pedido.id)
-
             return JsonResponse({
                 'status': 'success',
                 'message': 'Pedido reactivado como nuevo pedido con precios actualizados',
@@ -641,272 +623,56 @@ def reactivar_pedido(request, pedido_id):
             'message': f'Error al reactivar el pedido: {str(e)}'
         }, status=500)
 
-def generar_factura(request, pedido_id):
+def _respuesta_pdf(pedido, titulo, nombre):
+    """Dibuja el documento en un archivo temporal y lo envía por bloques con FileResponse"""
+    archivo = tempfile.TemporaryFile()
     try:
-        logger.info(f"Generando factura para el pedido {pedido_id}")
-        pedido = get_object_or_404(Pedido, id=pedido_id)
-        detalles = PedidoDetalle.objects.filter(pedido=pedido)
-
-        # Crear un buffer para el PDF
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-
-        # Buscar el logo en más ubicaciones posibles
-        possible_logo_paths = [
-            os.path.join(settings.STATIC_ROOT, 'img', 'logo.jpg'),
-            os.path.join(settings.STATIC_ROOT, 'img', 'logo.png'),
-            os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.jpg'),
-            os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.png'),
-            os.path.join(settings.BASE_DIR, 'staticfiles', 'img', 'logo.jpg'),
-            os.path.join(settings.BASE_DIR, 'staticfiles', 'img', 'logo.png'),
-            # Buscar en la carpeta media también
-            os.path.join(settings.MEDIA_ROOT, 'img', 'logo.jpg'),
-            os.path.join(settings.MEDIA_ROOT, 'img', 'logo.png'),
-        ]
-
-        # Intentar encontrar el logo e imprimir información de debug
-        logo_path = None
-        for path in possible_logo_paths:
-            if os.path.exists(path):
-                logo_path = path
-                logger.info(f"Logo encontrado en: {path}")
-                break
-            else:
-                logger.debug(f"Logo no encontrado en: {path}")
-
-        if logo_path:
-            try:
-                # Definir tamaño del logo aumentado un 40%
-                logo_width = 252  # 180 * 1.4
-                logo_height = 126 # 90 * 1.4
-                # Posicionar en esquina superior derecha con un poco más de margen
-                x_pos = width - logo_width - 40
-                y_pos = height - logo_height - 20
-
-                # Intentar dibujar el logo con manejo de errores
-                p.drawImage(logo_path, x_pos, y_pos,
-                           width=logo_width, height=logo_height,
-                           preserveAspectRatio=True,
-                           mask='auto')  # Añadido mask='auto' para mejor manejo de transparencias
-                logger.info(f"Logo dibujado exitosamente desde: {logo_path}")
-            except Exception as e:
-                logger.error(f"Error al dibujar el logo: {str(e)}")
-        else:
-            logger.warning("No se encontró el archivo del logo en ninguna ubicación")
-
-        # Encabezado
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(50, height - 50, "FACTURA")
-        p.setFont("Helvetica", 12)
-        p.drawString(50, height - 70, f"Código: {pedido.codigo_unico}")
-        p.drawString(50, height - 90, f"Fecha: {pedido.created_at.strftime('%d/%m/%Y %H:%M:%S')}")
-        p.drawString(50, height - 110, f"Gestor: {pedido.user.get_full_name()}")
-
-        # Datos del cliente
-        p.drawString(50, height - 140, "Cliente:")
-        p.drawString(70, height - 160, f"Nombre: {pedido.cliente.get_full_name()}")
-        p.drawString(70, height - 180, f"CI: {pedido.cliente.carnet_identidad}")
-        p.drawString(70, height - 200, f"Teléfono: {pedido.cliente.telefono}")
-        p.drawString(70, height - 220, f"Transportista: {pedido.transportista or 'No especificado'}")
-
-        # Tabla de productos
-        y = height - 260
-        p.drawString(50, y, "Producto")
-        p.drawString(200, y, "Código")
-        p.drawString(300, y, "Cantidad")
-        p.drawString(380, y, "Precio Unit.")
-        p.drawString(460, y, "Total")
-
-        y -= 20
-        for detalle in detalles:
-            nombre_producto = f"(*) {detalle.material.nombre}" if detalle.en_oferta else detalle.material.nombre
-            p.drawString(50, y, nombre_producto)
-            p.drawString(200, y, str(detalle.material.codigo or 'N/A'))
-            p.drawString(300, y, str(detalle.cantidad))
-
-            if detalle.en_oferta:
-                # Primero dibujamos el precio de oferta en rojo
-                p.setFont("Helvetica", 12)
-                p.setFillColorRGB(1, 0, 0)  # Rojo
-                p.drawString(380, y, f"${detalle.precio_unitario:.2f}")
-
-                # Luego dibujamos el precio regular tachado arriba
-                p.setFont("Helvetica", 8)  # Más pequeño
-                p.setFillColorRGB(0.5, 0.5, 0.5)  # Gris
-                precio_str = f"${detalle.precio_regular:.2f}"
-                precio_width = p.stringWidth(precio_str, "Helvetica", 8)
-
-                # Dibujar precio regular
-                p.drawString(380, y + 10, precio_str)
-                # Dibujar línea de tachado
-                p.line(380, y + 12, 380 + precio_width, y + 12)
-
-                # Volver a negro para el resto del texto
-                p.setFont("Helvetica", 12)
-                p.setFillColorRGB(0, 0, 0)
-            else:
-                p.drawString(380, y, f"${detalle.precio_unitario:.2f}")
-
-            p.drawString(460, y, f"${float(detalle.total):.2f}")
-            y -= 20
-
-        # Total
-        p.line(50, y-10, 500, y-10)
-        p.drawString(380, y-30, "Total:")
-        p.drawString(460, y-30, f"${float(pedido.total):.2f}")
-
-        p.showPage()
-        p.save()
-
-        # Obtener el valor del buffer y crear la respuesta HTTP
-        pdf = buffer.getvalue()
-        buffer.close()
-
-        # Crear respuesta HTTP con el PDF
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="factura_{pedido.codigo_unico}.pdf"'
-        response.write(pdf)
+        dibujar_documento(archivo, pedido, titulo)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return FileResponse(archivo, as_attachment=True, filename=nombre, content_type='application/pdf')
 
+def generar_factura(request, pedido_id):
+    try:
+        pedido = get_object_or_404(Pedido.objects.select_related('user', 'cliente'), id=pedido_id)
+        nombre = f"factura_{pedido.codigo_unico}.pdf"
+        if pedido.estado != 'efectuado':
+            # Los pedidos que aún pueden cambiar se generan en cada descarga
+            return _respuesta_pdf(pedido, "FACTURA", nombre)
+
+        # Los efectuados se cachean en disco por versión y el navegador puede revalidar
+        clave, modificado = version_factura(pedido)
+        etag = etag_factura(clave)
+        response = get_conditional_response(request, etag=etag, last_modified=int(modificado.timestamp()))
+        if response is None:
+            response = FileResponse(factura_en_disco(pedido, clave), as_attachment=True,
+                                    filename=nombre, content_type='application/pdf')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modificado.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
         return response
 
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error generando factura para pedido {pedido_id}: {str(e)}")
         return HttpResponse("Error generando la factura", status=500)
 
 def generar_oferta(request, pedido_id):
     try:
-        pedido = get_object_or_404(Pedido, id=pedido_id)
-        detalles = PedidoDetalle.objects.filter(pedido=pedido)
-
-        # Crear un buffer para el PDF
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-
-        # Buscar el logo en más ubicaciones posibles
-        possible_logo_paths = [
-            os.path.join(settings.STATIC_ROOT, 'img', 'logo.jpg'),
-            os.path.join(settings.STATIC_ROOT, 'img', 'logo.png'),
-            os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.jpg'),
-            os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.png'),
-            os.path.join(settings.BASE_DIR, 'staticfiles', 'img', 'logo.jpg'),
-            os.path.join(settings.BASE_DIR, 'staticfiles', 'img', 'logo.png'),
-            # Buscar en la carpeta media también
-            os.path.join(settings.MEDIA_ROOT, 'img', 'logo.jpg'),
-            os.path.join(settings.MEDIA_ROOT, 'img', 'logo.png'),
-        ]
-
-        # Intentar encontrar el logo e imprimir información de debug
-        logo_path = None
-        for path in possible_logo_paths:
-            if os.path.exists(path):
-                logo_path = path
-                logger.info(f"Logo encontrado en: {path}")
-                break
-            else:
-                logger.debug(f"Logo no encontrado en: {path}")
-
-        if logo_path:
-            try:
-                # Definir tamaño del logo aumentado un 40%
-                logo_width = 252  # 180 * 1.4
-                logo_height = 126 # 90 * 1.4
-                # Posicionar en esquina superior derecha con un poco más de margen
-                x_pos = width - logo_width - 40
-                y_pos = height - logo_height - 20
-
-                # Intentar dibujar el logo con manejo de errores
-                p.drawImage(logo_path, x_pos, y_pos,
-                           width=logo_width, height=logo_height,
-                           preserveAspectRatio=True,
-                           mask='auto')  # Añadido mask='auto' para mejor manejo de transparencias
-                logger.info(f"Logo dibujado exitosamente desde: {logo_path}")
-            except Exception as e:
-                logger.error(f"Error al dibujar el logo: {str(e)}")
-        else:
-            logger.warning("No se encontró el archivo del logo en ninguna ubicación")
-
-        # Encabezado
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(50, height - 50, "OFERTA")
-        p.setFont("Helvetica", 12)
-        p.drawString(50, height - 70, f"Código: {pedido.codigo_unico}")
-        p.drawString(50, height - 90, f"Fecha: {pedido.created_at.strftime('%d/%m/%Y %H:%M:%S')}")
-        p.drawString(50, height - 110, f"Gestor: {pedido.user.get_full_name()}")
-
-        # Datos del cliente
-        p.drawString(50, height - 140, "Cliente:")
-        p.drawString(70, height - 160, f"Nombre: {pedido.cliente.get_full_name()}")
-        p.drawString(70, height - 180, f"CI: {pedido.cliente.carnet_identidad}")
-        p.drawString(70, height - 200, f"Teléfono: {pedido.cliente.telefono}")
-        p.drawString(70, height - 220, f"Transportista: {pedido.transportista or 'No especificado'}")
-
-        # Tabla de productos
-        y = height - 260
-        p.drawString(50, y, "Producto")
-        p.drawString(200, y, "Código")
-        p.drawString(300, y, "Cantidad")
-        p.drawString(380, y, "Precio Unit.")
-        p.drawString(460, y, "Total")
-
-        y -= 20
-        for detalle in detalles:
-            nombre_producto = f"(*) {detalle.material.nombre}" if detalle.en_oferta else detalle.material.nombre
-            p.drawString(50, y, nombre_producto)
-            p.drawString(200, y, str(detalle.material.codigo or 'N/A'))
-            p.drawString(300, y, str(detalle.cantidad))
-
-            if detalle.en_oferta:
-                # Primero dibujamos el precio de oferta en rojo
-                p.setFont("Helvetica", 12)
-                p.setFillColorRGB(1, 0, 0)  # Rojo
-                p.drawString(380, y, f"${detalle.precio_unitario:.2f}")
-
-                # Luego dibujamos el precio regular tachado arriba
-                p.setFont("Helvetica", 8)  # Más pequeño
-                p.setFillColorRGB(0.5, 0.5, 0.5)  # Gris
-                precio_str = f"${detalle.precio_regular:.2f}"
-                precio_width = p.stringWidth(precio_str, "Helvetica", 8)
-
-                # Dibujar precio regular
-                p.drawString(380, y + 10, precio_str)
-                # Dibujar línea de tachado
-                p.line(380, y + 12, 380 + precio_width, y + 12)
-
-                # Volver a negro para el resto del texto
-                p.setFont("Helvetica", 12)
-                p.setFillColorRGB(0, 0, 0)
-            else:
-                p.drawString(380, y, f"${detalle.precio_unitario:.2f}")
-
-            p.drawString(460, y, f"${float(detalle.total):.2f}")
-            y -= 20
-
-        # Total
-        p.line(50, y-10, 500, y-10)
-        p.drawString(380, y-30, "Total:")
-        p.drawString(460, y-30, f"${float(pedido.total):.2f}")
-
-        p.showPage()
-        p.save()
-
-        # Obtener el valor del buffer y crear la respuesta HTTP
-        pdf = buffer.getvalue()
-        buffer.close()
-
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="oferta_{pedido.codigo_unico}.pdf"'
-        response.write(pdf)
-
-        return response
+        pedido = get_object_or_404(Pedido.objects.select_related('user', 'cliente'), id=pedido_id)
+        return _respuesta_pdf(pedido, "OFERTA", f"oferta_{pedido.codigo_unico}.pdf")
 
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error generando oferta para pedido {pedido_id}: {str(e)}")
         return HttpResponse("Error generando la oferta", status=500)
 
 @login_required
-@user_passes_test(lambda u: u.is_superuser)
+@superuser_required
 def configurar_eliminacion(request):
     config = ConfiguracionPedidos.objects.first() or ConfiguracionPedidos()
 
@@ -924,13 +690,11 @@ def configurar_eliminacion(request):
 
             # Si la configuración está activa, cancelar pedidos antiguos inmediatamente
             if activo:
-                from .task import cancelar_pedidos_antiguos
-                resultado = cancelar_pedidos_antiguos()
-                if "Se cancelaron" in resultado:
-                    messages.success(request, f"Configuración actualizada y {resultado.lower()}")
+                metricas = cancelar_pedidos_vencidos()
+                if metricas['cancelados']:
+                    messages.success(request, f"Configuración actualizada y se cancelaron {metricas['cancelados']} pedidos antiguos")
                 else:
                     messages.success(request, "Configuración actualizada correctamente")
-                    messages.info(request, resultado)
             else:
                 messages.success(request, "Configuración actualizada correctamente")
 
@@ -940,7 +704,8 @@ def configurar_eliminacion(request):
             messages.error(request, f"Error al actualizar la configuración: {str(e)}")
 
     return render(request, 'pedidos/configurar_eliminacion.html', {
-        'config': config
+        'config': config,
+        'barrido': estadisticas_barrido()
     })
 
 @login_required
@@ -967,14 +732,12 @@ def estadisticas_usuario(request):
         total_ventas = pedidos_efectuados.aggregate(
             total=Sum('total'))['total'] or 0
 
-        total_comisiones = pedidos_efectuados.annotate(
-            comision=Sum(F('pedidodetalle__material__comision') *
-                       F('pedidodetalle__cantidad'))
-        ).aggregate(total=Sum('comision'))['total'] or 0
+        total_comisiones = pedidos_efectuados.con_comision().aggregate(
+            total=Sum('comision_anotada'))['total'] or 0
 
         context = {
             'usuario': request.user,
-            'pedidos': pedidos.order_by('-created_at'),
+            'pedidos': pedidos.select_related('cliente').con_comision().order_by('-created_at'),
             'pedidos_count': pedidos.count(),
             'total_ventas': total_ventas,
             'total_comisiones': total_comisiones,